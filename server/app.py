@@ -12,22 +12,42 @@ Questo server Flask gestisce:
 import os
 import sys
 import json
+import gzip
+import hashlib
+import queue
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, render_template, send_from_directory, request
+from flask import Flask, jsonify, render_template, send_from_directory, send_file, request, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 import logging
 import random
+import time
 from db_manager import db_manager  # Importa il gestore DB con registry e feature store
-import joblib
+from model_cache import model_cache
 import subprocess
 
 # Aggiungi la directory parent al path per importare il modulo prophet_model
 sys.path.append(os.path.join(os.path.dirname(__file__), 'models'))
-from models.prophet_model import ProphetModel
+# ProphetModel e GeoProphetModel sono importati nelle route che li usano: prophet e Stan
+# vengono caricati solo al primo fit (vedi models.fit_cache.fit_prophet)
+from models.compact_prophet import INTERVAL_MODES, DEFAULT_INTERVAL_MODE
+from models.fit_cache import MODEL_VERSION, fit_cache
 
 # Importa l'utilità per l'elaborazione dei dati
-from data_utils import CovidDataProcessor
+from data_utils import (CovidDataProcessor, get_processor, get_area_snapshot, snapshot_cache,
+                        get_area_history, area_history_cache, area_changed_since)
+from result_cache import ResultCache
+from forecast_batch import parse_items, run_batch, forecast_cache
+from update_bus import update_bus
+from warmup import warmup, WARMUP_ENABLED, WARMUP_COUNTRIES, warm_registered_models
+from metrics import metrics
+import request_timing
+from request_timing import profiler
+from downsampling import downsample_records, downsample_cache, MAX_POINTS_LIMIT
+from rollup_pipeline import GRANULARITIES
 
 # Configura il logger
 logging.basicConfig(level=logging.INFO, 
@@ -39,6 +59,28 @@ app = Flask(__name__,
             template_folder='../templates',
             static_folder='../static')
 
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Provider JSON di Flask che misura la serializzazione come span 'serialize'"""
+
+    def dumps(self, obj, **kwargs):
+        with request_timing.span('serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+app.json = TimedJSONProvider(app)
+
+# Segreto degli endpoint /admin (anche per attivare la profilazione con l'header X-Apollo-Profile).
+# Senza APOLLO_ADMIN_SECRET gli endpoint /admin e la profilazione sono disattivati.
+ADMIN_SECRET = os.environ.get('APOLLO_ADMIN_SECRET') or None
+
+def _is_admin_request():
+    """Segreto admin nell'header X-Admin-Secret o nel form POST (mai nella query string, finirebbe nei log)"""
+    if ADMIN_SECRET is None:
+        return False
+    secret = request.headers.get('X-Admin-Secret') or request.form.get('secret')
+    return secret == ADMIN_SECRET
+
 # === HANDLER GLOBALE ERRORI ===
 @app.errorhandler(400)
 def bad_request(e):
@@ -52,6 +94,60 @@ def not_found(e):
 def internal_error(e):
     return jsonify({'success': False, 'error': 'Internal Server Error', 'details': str(e)}), 500
 
+# === METRICHE DELLE RICHIESTE ===
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    request_timing.start_request()
+    # Profilazione su richiesta (header con il segreto admin) o a campione, solo con il segreto configurato
+    if ADMIN_SECRET is not None and profiler.should_profile(request.headers.get('X-Apollo-Profile') == ADMIN_SECRET):
+        g.profile = profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    """Latenza e codice di stato per route (il pattern, non l'URL, per non moltiplicare le serie)"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('apollo_http_request_duration_seconds', time.perf_counter() - start,
+                        route=route, method=request.method)
+        metrics.inc('apollo_http_requests_total', route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.after_request
+def add_server_timing(response):
+    """Header Server-Timing, log JSON degli span e salvataggio dell'eventuale profilo"""
+    profile_id = None
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile_id = profiler.stop(profile, method=request.method, path=request.full_path.rstrip('?'),
+                                   status=response.status_code)
+        response.headers['X-Apollo-Profile-Id'] = profile_id
+    timing = request_timing.end_request()
+    if timing is not None:
+        response.headers['Server-Timing'] = timing.server_timing()
+        request_timing.log_request(timing, request.method, request.path, response.status_code, profile_id)
+    return response
+
+@app.teardown_request
+def cleanup_request_timing(exc):
+    # Con un'eccezione non gestita after_request non viene eseguito: il profiler va comunque fermato
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+    request_timing.end_request()
+
+# Statistiche delle cache esportate come gauge a ogni lettura di /metrics
+metrics.register_collector('apollo_model_cache', model_cache.stats)
+metrics.register_collector('apollo_fit_cache', fit_cache.stats)
+metrics.register_collector('apollo_downsample_cache', downsample_cache.stats)
+metrics.register_collector('apollo_snapshot_cache', snapshot_cache.stats)
+metrics.register_collector('apollo_area_history_cache', area_history_cache.stats)
+metrics.register_collector('apollo_forecast_cache', forecast_cache.stats)
+# Lo scrittore A/B test viene creato al primo risultato: prima non ci sono statistiche
+metrics.register_collector('apollo_ab_writer',
+                           lambda: db_manager.ab_test_writer.stats() if db_manager.ab_test_writer else {})
+
 # Percorsi file
 DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dpc-covid19-ita-andamento-nazionale.csv')
 FORECAST_PATH = os.path.join(app.static_folder, 'data/forecast_data.json')
@@ -64,6 +160,8 @@ covid_processor = CovidDataProcessor(country_code="ITA")
 
 # Parametri di training
 TRAIN_DAYS = 300
+# Righe massime per pagina di /api/data/historical
+HISTORICAL_MAX_LIMIT = 5000
 FUTURE_DAYS = 30
 COLUMN = 'nuovi_positivi'
 
@@ -75,10 +173,55 @@ data_cache = {
     'globe': None
 }
 
+def _parse_intervals_param():
+    """Legge il parametro intervals (none|fast|full); restituisce None se non valido"""
+    intervals = request.args.get('intervals', DEFAULT_INTERVAL_MODE).lower()
+    return intervals if intervals in INTERVAL_MODES else None
+
+INTERVALS_ERROR = f"Parametro intervals non valido. Valori ammessi: {', '.join(INTERVAL_MODES)}"
+
+def _parse_max_points_param():
+    """Legge max_points (3-MAX_POINTS_LIMIT); restituisce (valore, None) o (None, risposta 400)"""
+    value = request.args.get('max_points')
+    if value is None:
+        return None, None
+    if not value.isdigit() or not 3 <= int(value) <= MAX_POINTS_LIMIT:
+        return None, (jsonify({'success': False,
+                               'error': f'Parametro max_points non valido (3-{MAX_POINTS_LIMIT})'}), 400)
+    return int(value), None
+
+# Lunghezza massima di un token di versione accettato da since=
+SINCE_TOKEN_MAX_LENGTH = 64
+
+def _parse_since_param():
+    """
+    Legge since= (sincronizzazione incrementale): una data YYYY-MM-DD (il client ha le righe fino a
+    quel giorno) oppure il token 'version' di una risposta precedente (righe aggiunte o corrette).
+    Restituisce (valore, None) o (None, risposta 400); il valore è un datetime o una stringa.
+    """
+    value = request.args.get('since')
+    if not value:
+        return None, None
+    if len(value) == 10:
+        try:
+            return datetime.strptime(value, '%Y-%m-%d'), None
+        except ValueError:
+            pass
+    if len(value) > SINCE_TOKEN_MAX_LENGTH:
+        return None, (jsonify({'success': False,
+                               'error': 'Parametro since non valido: usare una data YYYY-MM-DD o un token version'}), 400)
+    return value, None
+
+def _since_fields(since, full):
+    """Campi di risposta della sincronizzazione incrementale"""
+    if since is None:
+        return {}
+    return {'since': since.strftime('%Y-%m-%d') if isinstance(since, datetime) else since, 'full': full}
+
 @app.route('/')
 def index():
     """Pagina principale dell'applicazione"""
-    return render_template('index.html')
+    return render_template('index.html', updates_stream=UPDATES_STREAM_ENABLED)
 
 @app.route('/previsioni')
 def previsioni():
@@ -102,44 +245,82 @@ def landing():
 
 @app.route('/api/data/historical')
 def get_historical_data():
-    """API: Restituisce SOLO i dati storici usati per l'addestramento Prophet (train set), con NaN -> None e data in formato YYYY-MM-DD. Ora supporta parametro country."""
-    from flask import request
-    import numpy as np
+    """
+    API: Restituisce i dati storici nazionali con data in formato YYYY-MM-DD e NaN -> None.
+
+    Senza start/end restituisce i dati usati per l'addestramento Prophet (prime TRAIN_DAYS righe).
+    Parametri opzionali:
+    - start, end: intervallo di date incluso (YYYY-MM-DD), applicato con ricerca binaria sulla data
+    - fields: colonne separate da virgola ('data' è sempre inclusa)
+    - limit: righe massime per pagina (max HISTORICAL_MAX_LIMIT)
+    - cursor: valore next_cursor della risposta precedente per la pagina successiva
+    - max_points: riduzione LTTB ad al più max_points righe (per i grafici)
+    - since: data o token 'version' già in possesso del client: solo le righe aggiunte o corrette
+    """
     country = request.args.get('country', 'ITA').upper()
     # Validazione country: solo 3 lettere maiuscole
     if not country.isalpha() or len(country) != 3:
         logger.warning(f"[API] Parametro country non valido: {country}")
         return jsonify({'success': False, 'error': 'Parametro country non valido. Deve essere un codice ISO 3 lettere.'}), 400
+    try:
+        start = _parse_date_param('start')
+        end = _parse_date_param('end')
+        cursor = _parse_date_param('cursor')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parametri start, end e cursor devono essere date YYYY-MM-DD'}), 400
+    limit = request.args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= HISTORICAL_MAX_LIMIT:
+            return jsonify({'success': False,
+                            'error': f'Parametro limit non valido (1-{HISTORICAL_MAX_LIMIT})'}), 400
+        limit = int(limit)
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+    max_points, error = _parse_max_points_param()
+    if error:
+        return error
+    since, error = _parse_since_param()
+    if error:
+        return error
     try:
         logger.info(f"[API] Richiesta dati storici per paese: {country}")
-        processor = CovidDataProcessor(country_code=country)
-        if not processor.load_data() or processor.national_data is None:
+        processor = get_processor(country)
+        if processor is None:
             logger.error(f"[API] Dati non disponibili per {country}")
             return jsonify({'success': False, 'error': f'Dati non disponibili per {country}'}), 404
-        df = processor.national_data.copy()
-        df = df.sort_values('data')
-        df = df.iloc[:TRAIN_DAYS]
-        # Forza la colonna data nel formato YYYY-MM-DD
-        df['data'] = pd.to_datetime(df['data']).dt.strftime('%Y-%m-%d')
-        # Sostituisci tutti i NaN (anche stringhe) con None
-        data = []
-        for row in df.to_dict(orient='records'):
-            clean_row = {}
-            for k, v in row.items():
-                if isinstance(v, float) and (np.isnan(v) or v == float('nan')):
-                    clean_row[k] = None
-                elif isinstance(v, str) and v.lower() == 'nan':
-                    clean_row[k] = None
-                else:
-                    clean_row[k] = v
-            data.append(clean_row)
+        if fields:
+            unknown = [f for f in fields if f not in processor.national_data.columns]
+            if unknown:
+                return jsonify({'success': False, 'error': f"Campi non disponibili: {', '.join(unknown)}"}), 400
+        version = str(processor.version)
+        first, full = processor.changed_since(since) if since is not None else (None, True)
+        if not full and first is None:
+            # Nessuna modifica: risposta di poche centinaia di byte
+            return jsonify({'success': True, 'data': [], 'country': country, 'total': 0,
+                            'next_cursor': None, 'version': version, **_since_fields(since, full)})
+        data, next_cursor, total = processor.get_history(
+            start=start.replace(tzinfo=None) if start else None,
+            end=end.replace(tzinfo=None) if end else None,
+            fields=fields,
+            cursor=cursor.replace(tzinfo=None) if cursor else None,
+            limit=limit,
+            default_rows=TRAIN_DAYS,
+            max_points=max_points,
+            since=first
+        )
         logger.info(f"[API] Dati storici puliti: {len(data)} record restituiti per {country}.")
-        return jsonify({'success': True, 'data': data, 'country': country})
+        return jsonify({'success': True, 'data': data, 'country': country,
+                        'total': total, 'next_cursor': next_cursor, 'version': version,
+                        **_since_fields(since, full)})
     except Exception as e:
         import traceback
         logger.error(f"Errore nel caricamento dei dati storici per {country}: {e}\n{traceback.format_exc()}")
         return jsonify({'success': False, 'error': str(e), 'country': country}), 500
 
+def _without_nan(records):
+    """Righe per le API con NaN sostituiti da None"""
+    df = pd.DataFrame(records)
+    return df.astype(object).where(pd.notnull(df), None).to_dict(orient='records')
+
 @app.route('/api/data/forecast')
 def get_forecast_data():
     """API: Restituisce SOLO le previsioni future generate dal modello Prophet. Ora supporta parametro country."""
@@ -149,16 +330,20 @@ def get_forecast_data():
     if not country.isalpha() or len(country) != 3:
         logger.warning(f"[API] Parametro country non valido: {country}")
         return jsonify({'success': False, 'error': 'Parametro country non valido. Deve essere un codice ISO 3 lettere.', 'country': country}), 400
+    intervals = _parse_intervals_param()
+    if intervals is None:
+        return jsonify({'success': False, 'error': INTERVALS_ERROR, 'country': country}), 400
     try:
         logger.info(f"[API] Richiesta forecast per paese: {country}")
-        processor = CovidDataProcessor(country_code=country)
-        if not processor.load_data() or processor.national_data is None:
+        processor = get_processor(country)
+        if processor is None:
             logger.error(f"[API] Dati non disponibili per {country}")
             return jsonify({'success': False, 'error': f'Dati non disponibili per {country}', 'country': country}), 404
         # Crea un nuovo ProphetModel per il paese richiesto
         try:
+            from models.prophet_model import ProphetModel
             model = ProphetModel(processor.national_file, columns=['nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi'], train_days=TRAIN_DAYS)
-            forecast_data = model.forecast(days=FUTURE_DAYS)
+            forecast_data = model.forecast(days=FUTURE_DAYS, intervals=intervals)
             if not isinstance(forecast_data, list):
                 logger.error(f"[ERRORE] forecast_data non è una lista ma: {type(forecast_data)}. Valore: {forecast_data}")
                 forecast_data = []
@@ -178,19 +363,30 @@ def get_forecast_data():
 
 @app.route('/api/data/latest')
 def get_latest_data():
-    """API: Restituisce i dati più recenti degli ultimi 30 giorni. Ora supporta parametro country."""
+    """
+    API: Restituisce i dati più recenti degli ultimi 30 giorni. Ora supporta parametro country.
+    Con since (data o token 'version') restituisce solo le righe aggiunte o corrette.
+    """
     from flask import request
     country = request.args.get('country', 'ITA').upper()
     # Validazione country: solo 3 lettere maiuscole
     if not country.isalpha() or len(country) != 3:
         logger.warning(f"[API] Parametro country non valido: {country}")
         return jsonify({'success': False, 'error': 'Parametro country non valido. Deve essere un codice ISO 3 lettere.', 'country': country}), 400
+    since, error = _parse_since_param()
+    if error:
+        return error
     try:
         logger.info(f"[API] Richiesta dati recenti per paese: {country}")
-        processor = CovidDataProcessor(country_code=country)
-        if not processor.load_data() or processor.national_data is None:
+        processor = get_processor(country)
+        if processor is None:
             logger.error(f"[API] Dati non disponibili per {country}")
             return jsonify({'success': False, 'error': f'Dati non disponibili per {country}', 'country': country}), 404
+        version = str(processor.version)
+        first, full = processor.changed_since(since) if since is not None else (None, True)
+        if not full and first is None:
+            return jsonify({'success': True, 'data': [], 'country': country, 'version': version,
+                            **_since_fields(since, full)})
         # Ottieni gli ultimi 30 giorni di dati
         latest_data = processor.get_latest_data(30)
         if not latest_data:
@@ -199,14 +395,15 @@ def get_latest_data():
                 'error': f"Dati recenti non disponibili per {country}",
                 'country': country
             }), 404
-        # Sostituisci NaN con None
-        df = pd.DataFrame(latest_data)
-        df = df.where(pd.notnull(df), None)
-        latest_data = df.to_dict(orient='records')
+        if first is not None:
+            latest_data = [row for row in latest_data if row['data'] >= first]
+        latest_data = _without_nan(latest_data) if latest_data else []
         return jsonify({
             'success': True,
             'data': latest_data,
-            'country': country
+            'country': country,
+            'version': version,
+            **_since_fields(since, full)
         })
     except Exception as e:
         logger.error(f"Errore nel caricamento dei dati recenti per {country}: {e}")
@@ -230,13 +427,8 @@ def get_globe_data():
     try:
         logger.info("[API] Richiesta dati globo 3D")
         # Usa la funzione multi-paese
-        processor = CovidDataProcessor(country_code="ITA")
-        globe_data = processor.get_world_data()
-        # Sostituisci NaN con None
-        import pandas as pd
-        df = pd.DataFrame(globe_data)
-        df = df.where(pd.notnull(df), None)
-        globe_data = df.to_dict(orient='records')
+        processor = get_processor("ITA")
+        globe_data = _without_nan(processor.get_world_data() if processor is not None else [])
         data_cache['globe'] = globe_data
         return jsonify({
             'success': True,
@@ -278,6 +470,35 @@ def get_model_stats():
             'error': str(e)
         }), 500
 
+def _backtest_mape(country, indicator, days):
+    """
+    Risposta di /api/model/mape dai risultati di backtesting; None se non disponibili o se non
+    descrivono il modello servito (il cutoff più recente deve essere l'ultimo giorno delle
+    TRAIN_DAYS righe di addestramento di ProphetModel)
+    """
+    try:
+        backtest = db_manager.get_backtest_results('national', country, indicator, MODEL_VERSION, horizon=days)
+    except Exception as ex:
+        logger.warning(f"[MAPE] Lettura dei risultati di backtesting fallita: {ex}")
+        return None
+    if not backtest or backtest[0].get('mape') is None:
+        return None
+    result = backtest[0]
+    processor = get_processor(country)
+    if processor is None or processor.national_data.empty:
+        return None
+    train_end = processor.national_data['data'].iloc[min(TRAIN_DAYS, len(processor.national_data)) - 1]
+    if (result.get('cutoffs') or [None])[-1] != train_end.strftime('%Y-%m-%d'):
+        logger.info(f"[MAPE] Backtesting di {country} - {indicator} non relativo al modello servito, ignorato")
+        return None
+    response = {'success': True, 'mape': round(result['mape'], 2), 'mae': result.get('mae'),
+                'horizon': days, 'source': 'backtest', 'cutoffs': result['cutoffs'],
+                'model_version': MODEL_VERSION, 'country': country}
+    # La copertura ha senso solo per le bande campionate del modello, non per l'approssimazione 'fast'
+    if result.get('coverage_intervals') == 'full':
+        response['coverage'] = result.get('coverage')
+    return response
+
 @app.route('/api/model/mape')
 def api_mape():
     """
@@ -302,12 +523,16 @@ def api_mape():
     except Exception:
         logger.warning(f"[MAPE] Parametro days non valido: {days_raw}")
         return jsonify({'success': False, 'error': 'Parametro days deve essere un intero positivo'}), 400
+    # Accuratezza precalcolata dal backtesting (lettura indicizzata, nessun fit nella richiesta)
+    backtest = _backtest_mape(country, indicator, days)
+    if backtest:
+        return jsonify(backtest)
+    # In assenza di backtesting: MAPE in-sample sugli ultimi giorni della finestra di addestramento
     try:
         from models.prophet_model import ProphetModel
-        from data_utils import CovidDataProcessor
         logger.info(f"[MAPE] Carico dati per {country}")
-        processor = CovidDataProcessor(country_code=country)
-        if not processor.load_data() or processor.national_data is None:
+        processor = get_processor(country)
+        if processor is None:
             logger.error(f"[MAPE] Dati non disponibili per {country}")
             return jsonify({'success': False, 'error': f'Dati non disponibili per {country}', 'country': country}), 404
         logger.info(f"[MAPE] Creo ProphetModel per {country}")
@@ -318,12 +543,122 @@ def api_mape():
             logger.warning(f"[MAPE] MAPE non disponibile per {country}")
             return jsonify({'success': False, 'error': f'MAPE non disponibile per {country}', 'country': country}), 404
         logger.info(f"[MAPE] Valore MAPE calcolato: {mape}")
-        return jsonify({'success': True, 'mape': mape, 'country': country})
+        return jsonify({'success': True, 'mape': mape, 'source': 'in_sample', 'country': country})
     except Exception as ex:
         logger.error(f"[MAPE] Errore interno: {ex}", exc_info=True)
         return jsonify({'success': False, 'error': f'Errore interno: {str(ex)}', 'country': country}), 500
 
 
+@app.route('/api/model/backtest')
+def api_backtest():
+    """API: restituisce l'accuratezza per orizzonte (MAPE, MAE, copertura) calcolata dal backtesting"""
+    area_type = request.args.get('area_type', 'national')
+    area_name = request.args.get('area_name', 'ITA')
+    indicator = request.args.get('indicator', 'nuovi_positivi')
+    results = db_manager.get_backtest_results(area_type, area_name, indicator, MODEL_VERSION)
+    if not results:
+        return jsonify({'success': False, 'error': 'Nessun risultato di backtesting disponibile'}), 404
+    for r in results:
+        if 'updated_at' in r:
+            r['updated_at'] = r['updated_at'].isoformat()
+    return jsonify({'success': True, 'model_version': MODEL_VERSION, 'results': results})
+
+
+# === DASHBOARD: tutti i dati della pagina principale in una risposta ===
+FORECAST_COLUMNS = ['nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi']
+DASHBOARD_MAPE_DAYS = 7
+# Thread per le parti indipendenti della dashboard (condivisi da tutte le richieste)
+_dashboard_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('DASHBOARD_WORKERS', 4)),
+                                         thread_name_prefix='apollo-dashboard')
+# Risposte complete (ETag, corpo, corpo gzip) per paese, parametri e versione dei dati
+dashboard_cache = ResultCache(max_entries=int(os.environ.get('DASHBOARD_CACHE_ENTRIES', 32)))
+metrics.register_collector('apollo_dashboard_cache', dashboard_cache.stats)
+
+
+def _build_dashboard(processor, country, intervals, indicator):
+    """
+    Parti della dashboard calcolate da un solo dataset e un solo ProphetModel: previsione e
+    MAPE in parallelo (condividono i fit del modello). Il modello usa il DataFrame già
+    caricato dal processor, senza rileggere il CSV. Ultimi dati e globo non ne fanno parte:
+    il client li ricava dalla serie storica e dalle previsioni.
+    """
+    from models.prophet_model import ProphetModel
+    model = ProphetModel(processor.national_file, columns=FORECAST_COLUMNS, train_days=TRAIN_DAYS,
+                         data=processor.national_data)
+
+    def forecast():
+        return {'success': True, 'data': model.forecast(days=FUTURE_DAYS, intervals=intervals)}
+
+    def mape():
+        backtest = _backtest_mape(country, indicator, DASHBOARD_MAPE_DAYS)
+        if backtest:
+            return backtest
+        value = model.get_mape(indicator=indicator, days=DASHBOARD_MAPE_DAYS)
+        if value is None:
+            return {'success': False, 'error': f'MAPE non disponibile per {country}'}
+        return {'success': True, 'mape': value, 'source': 'in_sample', 'country': country}
+
+    # Ogni parte gira con una copia del contesto: gli span finiscono nella richiesta corrente
+    futures = {name: _dashboard_executor.submit(contextvars.copy_context().run, part)
+               for name, part in (('forecast', forecast), ('mape', mape))}
+    parts = {}
+    for name, future in futures.items():
+        try:
+            parts[name] = future.result()
+        except Exception as e:
+            logger.error(f"[Dashboard] Errore nella parte {name} per {country}: {e}")
+            parts[name] = {'success': False, 'error': str(e)}
+    parts['model_stats'] = {'success': True, 'data': model.get_model_stats()}
+    return parts
+
+
+@app.route('/api/dashboard')
+def get_dashboard():
+    """
+    API: Dati della pagina principale in una sola risposta (forecast, model_stats, mape,
+    ciascuno nel formato del rispettivo endpoint).
+
+    La risposta è in cache per paese, intervals, indicator e versione dei dati, con un ETag
+    (If-None-Match -> 304) e compressione gzip se accettata dal client.
+    """
+    country = request.args.get('country', 'ITA').upper()
+    if not country.isalpha() or len(country) != 3:
+        return jsonify({'success': False, 'error': 'Parametro country non valido. Deve essere un codice ISO 3 lettere.', 'country': country}), 400
+    intervals = _parse_intervals_param()
+    if intervals is None:
+        return jsonify({'success': False, 'error': INTERVALS_ERROR, 'country': country}), 400
+    indicator = request.args.get('indicator', 'nuovi_positivi')
+    if indicator not in FORECAST_COLUMNS:
+        return jsonify({'success': False, 'error': f"Indicatore non valido. Valori ammessi: {', '.join(FORECAST_COLUMNS)}"}), 400
+    processor = get_processor(country)
+    if processor is None:
+        return jsonify({'success': False, 'error': f'Dati non disponibili per {country}', 'country': country}), 404
+
+    key = (country, intervals, indicator, processor.version, db_manager.get_data_version('national'))
+    entry = dashboard_cache.get(key)
+    if entry is None:
+        parts = _build_dashboard(processor, country, intervals, indicator)
+        body = app.json.dumps(dict(parts, success=True, country=country)).encode('utf-8')
+        entry = (hashlib.sha1(body).hexdigest(), body, gzip.compress(body, compresslevel=6))
+        # Le risposte con parti fallite vengono ricalcolate alla richiesta successiva
+        if all(part.get('success') for part in parts.values()):
+            dashboard_cache.put(key, entry)
+            update_bus.publish('forecast', area_type='national', area_name=country, version=str(processor.version))
+    etag, body, compressed = entry
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif request.accept_encodings.quality('gzip') > 0:
+        response = Response(compressed, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 # NOTA: Tutti gli endpoint che accettano parametri via query string devono implementare validazione robusta degli input.
 # Attualmente, /api/model/mape è l'unico endpoint che richiede questa validazione. Estendere questa logica a futuri endpoint parametrizzati.
 
@@ -456,9 +791,54 @@ def serve_static(path):
     return send_from_directory(app.static_folder, path)
 
 # Endpoint per dati regionali
+GRANULARITY_ERROR = f"Parametro granularity non valido. Valori ammessi: daily, {', '.join(GRANULARITIES)}"
+
+def _rollup_response(area_type, area_name, granularity, name_key):
+    """Risposta con i rollup settimanali/mensili di un'area (start, end e fields opzionali)"""
+    try:
+        start = _parse_date_param('start')
+        end = _parse_date_param('end')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parametri start ed end devono essere date YYYY-MM-DD'}), 400
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+    rollups = db_manager.get_rollups(area_type, granularity, area_name, start_date=start, end_date=end,
+                                     fields=fields)
+    if not rollups:
+        return jsonify({'success': False, 'error': f'Rollup {granularity} non disponibili per: {area_name}',
+                        name_key: area_name}), 404
+    for doc in rollups:
+        doc['period_start'] = doc['period_start'].strftime('%Y-%m-%d')
+        doc['period_end'] = doc['period_end'].strftime('%Y-%m-%d')
+    return jsonify({'success': True, 'data': rollups, 'granularity': granularity, name_key: area_name})
+
+def _area_window(area_type, area_name, history, since, max_points):
+    """
+    Righe di un'area per /api/data/regional e /api/data/provincial: come get_history la finestra
+    viene prima ristretta con since e poi ridotta con max_points, così i delta non hanno buchi.
+
+    Returns:
+        tuple: (righe, True se il client deve sostituire tutti i suoi dati)
+    """
+    records, full, first = history['data'], True, None
+    if since is not None:
+        first, full = area_changed_since(area_type, area_name, history, since)
+        if not full:
+            if first is None:
+                return [], False
+            first = first.strftime('%Y-%m-%d')
+            records = [row for row in records if row['data'] >= first]
+    return downsample_records(records, max_points,
+                              cache_key=(area_type, area_name, history['version'], first)), full
+
 @app.route('/api/data/regional')
 def get_regional_data():
-    """API: Restituisce i dati per una specifica regione."""
+    """
+    API: Restituisce i dati per una specifica regione.
+
+    Con granularity=weekly|monthly restituisce i rollup del periodo (somma, media, minimo e
+    massimo per metrica) letti dalla collezione rollups; start, end e fields sono opzionali.
+    Con since (data o token 'version') i dati giornalieri contengono solo le righe aggiunte o corrette.
+    """
     from flask import request
     region_name = request.args.get('region', None)
     
@@ -472,22 +852,33 @@ def get_regional_data():
             'message': 'Usa parametro region= per specificare una regione'
         })
     
+    granularity = request.args.get('granularity', 'daily').lower()
+    if granularity != 'daily':
+        if granularity not in GRANULARITIES:
+            return jsonify({'success': False, 'error': GRANULARITY_ERROR}), 400
+        return _rollup_response('regional', region_name, granularity, 'region')
+    max_points, error = _parse_max_points_param()
+    if error:
+        return error
+    since, error = _parse_since_param()
+    if error:
+        return error
     try:
-        # Usa il modello GeoProphetModel per ottenere dati specifici per la regione
-        from models.geo_prophet_model import GeoProphetModel
-        model = GeoProphetModel(area_type='regional', area_name=region_name)
-        latest_data = model.get_latest_data(days=30)
-        
-        if not latest_data:
+        # Sola lettura dei dati (nessun fit dei modelli)
+        history = get_area_history('regional', region_name)
+        if not history or not history['data']:
             return jsonify({
                 'success': False,
                 'error': f'Dati non disponibili per la regione: {region_name}'
             }), 404
-            
+        latest_data, full = _area_window('regional', region_name, history, since, max_points)
+        
         return jsonify({
             'success': True,
             'data': latest_data,
-            'region': region_name
+            'region': region_name,
+            'version': str(history['version']),
+            **_since_fields(since, full)
         })
     except Exception as e:
         logger.error(f"Errore nel caricamento dei dati regionali per {region_name}: {e}")
@@ -500,7 +891,11 @@ def get_regional_data():
 # Endpoint per dati provinciali
 @app.route('/api/data/provincial')
 def get_provincial_data():
-    """API: Restituisce i dati per una specifica provincia."""
+    """
+    API: Restituisce i dati per una specifica provincia.
+
+    Supporta granularity=weekly|monthly e since come /api/data/regional.
+    """
     from flask import request
     province_name = request.args.get('province', None)
     region_name = request.args.get('region', None)
@@ -515,22 +910,33 @@ def get_provincial_data():
             'message': 'Usa parametro province= per specificare una provincia'
         })
     
+    granularity = request.args.get('granularity', 'daily').lower()
+    if granularity != 'daily':
+        if granularity not in GRANULARITIES:
+            return jsonify({'success': False, 'error': GRANULARITY_ERROR}), 400
+        return _rollup_response('provincial', province_name, granularity, 'province')
+    max_points, error = _parse_max_points_param()
+    if error:
+        return error
+    since, error = _parse_since_param()
+    if error:
+        return error
     try:
-        # Usa il modello GeoProphetModel per ottenere dati specifici per la provincia
-        from models.geo_prophet_model import GeoProphetModel
-        model = GeoProphetModel(area_type='provincial', area_name=province_name)
-        latest_data = model.get_latest_data(days=30)
-        
-        if not latest_data:
+        # Sola lettura dei dati (nessun fit dei modelli)
+        history = get_area_history('provincial', province_name)
+        if not history or not history['data']:
             return jsonify({
                 'success': False,
                 'error': f'Dati non disponibili per la provincia: {province_name}'
             }), 404
-            
+        latest_data, full = _area_window('provincial', province_name, history, since, max_points)
+        
         return jsonify({
             'success': True,
             'data': latest_data,
-            'province': province_name
+            'province': province_name,
+            'version': str(history['version']),
+            **_since_fields(since, full)
         })
     except Exception as e:
         logger.error(f"Errore nel caricamento dei dati provinciali per {province_name}: {e}")
@@ -540,6 +946,28 @@ def get_provincial_data():
             'province': province_name
         }), 500
 
+# Istantanee di tutte le aree per un giorno (mappe coropletiche)
+def _snapshot_response(area_type, region_name=None):
+    try:
+        day = _parse_date_param('date')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parametro date deve essere una data YYYY-MM-DD'}), 400
+    snapshot = get_area_snapshot(area_type, day, region_name)
+    if snapshot is None:
+        return jsonify({'success': False, 'error': 'Dati non disponibili per la data richiesta'}), 404
+    return jsonify({'success': True, 'date': snapshot['date'], 'source': snapshot['source'],
+                    'count': len(snapshot['data']), 'data': snapshot['data']})
+
+@app.route('/api/data/regional/snapshot')
+def get_regional_snapshot():
+    """API: Dati di tutte le regioni per un giorno (date=YYYY-MM-DD, default: il più recente)"""
+    return _snapshot_response('regional')
+
+@app.route('/api/data/provincial/snapshot')
+def get_provincial_snapshot():
+    """API: Dati di tutte le province per un giorno, opzionalmente di una sola regione (region=)"""
+    return _snapshot_response('provincial', request.args.get('region') or None)
+
 # Endpoint per previsioni regionali
 @app.route('/api/forecast/regional')
 def get_regional_forecast():
@@ -554,11 +982,15 @@ def get_regional_forecast():
             'error': 'Specifica una regione con il parametro region='
         }), 400
     
+    intervals = _parse_intervals_param()
+    if intervals is None:
+        return jsonify({'success': False, 'error': INTERVALS_ERROR}), 400
+    
     try:
         # Usa il modello GeoProphetModel per generare previsioni regionali
         from models.geo_prophet_model import GeoProphetModel
         model = GeoProphetModel(area_type='regional', area_name=region_name)
-        forecast_data = model.forecast(days=days)
+        forecast_data = model.forecast(days=days, intervals=intervals)
         
         if not forecast_data:
             return jsonify({
@@ -594,11 +1026,15 @@ def get_provincial_forecast():
             'error': 'Specifica una provincia con il parametro province='
         }), 400
     
+    intervals = _parse_intervals_param()
+    if intervals is None:
+        return jsonify({'success': False, 'error': INTERVALS_ERROR}), 400
+    
     try:
         # Usa il modello GeoProphetModel per generare previsioni provinciali
         from models.geo_prophet_model import GeoProphetModel
         model = GeoProphetModel(area_type='provincial', area_name=province_name)
-        forecast_data = model.forecast(days=days)
+        forecast_data = model.forecast(days=days, intervals=intervals)
         
         if not forecast_data:
             return jsonify({
@@ -620,6 +1056,44 @@ def get_provincial_forecast():
             'province': province_name
         }), 500
 
+# Endpoint per previsioni di più aree in una richiesta
+@app.route('/api/forecast/batch', methods=['POST'])
+def get_batch_forecast():
+    """
+    API: Previsioni di più aree. Corpo JSON: {"items": [{"area_type", "area_name", "indicators",
+    "days"}, ...], "intervals": "fast"}. Le previsioni in cache vengono risolte subito, i fit
+    mancanti eseguiti in parallelo nel pool di processi. Con format=ndjson (query o corpo) ogni
+    area viene inviata appena pronta, con il campo index della sua posizione nella richiesta.
+    """
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({'success': False, 'error': 'Corpo JSON mancante o non valido'}), 400
+    items, error = parse_items(payload, default_days=FUTURE_DAYS)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    options = payload if isinstance(payload, dict) else {}
+    intervals = str(options.get('intervals', request.args.get('intervals', DEFAULT_INTERVAL_MODE))).lower()
+    if intervals not in INTERVAL_MODES:
+        return jsonify({'success': False, 'error': INTERVALS_ERROR}), 400
+    output_format = str(options.get('format', request.args.get('format', 'json'))).lower()
+    if output_format not in ('json', 'ndjson'):
+        return jsonify({'success': False, 'error': 'Parametro format non valido. Valori ammessi: json, ndjson'}), 400
+
+    if output_format == 'ndjson':
+        def generate():
+            for result in run_batch(items, intervals):
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    try:
+        results = sorted(run_batch(items, intervals), key=lambda r: r['index'])
+    except Exception as e:
+        logger.error(f"Errore nelle previsioni batch: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': all(r['success'] for r in results), 'count': len(results),
+                    'intervals': intervals, 'results': results})
+
 # === ENDPOINT: Elenco modelli Prophet registrati ===
 @app.route('/api/models/prophet', methods=['GET'])
 def list_prophet_models():
@@ -635,20 +1109,80 @@ def list_prophet_models():
     return jsonify({'success': True, 'models': models})
 
 # === ENDPOINT: Feature Store ===
+# Numero massimo di righe per pagina in modalità JSON
+FEATURES_MAX_LIMIT = 5000
+
+def _parse_date_param(name):
+    """Legge un parametro data (YYYY-MM-DD o ISO); solleva ValueError se non valido"""
+    value = request.args.get(name, None)
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def _serialize_feature(doc):
+    """Rende serializzabile un documento del feature store (data in formato ISO)"""
+    if '_id' in doc:
+        doc['_id'] = str(doc['_id'])
+    if 'data' in doc and hasattr(doc['data'], 'isoformat'):
+        doc['data'] = doc['data'].isoformat()
+    return doc
+
 @app.route('/api/features', methods=['GET'])
 def get_features():
-    """Restituisce le feature dal feature store per area e intervallo di date"""
+    """
+    Restituisce le feature dal feature store per area e intervallo di date.
+    
+    Parametri opzionali:
+    - fields: elenco di feature separate da virgola (proiezione lato server)
+    - cursor: restituisce solo le date successive al cursore (valore 'next_cursor' della pagina precedente)
+    - limit: numero massimo di righe (in modalità JSON al massimo e per default FEATURES_MAX_LIMIT per pagina)
+    - format=ndjson: risposta in streaming, una riga JSON per documento letta direttamente dal cursore
+    Senza database risponde 503 in entrambe le modalità.
+    """
     area_type = request.args.get('area_type', 'national')
     area_name = request.args.get('area_name', 'ITA')
-    start_date = request.args.get('start_date', None)
-    end_date = request.args.get('end_date', None)
-    features = db_manager.get_features(area_type, area_name, start_date, end_date)
-    # Serializza ObjectId e datetime
-    for f in features:
-        f['_id'] = str(f['_id'])
-        if 'data' in f and hasattr(f['data'], 'isoformat'):
-            f['data'] = f['data'].isoformat()
-    return jsonify({'success': True, 'features': features})
+    output_format = request.args.get('format', 'json').lower()
+    if output_format not in ('json', 'ndjson'):
+        return jsonify({'success': False, 'error': 'Parametro format non valido. Valori ammessi: json, ndjson'}), 400
+    try:
+        start_date = _parse_date_param('start_date')
+        end_date = _parse_date_param('end_date')
+        after = _parse_date_param('cursor')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Date non valide: usare il formato YYYY-MM-DD'}), 400
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if any(not f.replace('_', '').isalnum() for f in fields):
+        return jsonify({'success': False, 'error': 'Parametro fields non valido'}), 400
+    limit_raw = request.args.get('limit', None)
+    try:
+        limit = int(limit_raw) if limit_raw is not None else None
+        if limit is not None and limit <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parametro limit deve essere un intero positivo'}), 400
+    if not db_manager.is_connected and not db_manager.connect():
+        return jsonify({'success': False, 'error': 'Feature store non disponibile'}), 503
+
+    if output_format == 'ndjson':
+        cursor = db_manager.iter_features(area_type, area_name, start_date, end_date,
+                                          fields=fields, after=after, limit=limit)
+
+        def generate():
+            for doc in cursor:
+                yield json.dumps(_serialize_feature(doc), ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    limit = min(limit or FEATURES_MAX_LIMIT, FEATURES_MAX_LIMIT)
+    # Una riga in più indica se esiste una pagina successiva
+    cursor = db_manager.iter_features(area_type, area_name, start_date, end_date, fields=fields,
+                                      after=after, limit=limit + 1)
+    features = [_serialize_feature(doc) for doc in cursor]
+    next_cursor = None
+    if len(features) > limit:
+        features = features[:limit]
+        next_cursor = features[-1]['data']
+    return jsonify({'success': True, 'features': features, 'next_cursor': next_cursor})
 
 # === ENDPOINT: Real-time Prophet prediction ===
 @app.route('/api/predict/prophet', methods=['GET'])
@@ -658,23 +1192,25 @@ def predict_prophet():
     area_type = request.args.get('area_type', 'national')
     area_name = request.args.get('area_name', 'ITA')
     days = int(request.args.get('days', 30))
-    # Recupera il modello più recente dal registry
-    model_doc = db_manager.get_latest_model(f'prophet_{area_name}_{indicator}', area_type, area_name)
-    if not model_doc:
-        return jsonify({'success': False, 'error': 'Modello non trovato'}), 404
-    model_path = model_doc['file_path']
+    intervals = _parse_intervals_param()
+    if intervals is None:
+        return jsonify({'success': False, 'error': INTERVALS_ERROR}), 400
+    # Recupera il modello più recente dal registry (puntatore e modello deserializzato sono in cache)
     try:
-        model = joblib.load(model_path)
+        model_doc, model = model_cache.get_model(f'prophet_{area_name}_{indicator}', area_type, area_name)
     except Exception as e:
         return jsonify({'success': False, 'error': f'Errore caricando il modello: {str(e)}'}), 500
+    if not model_doc:
+        return jsonify({'success': False, 'error': 'Modello non trovato'}), 404
     # Prepara le date future
     today = datetime.today()
-    import pandas as pd
-    future_dates = pd.date_range(start=today + timedelta(days=1), periods=days)
-    df_future = pd.DataFrame({'ds': future_dates})
-    # Fai la previsione
+    # Date a mezzanotte: stesse date per tutta la giornata (le bande 'full' restano in cache)
+    future_dates = pd.date_range(start=today + timedelta(days=1), periods=days).normalize()
+    # Fai la previsione con il modello compatto (solo NumPy)
     try:
-        forecast = model.predict(df_future)
+        with metrics.timer('apollo_prophet_predict_duration_seconds', area_type=area_type,
+                           indicator=indicator, intervals=intervals):
+            forecast = model.predict(future_dates, intervals=intervals)
         yhat = forecast['yhat'].tolist()
         yhat_lower = forecast['yhat_lower'].tolist() if 'yhat_lower' in forecast else None
         yhat_upper = forecast['yhat_upper'].tolist() if 'yhat_upper' in forecast else None
@@ -684,21 +1220,151 @@ def predict_prophet():
             'area_type': area_type,
             'area_name': area_name,
             'days': days,
+            'intervals': intervals,
             'prediction': yhat,
             'yhat_lower': yhat_lower,
             'yhat_upper': yhat_upper
         }
+        # Logga la previsione per l'A/B test (solo accodata, scritta in background)
+        db_manager.log_ab_test_result(area_type, area_name, model_doc.get('model_name'), yhat,
+                                      input_data={'indicator': indicator, 'days': days,
+                                                  'version': model_doc.get('version')})
         return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'error': f'Errore nella previsione: {str(e)}'}), 500
 
+# === ENDPOINT: Stato dello scrittore asincrono dei risultati A/B test ===
+@app.route('/api/ab_test/stats', methods=['GET'])
+def ab_test_writer_stats():
+    """Restituisce profondità della coda, documenti scritti, finiti nello spill o scartati"""
+    return jsonify({'success': True, 'stats': db_manager.get_ab_test_writer_stats()})
+
+# === METRICHE PROMETHEUS ===
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metriche in formato Prometheus, sommate su tutti i worker se APOLLO_METRICS_DIR è impostata"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# === LIVENESS E READINESS ===
+@app.route('/healthz')
+def healthz():
+    """Liveness: il processo risponde (non dipende da dati, modelli o database)"""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 quando il riscaldamento è terminato, altrimenti 503 con l'avanzamento"""
+    status = warmup.status()
+    return jsonify(status), (200 if status['ready'] else 503)
+
+# === STREAM DEGLI AGGIORNAMENTI (SSE) ===
+# Ogni client connesso occupa un thread per tutta la durata dello stream: va attivato solo con
+# worker gunicorn gthread o gevent (con i worker sync predefiniti bloccherebbe il worker).
+# Senza lo stream la pagina principale controlla gli aggiornamenti con il polling.
+UPDATES_STREAM_ENABLED = os.environ.get('UPDATES_STREAM_ENABLED', '0') == '1'
+# Durata massima di una connessione: poi lo stream si chiude e il client si riconnette (retry)
+UPDATES_STREAM_SECONDS = float(os.environ.get('UPDATES_STREAM_SECONDS', 90))
+# Secondi senza eventi dopo i quali si invia un commento per tenere aperta la connessione
+UPDATES_KEEPALIVE_SECONDS = float(os.environ.get('UPDATES_KEEPALIVE_SECONDS', 15))
+UPDATE_EVENT_TYPES = ('dataset', 'model', 'forecast')
+
+# Versioni controllate periodicamente: importazioni eseguite in altri processi (es. /admin/update_data)
+for _data_type in ('national', 'regional', 'provincial'):
+    update_bus.watch(_data_type, lambda data_type=_data_type: db_manager.get_data_version(data_type))
+for _country in WARMUP_COUNTRIES:
+    # Token 'version' di /api/data/historical e /api/data/latest (mtime del CSV del paese)
+    update_bus.watch(f'country:{_country}', lambda country=_country: str(
+        os.path.getmtime(CovidDataProcessor.get_data_file_for_country(country))))
+metrics.register_collector('apollo_updates', update_bus.stats)
+
+def _sse_event(event_type, data, event_id=None):
+    """Messaggio Server-Sent Events con dati JSON"""
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route('/api/stream/updates')
+def stream_updates():
+    """
+    Stream SSE degli aggiornamenti: importazioni concluse ('dataset'), modelli registrati ('model')
+    e previsioni ricalcolate ('forecast'), con i nuovi token di versione.
+
+    Alla connessione viene inviato un evento 'versions' con le versioni note dei dataset, da
+    confrontare con quelle in possesso del client. Parametro opzionale types=dataset,model,forecast.
+    La connessione si chiude dopo UPDATES_STREAM_SECONDS e EventSource si riconnette dopo 'retry'.
+    Richiede UPDATES_STREAM_ENABLED=1 (worker gthread o gevent), altrimenti risponde 503.
+    """
+    if not UPDATES_STREAM_ENABLED:
+        return jsonify({'success': False,
+                        'error': 'Stream degli aggiornamenti non attivo, usare il polling di /api/dashboard'}), 503
+    types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()] or list(UPDATE_EVENT_TYPES)
+    unknown = [t for t in types if t not in UPDATE_EVENT_TYPES]
+    if unknown:
+        return jsonify({'success': False,
+                        'error': f"Tipi di evento non validi. Valori ammessi: {', '.join(UPDATE_EVENT_TYPES)}"}), 400
+    subscription = update_bus.subscribe()
+
+    def generate():
+        deadline = time.monotonic() + UPDATES_STREAM_SECONDS
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse_event('versions', update_bus.versions())
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event = subscription.get(timeout=min(UPDATES_KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event['type'] in types:
+                    yield _sse_event(event['type'], event, event['id'])
+        finally:
+            update_bus.unsubscribe(subscription)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disattiva il buffering dei proxy (nginx) per la consegna immediata
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# === RISCALDAMENTO DEL WORKER ===
+def _warm_dataset(country):
+    processor = get_processor(country)
+    if processor is None:
+        raise RuntimeError(f"Dati non disponibili per {country}")
+    return {'records': len(processor.national_data)}
+
+def _warm_forecast(country):
+    """Addestra il modello nazionale del paese: le richieste successive trovano il fit in cache"""
+    global prophet_model
+    from models.prophet_model import ProphetModel
+    processor = get_processor(country)
+    if processor is None:
+        raise RuntimeError(f"Dati non disponibili per {country}")
+    model = ProphetModel(processor.national_file, columns=['nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi'], train_days=TRAIN_DAYS)
+    model.forecast(days=FUTURE_DAYS)
+    if country == 'ITA' and prophet_model is None:
+        # Usato da /api/stats/model
+        prophet_model = model
+    return {'last_train_date': str(model.last_train_date.date())}
+
+for _country in WARMUP_COUNTRIES:
+    warmup.add_step(f'dataset:{_country}', lambda c=_country: _warm_dataset(c), required=(_country == 'ITA'))
+warmup.add_step('database', lambda: {'connected': db_manager.connect()})
+warmup.add_step('models', warm_registered_models)
+for _country in WARMUP_COUNTRIES:
+    warmup.add_step(f'forecast:{_country}', lambda c=_country: _warm_forecast(c))
+
+if WARMUP_ENABLED:
+    warmup.start()
+
 # === ENDPOINT ADMIN: Aggiornamento dati dal web ===
 @app.route('/admin/update_data', methods=['POST'])
 def admin_update_data():
     """Endpoint admin per aggiornare i dati dal web. Richiede parametro 'secret' per autorizzazione."""
-    secret = request.form.get('secret')
-    # Sostituisci 'TUOSEGRETO' con una chiave segreta a tua scelta
-    if secret != 'TUOSEGRETO':
+    # Imposta APOLLO_ADMIN_SECRET con una chiave segreta a tua scelta
+    if not _is_admin_request():
         return jsonify({'success': False, 'error': 'Non autorizzato'}), 403
     try:
         # Lancia lo script di aggiornamento
@@ -711,6 +1377,40 @@ def admin_update_data():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# === ENDPOINT ADMIN: Profili delle richieste ===
+# Righe massime del riepilogo testuale di un profilo
+PROFILE_REPORT_MAX_LIMIT = 1000
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_list_profiles():
+    """Elenco dei profili cProfile salvati (richiede il segreto admin)"""
+    if not _is_admin_request():
+        return jsonify({'success': False, 'error': 'Non autorizzato'}), 403
+    return jsonify({'success': True, 'profiles': profiler.list()})
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def admin_get_profile(profile_id):
+    """Scarica un profilo: file .prof (pstats/snakeviz) o riepilogo testuale con format=text"""
+    if not _is_admin_request():
+        return jsonify({'success': False, 'error': 'Non autorizzato'}), 403
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'ncalls'):
+            return jsonify({'success': False, 'error': "sort deve essere 'cumulative', 'tottime' o 'ncalls'"}), 400
+        limit = request.args.get('limit', '50')
+        if not limit.isdigit() or not 1 <= int(limit) <= PROFILE_REPORT_MAX_LIMIT:
+            return jsonify({'success': False,
+                            'error': f'Parametro limit non valido (1-{PROFILE_REPORT_MAX_LIMIT})'}), 400
+        report = profiler.report(profile_id, sort=sort, limit=int(limit))
+        if report is None:
+            return jsonify({'success': False, 'error': 'Profilo non trovato'}), 404
+        return Response(report, mimetype='text/plain')
+    path = profiler.path(profile_id)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Profilo non trovato'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{profile_id}.prof")
+
 # Avvio server in modalità debug per sviluppo
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -722,16 +1422,5 @@ if __name__ == '__main__':
         print(f"{rule.endpoint:30s} -> {rule}")
     print()
 
-    # Precarica il modello Prophet e i dati
-    try:
-        covid_processor.load_data()
-        logger.info(f"Dati COVID-19 caricati con successo: {len(covid_processor.national_data)} record")
-        # Precarica ProphetModel solo per ITA (opzionale, ogni richiesta ora crea il modello per il paese richiesto)
-        if prophet_model is None:
-            from models.prophet_model import ProphetModel
-            from models.geo_prophet_model import GeoProphetModel
-            prophet_model = ProphetModel(covid_processor.national_file, columns=['nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi'], train_days=TRAIN_DAYS)
-            logger.info("Modello Prophet ITA precaricato con successo")
-    except Exception as e:
-        logger.warning(f"Impossibile precaricare i dati o il modello: {e}")
+    # Dati e modelli vengono caricati dal thread di riscaldamento (vedi /readyz)
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Backtesting rolling-origin dei modelli Prophet di Apollo Project.
+
+Per ogni area e indicatore il modello viene addestrato su più date di taglio (cutoff) con la
+stessa finestra di addestramento usata in produzione, e le previsioni dei giorni successivi
+vengono confrontate con i dati reali. Il cutoff più recente è l'ultimo giorno di addestramento
+del modello servito (per il livello nazionale ProphetModel usa le prime TRAIN_DAYS righe, per
+regioni e province GeoProphetModel usa le ultime), gli altri lo precedono di step giorni: le
+metriche descrivono il modello in produzione e non periodi su cui non è mai stato addestrato.
+Per ogni orizzonte h si salvano in MongoDB:
+- mape / mae / coverage: errori sui giorni da 1 a h dopo il taglio (media sui cutoff)
+- mape_step / mae_step / coverage_step: errori sul solo giorno h
+La copertura è calcolata sulle bande 'full' (campionamento come Prophet.predict_uncertainty),
+non sull'approssimazione analitica 'fast'.
+
+I risultati sono indicizzati per (area, indicatore, orizzonte, versione del modello), così
+/api/model/mape li legge con una query puntuale invece di addestrare un modello per richiesta.
+Le serie vengono valutate in parallelo su un pool di processi. Ogni cutoff è una serie diversa,
+quindi i fit vengono eseguiti direttamente (fit_prophet) senza passare da fit_cache, che nei
+processi del pool non verrebbe mai riusata e terrebbe in memoria modelli inutili.
+"""
+
+import sys
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from db_manager import db_manager
+from data_utils import CovidDataProcessor
+from feature_pipeline import AREA_COLUMNS
+from models.compact_prophet import CompactProphet
+from models.fit_cache import fit_prophet, MODEL_VERSION
+
+logger = logging.getLogger('apollo-backtesting')
+
+# Indicatori valutati per livello geografico (come in ProphetModel/GeoProphetModel)
+INDICATORS = {
+    'national': ['nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi'],
+    'regional': ['nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi'],
+    'provincial': ['totale_casi']
+}
+COUNTRIES = ['ITA', 'FRA']
+TRAIN_DAYS = 300
+DEFAULT_CUTOFFS = 8
+DEFAULT_STEP_DAYS = 14
+DEFAULT_MAX_HORIZON = 30
+# Punti minimi di addestramento per considerare valido un cutoff
+MIN_TRAIN_POINTS = 60
+# Bande usate per la copertura degli intervalli
+COVERAGE_INTERVALS = 'full'
+
+
+def _cutoff_indices(n_points, n_cutoffs, step, max_horizon, train_end=None):
+    """
+    Indici dell'ultimo giorno di addestramento per ogni cutoff, dal più vecchio al più recente.
+
+    train_end: indice dell'ultimo giorno di addestramento del modello in produzione (None = fine
+    della serie); il cutoff più recente non lo supera.
+    """
+    last = n_points - max_horizon - 1
+    if train_end is not None:
+        last = min(last, train_end)
+    indices = [last - k * step for k in range(n_cutoffs)]
+    return sorted(i for i in indices if i + 1 >= MIN_TRAIN_POINTS)
+
+
+def backtest_series(task):
+    """
+    Esegue il backtesting di una serie (funzione eseguita nei processi del pool).
+
+    Args:
+        task: dict con area_type, area_name, indicator, ds, y, cutoffs, step, horizons, train_days,
+              train_end (indice dell'ultimo giorno di addestramento in produzione, None = fine serie)
+
+    Returns:
+        list: Un documento di risultato per ogni orizzonte (vuota se la serie è troppo corta)
+    """
+    ds = np.asarray(task['ds'], dtype='datetime64[ns]')
+    y = np.asarray(task['y'], dtype=float)
+    horizons = sorted(task['horizons'])
+    max_horizon = horizons[-1]
+    label = f"{task['area_type']} - {task['area_name']} - {task['indicator']}"
+
+    abs_errors, pct_errors, covered = [], [], []
+    cutoffs = []
+    for idx in _cutoff_indices(len(ds), task['cutoffs'], task['step'], max_horizon, task.get('train_end')):
+        start = max(0, idx + 1 - task['train_days'])
+        try:
+            compact = CompactProphet.from_model(fit_prophet(ds[start:idx + 1], y[start:idx + 1]))
+        except Exception as e:
+            logger.error(f"Backtesting {label}: fit fallito al cutoff {ds[idx]}: {e}")
+            continue
+        future = slice(idx + 1, idx + 1 + max_horizon)
+        forecast = compact.predict(ds[future], intervals=COVERAGE_INTERVALS)
+        actual = y[future]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct = np.where(actual != 0, np.abs((actual - forecast['yhat']) / actual), np.nan)
+        inside = ((actual >= forecast['yhat_lower']) & (actual <= forecast['yhat_upper'])).astype(float)
+        inside[np.isnan(actual)] = np.nan
+        abs_errors.append(np.abs(actual - forecast['yhat']))
+        pct_errors.append(pct)
+        covered.append(inside)
+        cutoffs.append(pd.Timestamp(ds[idx]).strftime('%Y-%m-%d'))
+
+    if not cutoffs:
+        return []
+
+    abs_errors, pct_errors, covered = np.array(abs_errors), np.array(pct_errors), np.array(covered)
+
+    def _metric(values, scale=1.0):
+        if not np.any(~np.isnan(values)):
+            return None
+        return round(float(np.nanmean(values)) * scale, 4)
+
+    results = []
+    for h in horizons:
+        results.append({
+            'area_type': task['area_type'],
+            'area_name': task['area_name'],
+            'indicator': task['indicator'],
+            'horizon': h,
+            'model_version': MODEL_VERSION,
+            'mape': _metric(pct_errors[:, :h], 100),
+            'mae': _metric(abs_errors[:, :h]),
+            'coverage': _metric(covered[:, :h]),
+            'mape_step': _metric(pct_errors[:, h - 1], 100),
+            'mae_step': _metric(abs_errors[:, h - 1]),
+            'coverage_step': _metric(covered[:, h - 1]),
+            'coverage_intervals': COVERAGE_INTERVALS,
+            'cutoffs': cutoffs,
+            'train_days': task['train_days']
+        })
+    return results
+
+
+def _national_series(countries):
+    """Serie nazionali dai CSV dei paesi (stessa fonte di /api/model/mape)"""
+    for country in countries:
+        processor = CovidDataProcessor(country_code=country)
+        if not processor.load_data() or processor.national_data is None:
+            logger.warning(f"Dati nazionali non disponibili per {country}")
+            continue
+        yield country, processor.national_data
+
+
+def _area_series(area_type):
+    """Serie regionali o provinciali lette da MongoDB, una per area"""
+    loader = db_manager.get_regional_data if area_type == 'regional' else db_manager.get_provincial_data
+    df = pd.DataFrame(loader())
+    area_col = AREA_COLUMNS[area_type]
+    if df.empty or area_col not in df.columns:
+        logger.warning(f"Nessun dato {area_type} nel database")
+        return
+    df['data'] = pd.to_datetime(df['data'])
+    for area_name, area_df in df.groupby(area_col, sort=True):
+        yield area_name, area_df
+
+
+def build_tasks(area_types, countries, cutoffs, step, horizons, train_days=TRAIN_DAYS, areas=None):
+    """Crea un task di backtesting per ogni area e indicatore"""
+    tasks = []
+    for area_type in area_types:
+        series = _national_series(countries) if area_type == 'national' else _area_series(area_type)
+        for area_name, df in series:
+            if areas and area_name not in areas:
+                continue
+            df = df.sort_values('data')
+            # ProphetModel (nazionale) si addestra sulle prime train_days righe, GeoProphetModel sulle ultime
+            train_end = min(train_days, len(df)) - 1 if area_type == 'national' else None
+            for indicator in INDICATORS[area_type]:
+                if indicator not in df.columns:
+                    continue
+                tasks.append({
+                    'area_type': area_type,
+                    'area_name': area_name,
+                    'indicator': indicator,
+                    'ds': df['data'].values.astype('datetime64[ns]'),
+                    'y': pd.to_numeric(df[indicator], errors='coerce').values.astype(float),
+                    'cutoffs': cutoffs,
+                    'step': step,
+                    'horizons': horizons,
+                    'train_days': train_days,
+                    'train_end': train_end
+                })
+    return tasks
+
+
+def run_backtest(tasks, workers=None):
+    """Esegue i task (in parallelo se workers != 1) e restituisce tutti i risultati"""
+    results = []
+    if workers == 1:
+        for task in tasks:
+            results.extend(backtest_series(task))
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for task_results in executor.map(backtest_series, tasks):
+            results.extend(task_results)
+    return results
+
+
+def _parse_horizons(value):
+    """Orizzonti come elenco '7,14,30' oppure massimo 'N' (tutti gli orizzonti da 1 a N)"""
+    parts = [int(p) for p in value.split(',') if p.strip()]
+    if len(parts) == 1:
+        return list(range(1, parts[0] + 1))
+    return sorted(set(parts))
+
+
+def parse_arguments():
+    """Analizza gli argomenti dalla riga di comando"""
+    parser = argparse.ArgumentParser(description="Backtesting rolling-origin dei modelli Prophet di Apollo")
+    parser.add_argument("--area-type", choices=list(INDICATORS), action="append",
+                        help="Livello da valutare (ripetibile, default: national)")
+    parser.add_argument("--country", action="append", help="Paese per il livello nazionale (default: ITA e FRA)")
+    parser.add_argument("--area", action="append", help="Limita il backtesting a queste aree (ripetibile)")
+    parser.add_argument("--cutoffs", type=int, default=DEFAULT_CUTOFFS, help="Numero di date di taglio")
+    parser.add_argument("--step", type=int, default=DEFAULT_STEP_DAYS, help="Giorni tra due date di taglio")
+    parser.add_argument("--horizons", default=str(DEFAULT_MAX_HORIZON),
+                        help="Orizzonti: 'N' per 1..N oppure elenco '7,14,30'")
+    parser.add_argument("--train-days", type=int, default=TRAIN_DAYS, help="Giorni della finestra di addestramento")
+    parser.add_argument("--workers", type=int, default=None, help="Processi del pool (default: numero di CPU)")
+    return parser.parse_args()
+
+
+def main():
+    """Esegue il backtesting e salva i risultati in MongoDB"""
+    args = parse_arguments()
+    if not db_manager.connect():
+        logger.error("Impossibile connettersi al database MongoDB.")
+        return 1
+
+    tasks = build_tasks(args.area_type or ['national'], args.country or COUNTRIES, args.cutoffs,
+                        args.step, _parse_horizons(args.horizons), args.train_days, args.area)
+    logger.info(f"Backtesting di {len(tasks)} serie (versione modello {MODEL_VERSION})")
+    results = run_backtest(tasks, args.workers)
+    saved = db_manager.save_backtest_results(results)
+    logger.info(f"Risultati di backtesting: {len(results)} (inseriti {saved.get('inserted', 0)}, "
+                f"aggiornati {saved.get('updated', 0)}, errori {saved.get('errors', 0)})")
+    return 0 if saved.get("success") else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,722 @@
+# -*- coding: utf-8 -*-
+"""
+Suite di benchmark offline di Apollo Project.
+
+Misura, senza MongoDB reale né rete:
+- startup: avvio a freddo (import dell'app in un interprete nuovo)
+- fit: ProphetModel._fit_all (senza e con fit in cache) e forecast per modalità di intervalli
+- geo: GeoProphetModel end-to-end (caricamento dati, fit, previsione)
+- predict: CompactProphet.predict per modalità di intervalli ('none', 'fast', 'full')
+- db: DatabaseManager.save_* (prima importazione e reimportazione invariata)
+- import: import_historical_data_to_mongodb
+- api: ogni route /api/* tramite il client di test Flask
+
+Il comando startup profila l'import dell'app con python -X importtime (costo per pacchetto,
+moduli pesanti caricati all'avvio, budget opzionale). Il comando scale ripete importazione,
+fit e query su dataset sintetici (synthetic_data.py) di dimensione crescente e produce una
+tabella e un grafico di scalabilità.
+
+Come database viene usato mongomock (o un mongod locale con --mongo-uri), iniettato con
+DatabaseManager.use_client. Ogni esecuzione produce un JSON con p50/p95, RSS di picco e
+numero di chiamate per caso, salvato in benchmarks/results/<run_id>.json.
+
+Esempi:
+    python benchmark.py run --suite fit --suite api --repeat 5
+    python benchmark.py startup --runs 10 --budget-ms 1500
+    python benchmark.py scale --days 365,1825,3650 --regions 21,100,500
+    python benchmark.py compare 20240101-120000 20240102-120000 --threshold 0.2
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Il riscaldamento in background di app.py falserebbe le misure in-process
+os.environ.setdefault('APOLLO_WARMUP', '0')
+
+from db_manager import db_manager, DB_NAME
+
+logger = logging.getLogger('apollo-benchmark')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+NATIONAL_CSV = os.path.join(os.path.dirname(BASE_DIR), 'dpc-covid19-ita-andamento-nazionale.csv')
+REGIONAL_CSV = os.path.join(BASE_DIR, 'data_cache', 'dpc-covid19-ita-regioni-latest.csv')
+PROVINCIAL_CSV = os.path.join(BASE_DIR, 'data_cache', 'dpc-covid19-ita-province-latest.csv')
+TRAINED_MODELS_DIR = os.path.join(BASE_DIR, 'trained_models')
+
+SUITES = ('startup', 'fit', 'geo', 'predict', 'db', 'import', 'api')
+INTERVAL_MODES = ('none', 'fast', 'full')
+# Moduli che non devono essere importati all'avvio dell'app (caricati solo quando servono)
+LAZY_MODULES = ('prophet', 'cmdstanpy', 'joblib', 'redis', 'requests')
+INDICATORS = ['nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi']
+
+# Soglie di default per il confronto tra due esecuzioni
+DEFAULT_THRESHOLD = 0.20
+DEFAULT_MIN_DELTA_MS = 1.0
+
+
+def peak_rss_mb():
+    """RSS di picco del processo in MB (None se non disponibile sulla piattaforma)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta KB, macOS byte
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(durations):
+    """Statistiche in millisecondi di una lista di durate in secondi"""
+    values = np.asarray(durations, dtype=float) * 1000
+    return {
+        'calls': int(len(values)),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+        'min_ms': round(float(values.min()), 3),
+        'max_ms': round(float(values.max()), 3)
+    }
+
+
+class BenchmarkRun:
+    """Raccoglie i tempi dei casi di una esecuzione"""
+
+    def __init__(self, run_id, repeat, warmup):
+        self.run_id = run_id
+        self.repeat = repeat
+        self.warmup = warmup
+        self.cases = {}
+
+    def measure(self, name, func, repeat=None, setup=None, check=None):
+        """
+        Misura una funzione.
+
+        Args:
+            name: Nome del caso (es. 'api:/api/data/forecast')
+            func: Funzione senza argomenti da misurare
+            repeat: Ripetizioni misurate (default: quella dell'esecuzione)
+            setup: Funzione chiamata prima di ogni ripetizione, fuori dal tempo misurato
+            check: Funzione risultato -> etichetta di esito (es. codice HTTP); conteggiata nel report
+        """
+        repeat = repeat or self.repeat
+        rss_before = peak_rss_mb()
+        outcomes = {}
+        errors = 0
+        try:
+            for _ in range(self.warmup):
+                if setup:
+                    setup()
+                func()
+            durations = []
+            for _ in range(repeat):
+                if setup:
+                    setup()
+                start = time.perf_counter()
+                result = func()
+                durations.append(time.perf_counter() - start)
+                if check:
+                    outcome = str(check(result))
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                    if outcome.startswith('5'):
+                        errors += 1
+        except Exception as e:
+            logger.error(f"[{name}] errore: {e}")
+            self.cases[name] = {'error': str(e)}
+            return None
+        stats = summarize(durations)
+        stats['errors'] = errors
+        stats['peak_rss_mb'] = peak_rss_mb()
+        stats['rss_growth_mb'] = (round(stats['peak_rss_mb'] - rss_before, 1)
+                                  if rss_before is not None else None)
+        if outcomes:
+            stats['outcomes'] = outcomes
+        self.cases[name] = stats
+        logger.info(f"{name}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms ({stats['calls']} chiamate)")
+        return stats
+
+    def to_dict(self, args):
+        return {
+            'run_id': self.run_id,
+            'created_at': datetime.now().isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': args,
+            'peak_rss_mb': peak_rss_mb(),
+            'cases': self.cases
+        }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+# --------------------------------------------------------------------------- #
+# Database di prova                                                           #
+# --------------------------------------------------------------------------- #
+
+def use_standin_database(mongo_uri=None, db_name=None):
+    """Collega db_manager a mongomock (default) o a un mongod locale, su un database dedicato"""
+    db_name = db_name or f"{DB_NAME}_benchmark"
+    if mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock non installato: pip install mongomock oppure usare --mongo-uri")
+        client = mongomock.MongoClient()
+    client.drop_database(db_name)
+    db_manager.use_client(client, db_name)
+    return client, db_name
+
+
+def reset_database(client, db_name):
+    client.drop_database(db_name)
+    db_manager.use_client(client, db_name)
+
+
+def _records(path):
+    df = pd.read_csv(path)
+    df['data'] = pd.to_datetime(df['data'])
+    return df.to_dict('records')
+
+
+def register_trained_models():
+    """Registra nel model registry di prova i modelli presenti in trained_models"""
+    if not os.path.isdir(TRAINED_MODELS_DIR):
+        return 0
+    count = 0
+    for filename in sorted(os.listdir(TRAINED_MODELS_DIR)):
+        if not filename.endswith('.joblib'):
+            continue
+        name = filename[:-len('.joblib')]
+        country = name.split('_')[1]
+        compact_path = os.path.join(TRAINED_MODELS_DIR, f"{name}.compact.json")
+        db_manager.register_model(name, 'national', country, 'benchmark', os.path.join(TRAINED_MODELS_DIR, filename),
+                                  compact_path=compact_path if os.path.exists(compact_path) else None)
+        count += 1
+    return count
+
+
+# --------------------------------------------------------------------------- #
+# Suite                                                                       #
+# --------------------------------------------------------------------------- #
+
+def bench_fit(run, paths):
+    from models.prophet_model import ProphetModel
+    from models.fit_cache import fit_cache
+
+    model = ProphetModel(paths['national'], columns=INDICATORS)
+    run.measure('fit:ProphetModel._fit_all', model._fit_all, repeat=max(1, run.repeat // 2),
+                setup=lambda: (fit_cache.clear(), model.models.clear(), model.compact_models.clear()))
+    run.measure('fit:ProphetModel._fit_all (cache)', model._fit_all,
+                setup=lambda: (model.models.clear(), model.compact_models.clear()))
+    for mode in INTERVAL_MODES:
+        run.measure(f'fit:ProphetModel.forecast[{mode}]', lambda: model.forecast(days=30, intervals=mode))
+
+
+def bench_geo(run, paths):
+    from models.geo_prophet_model import GeoProphetModel
+    from models.fit_cache import fit_cache
+
+    def end_to_end():
+        model = GeoProphetModel(area_type='national', csv_path=paths['national'])
+        return model.forecast(days=30)
+
+    run.measure('geo:GeoProphetModel national', end_to_end, repeat=max(1, run.repeat // 2),
+                setup=fit_cache.clear)
+    run.measure('geo:GeoProphetModel national (cache)', end_to_end)
+
+
+def bench_predict(run, paths):
+    from models.prophet_model import ProphetModel
+
+    compact = ProphetModel(paths['national'], columns=['nuovi_positivi']).get_compact_model('nuovi_positivi')
+    future = pd.date_range(compact.params['history_end'], periods=31)[1:]
+    for mode in INTERVAL_MODES:
+        if mode == 'full':
+            # Senza cache: campionamento completo a ogni chiamata
+            run.measure('predict:CompactProphet[full]', lambda: compact.predict(future, intervals='full'),
+                        setup=compact._full_bands.clear)
+            run.measure('predict:CompactProphet[full, cache]', lambda: compact.predict(future, intervals='full'))
+        else:
+            run.measure(f'predict:CompactProphet[{mode}]', lambda: compact.predict(future, intervals=mode))
+
+
+def bench_db(run, paths, client, db_name):
+    datasets = {
+        'national': (db_manager.save_national_data, _records(paths['national'])),
+        'regional': (db_manager.save_regional_data, _records(paths['regional'])),
+        'provincial': (db_manager.save_provincial_data, _records(paths['provincial']))
+    }
+    for level, (save, records) in datasets.items():
+        run.measure(f'db:save_{level}_data (insert)', lambda: save(records),
+                    setup=lambda: reset_database(client, db_name))
+        run.measure(f'db:save_{level}_data (unchanged)', lambda: save(records))
+    reset_database(client, db_name)
+
+
+def bench_import(run, paths, client, db_name):
+    import data_utils
+
+    # I percorsi di importazione puntano ai file del benchmark (niente download)
+    data_utils.LOCAL_NATIONAL_CSV_PATH = paths['national']
+    data_utils.LOCAL_REGIONAL_HISTORY_PATH = paths['regional']
+    data_utils.LOCAL_PROVINCIAL_HISTORY_PATH = paths['provincial']
+    run.measure('import:import_historical_data_to_mongodb (insert)', data_utils.import_historical_data_to_mongodb,
+                repeat=max(1, run.repeat // 2), setup=lambda: reset_database(client, db_name))
+    run.measure('import:import_historical_data_to_mongodb (unchanged)', data_utils.import_historical_data_to_mongodb,
+                repeat=max(1, run.repeat // 2))
+
+
+def api_requests(regional_area=None, provincial_area=None):
+    """Richieste di esempio per ogni route /api/*"""
+    requests = [
+        ('GET', '/api/data/historical?country=ITA'),
+        ('GET', '/api/data/latest?country=ITA'),
+        ('GET', '/api/data/globe'),
+        ('GET', '/api/stats/model'),
+        ('GET', '/api/model/mape?indicator=nuovi_positivi&days=7&country=ITA'),
+        ('GET', '/api/model/backtest?area_type=national&area_name=ITA&indicator=nuovi_positivi'),
+        ('GET', '/api/data/regional'),
+        ('GET', '/api/data/provincial'),
+        ('GET', '/api/models/prophet'),
+        ('GET', '/api/features?area_type=national&area_name=ITA&limit=100'),
+        ('GET', '/api/ab_test/stats')
+    ]
+    for mode in INTERVAL_MODES:
+        requests.append(('GET', f'/api/data/forecast?country=ITA&intervals={mode}'))
+        requests.append(('GET', f'/api/predict/prophet?indicator=nuovi_positivi&area_type=national'
+                                f'&area_name=ITA&days=30&intervals={mode}'))
+    if regional_area:
+        requests.append(('GET', f'/api/data/regional?region={regional_area}'))
+        requests.append(('GET', f'/api/forecast/regional?region={regional_area}&days=30'))
+    if provincial_area:
+        requests.append(('GET', f'/api/data/provincial?province={provincial_area}'))
+        requests.append(('GET', f'/api/forecast/provincial?province={provincial_area}&days=30'))
+    return requests
+
+
+def prepare_api_data(paths):
+    """Popola il database di prova con dati e modelli registrati per le route API"""
+    db_manager.save_national_data(_records(paths['national']))
+    regional = _records(paths['regional'])
+    provincial = _records(paths['provincial'])
+    db_manager.save_regional_data(regional)
+    db_manager.save_provincial_data(provincial)
+    register_trained_models()
+    regional_area = regional[0]['denominazione_regione'] if regional else None
+    provincial_area = provincial[0]['denominazione_provincia'] if provincial else None
+    return regional_area, provincial_area
+
+
+def bench_api(run, paths):
+    from app import app
+
+    regional_area, provincial_area = prepare_api_data(paths)
+    client = app.test_client()
+    for method, url in api_requests(regional_area, provincial_area):
+        run.measure(f'api:{method} {url}', lambda: client.open(url, method=method),
+                    check=lambda response: response.status_code)
+    db_manager.flush_ab_test_results(timeout=5)
+
+
+def _import_command(module, importtime=False):
+    return [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', f'import {module}']
+
+
+def bench_startup(run, module='app'):
+    """Avvio a freddo: import dell'app in un interprete nuovo (come un worker gunicorn)"""
+    run.measure(f'startup:import {module}',
+                lambda: subprocess.run(_import_command(module), cwd=BASE_DIR, check=True, capture_output=True))
+
+
+def profile_imports(module='app', runs=5):
+    """
+    Profila l'import di un modulo con python -X importtime in interpreti nuovi.
+
+    Returns:
+        dict: wall (secondi per esecuzione), modules (nome -> self_ms/cumulative_ms/depth, mediane),
+              packages (pacchetto di primo livello -> self_ms totale) e lazy_violations
+    """
+    walls, samples, depths, direct = [], {}, {}, set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(_import_command(module, importtime=True), cwd=BASE_DIR,
+                              capture_output=True, text=True)
+        walls.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} fallito: {proc.stderr.strip().splitlines()[-1:]}")
+        # importtime elenca i figli prima del padre, indentati di due spazi per livello
+        children = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            _, self_us, cumulative_us, name = re.split(r':|\|', line, maxsplit=3)
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            name = name.strip()
+            samples.setdefault(name, []).append((int(self_us), int(cumulative_us)))
+            depths[name] = depth
+            if depth == 0:
+                if name == module:
+                    direct.update(children)
+                children = []
+            elif depth == 1:
+                children.append(name)
+    modules = {}
+    packages = {}
+    for name, values in samples.items():
+        values = np.array(values) / 1000
+        modules[name] = {'self_ms': round(float(np.median(values[:, 0])), 3),
+                         'cumulative_ms': round(float(np.median(values[:, 1])), 3),
+                         'depth': depths[name],
+                         'direct': name in direct}
+        root = name.split('.')[0]
+        packages[root] = round(packages.get(root, 0) + modules[name]['self_ms'], 3)
+    return {
+        'module': module,
+        'runs': runs,
+        'wall': summarize(walls),
+        'import_ms': modules.get(module, {}).get('cumulative_ms'),
+        'modules': modules,
+        'packages': dict(sorted(packages.items(), key=lambda item: -item[1])),
+        'lazy_violations': sorted(name for name in samples if name.split('.')[0] in LAZY_MODULES
+                                  and '.' not in name)
+    }
+
+
+def run_startup_profile(args):
+    """Report del costo di import per pacchetto e per import diretto del modulo"""
+    profile = profile_imports(args.module, args.runs)
+    print(f"Avvio a freddo di 'import {args.module}' ({args.runs} esecuzioni): "
+          f"p50 {profile['wall']['p50_ms']} ms, p95 {profile['wall']['p95_ms']} ms "
+          f"(di cui import {profile['import_ms']} ms, il resto è l'avvio dell'interprete)")
+    print(f"\n{'pacchetto':40s} {'self ms':>10s}")
+    for package, self_ms in list(profile['packages'].items())[:args.top]:
+        print(f"{package:40s} {self_ms:10.1f}")
+    direct = [(name, stats) for name, stats in profile['modules'].items() if stats['direct']]
+    print(f"\n{'import diretti di ' + args.module:40s} {'cumul. ms':>10s}")
+    for name, stats in sorted(direct, key=lambda item: -item[1]['cumulative_ms'])[:args.top]:
+        print(f"{name:40s} {stats['cumulative_ms']:10.1f}")
+
+    failed = False
+    if profile['lazy_violations']:
+        print(f"\nModuli importati all'avvio ma da caricare solo quando servono: {', '.join(profile['lazy_violations'])}")
+        failed = True
+    if args.budget_ms and profile['wall']['p50_ms'] > args.budget_ms:
+        print(f"\nBudget di avvio superato: p50 {profile['wall']['p50_ms']} ms > {args.budget_ms} ms")
+        failed = True
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, indent=2)
+    return 1 if failed else 0
+
+
+def run_benchmarks(args):
+    """Esegue le suite richieste e salva il report JSON"""
+    run_id = args.run_id or datetime.now().strftime('%Y%m%d-%H%M%S')
+    run = BenchmarkRun(run_id, args.repeat, args.warmup)
+    paths = {
+        'national': args.national_csv or NATIONAL_CSV,
+        'regional': args.regional_csv or REGIONAL_CSV,
+        'provincial': args.provincial_csv or PROVINCIAL_CSV
+    }
+    client, db_name = use_standin_database(args.mongo_uri)
+    suites = args.suite or list(SUITES)
+    for suite in suites:
+        logger.info(f"== Suite {suite} ==")
+        if suite == 'fit':
+            bench_fit(run, paths)
+        elif suite == 'geo':
+            bench_geo(run, paths)
+        elif suite == 'predict':
+            bench_predict(run, paths)
+        elif suite == 'db':
+            bench_db(run, paths, client, db_name)
+        elif suite == 'import':
+            bench_import(run, paths, client, db_name)
+        elif suite == 'api':
+            bench_api(run, paths)
+        elif suite == 'startup':
+            bench_startup(run)
+
+    report = run.to_dict({'suites': suites, 'repeat': args.repeat, 'warmup': args.warmup, 'paths': paths})
+    save_report(report, args.output_dir)
+    return report
+
+
+def save_report(report, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{report['run_id']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info(f"Report salvato in {path}")
+    return path
+
+
+# --------------------------------------------------------------------------- #
+# Scalabilità su dati sintetici                                               #
+# --------------------------------------------------------------------------- #
+
+def _parse_sizes(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def bench_scale_point(run, paths, days, client, db_name):
+    """Importazione, fit e query su un dataset sintetico; restituisce i nomi dei casi misurati"""
+    from models.prophet_model import ProphetModel
+    from models.fit_cache import fit_cache
+
+    national = _records(paths['national']['ITA'])
+    regional = _records(paths['regional'])
+    provincial = _records(paths['provincial'])
+    cases = {
+        'ingest:save_national_data': (lambda: db_manager.save_national_data(national), True),
+        'ingest:save_regional_data': (lambda: db_manager.save_regional_data(regional), True),
+        'ingest:save_provincial_data': (lambda: db_manager.save_provincial_data(provincial), True)
+    }
+    for name, (func, reset) in cases.items():
+        run.measure(name, func, setup=lambda: reset_database(client, db_name) if reset else None)
+
+    # Database popolato per le query
+    reset_database(client, db_name)
+    db_manager.save_regional_data(regional)
+    db_manager.save_provincial_data(provincial)
+    region = regional[0]['denominazione_regione']
+    province = provincial[0]['denominazione_provincia']
+    start = regional[len(regional) // 2]['data']
+    run.measure('query:get_regional_data(region)', lambda: db_manager.get_regional_data(region_name=region))
+    run.measure('query:get_regional_data(range)', lambda: db_manager.get_regional_data(start_date=start, limit=1000))
+    run.measure('query:get_provincial_data(province)', lambda: db_manager.get_provincial_data(province_name=province))
+
+    model = ProphetModel(paths['national']['ITA'], columns=['nuovi_positivi'], train_days=days)
+    run.measure('fit:ProphetModel nuovi_positivi', lambda: model.get_model('nuovi_positivi'),
+                repeat=max(1, run.repeat // 2),
+                setup=lambda: (fit_cache.clear(), model.models.clear(), model.compact_models.clear()))
+
+
+def run_scaling(args):
+    """
+    Misura come importazione, fit e query crescono con la dimensione dei dati, generando un
+    dataset sintetico per ogni combinazione di giorni di storico e numero di regioni.
+
+    mongomock non usa gli indici (ogni upsert scorre la collezione): per migliaia di aree o
+    anni di storico usare --mongo-uri con un mongod locale, altrimenti i tempi di importazione
+    misurano mongomock e non db_manager.
+    """
+    from synthetic_data import generate_dataset
+
+    run_id = args.run_id or datetime.now().strftime('scale-%Y%m%d-%H%M%S')
+    client, db_name = use_standin_database(args.mongo_uri)
+    rows = []
+    cases = {}
+    for days in _parse_sizes(args.days):
+        for regions in _parse_sizes(args.regions):
+            data_dir = os.path.join(args.work_dir, f"d{days}-r{regions}")
+            paths = generate_dataset(data_dir, ('ITA',), days, regions, args.provinces_per_region,
+                                     missing=args.missing, seed=args.seed)
+            run = BenchmarkRun(run_id, args.repeat, args.warmup)
+            logger.info(f"== Scala: {days} giorni, {regions} regioni ({paths['rows']}) ==")
+            bench_scale_point(run, paths, days, client, db_name)
+            for name, stats in run.cases.items():
+                cases[f"{name}[days={days},regions={regions}]"] = stats
+                if 'p50_ms' in stats:
+                    rows.append({'case': name, 'days': days, 'regions': regions,
+                                 'provinces': regions * args.provinces_per_region,
+                                 'rows': sum(paths['rows'].values()),
+                                 'p50_ms': stats['p50_ms'], 'p95_ms': stats['p95_ms']})
+
+    report = BenchmarkRun(run_id, args.repeat, args.warmup)
+    report.cases = cases
+    report = report.to_dict({'command': 'scale', 'days': args.days, 'regions': args.regions,
+                             'provinces_per_region': args.provinces_per_region, 'repeat': args.repeat})
+    report['scaling'] = rows
+    save_report(report, args.output_dir)
+    table = pd.DataFrame(rows)
+    table.to_csv(os.path.join(args.output_dir, f"{run_id}.csv"), index=False)
+    print_scaling(table)
+    plot_scaling(table, os.path.join(args.output_dir, f"{run_id}.png"))
+    return report
+
+
+def print_scaling(table):
+    if table.empty:
+        return
+    pivot = table.pivot_table(index=['days', 'regions', 'rows'], columns='case', values='p50_ms')
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print("p50 (ms) per dimensione dei dati")
+        print(pivot.round(2))
+
+
+def plot_scaling(table, path):
+    """Grafico log-log di p50 rispetto al numero di righe per ogni caso (richiede matplotlib)"""
+    if table.empty:
+        return None
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        logger.warning("matplotlib non disponibile: grafico di scalabilità non generato")
+        return None
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for case, group in table.groupby('case'):
+        group = group.sort_values('rows')
+        ax.plot(group['rows'], group['p50_ms'], marker='o', label=case)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('righe del dataset')
+    ax.set_ylabel('p50 (ms)')
+    ax.set_title('Scalabilità di importazione, fit e query')
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    logger.info(f"Grafico salvato in {path}")
+    return path
+
+
+# --------------------------------------------------------------------------- #
+# Confronto                                                                   #
+# --------------------------------------------------------------------------- #
+
+def load_report(run, output_dir=RESULTS_DIR):
+    """Carica un report per run id o percorso del file"""
+    path = run if os.path.exists(run) else os.path.join(output_dir, f"{run}.json")
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_reports(base, new, threshold=DEFAULT_THRESHOLD, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    Confronta due report caso per caso su p50 e p95.
+
+    Returns:
+        list: Righe di confronto; 'regression' è True se p50 o p95 peggiorano oltre la soglia
+              relativa e oltre min_delta_ms in valore assoluto
+    """
+    rows = []
+    for name, new_stats in new['cases'].items():
+        base_stats = base['cases'].get(name)
+        if not base_stats or 'p50_ms' not in base_stats or 'p50_ms' not in new_stats:
+            continue
+        row = {'case': name, 'regression': False}
+        for metric in ('p50_ms', 'p95_ms'):
+            before, after = base_stats[metric], new_stats[metric]
+            ratio = after / before if before else None
+            row[metric] = (before, after, ratio)
+            if ratio is not None and ratio > 1 + threshold and after - before > min_delta_ms:
+                row['regression'] = True
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows, base_id, new_id):
+    print(f"Confronto {base_id} -> {new_id}")
+    print(f"{'caso':70s} {'p50 prima':>10s} {'p50 dopo':>10s} {'x':>6s} {'p95 prima':>10s} {'p95 dopo':>10s} {'x':>6s}")
+    for row in rows:
+        p50, p95 = row['p50_ms'], row['p95_ms']
+        flag = '  << REGRESSIONE' if row['regression'] else ''
+        print(f"{row['case'][:70]:70s} {p50[0]:10.2f} {p50[1]:10.2f} {p50[2] or 0:6.2f} "
+              f"{p95[0]:10.2f} {p95[1]:10.2f} {p95[2] or 0:6.2f}{flag}")
+
+
+# --------------------------------------------------------------------------- #
+# Riga di comando                                                             #
+# --------------------------------------------------------------------------- #
+
+def parse_arguments(argv=None):
+    """Analizza gli argomenti dalla riga di comando"""
+    parser = argparse.ArgumentParser(description="Benchmark offline di Apollo")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Esegue i benchmark e salva il report")
+    run_parser.add_argument('--suite', choices=SUITES, action='append', help="Suite da eseguire (ripetibile, default: tutte)")
+    run_parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni misurate per caso")
+    run_parser.add_argument('--warmup', type=int, default=1, help="Ripetizioni di riscaldamento non misurate")
+    run_parser.add_argument('--run-id', help="Identificativo dell'esecuzione (default: data e ora)")
+    run_parser.add_argument('--output-dir', default=RESULTS_DIR, help="Cartella dei report")
+    run_parser.add_argument('--mongo-uri', help="mongod locale da usare al posto di mongomock")
+    run_parser.add_argument('--national-csv', help="CSV nazionale (default: dati ITA inclusi)")
+    run_parser.add_argument('--regional-csv', help="CSV regionale (default: data_cache/*-regioni-latest.csv)")
+    run_parser.add_argument('--provincial-csv', help="CSV provinciale (default: data_cache/*-province-latest.csv)")
+
+    scale_parser = subparsers.add_parser('scale', help="Scalabilità su dataset sintetici di dimensione crescente")
+    scale_parser.add_argument('--days', default='90,365', help="Giorni di storico (elenco, es. '365,1825,3650')")
+    scale_parser.add_argument('--regions', default='5,21', help="Numero di regioni (elenco)")
+    scale_parser.add_argument('--provinces-per-region', type=int, default=5, help="Province per regione")
+    scale_parser.add_argument('--missing', type=float, default=0.0, help="Frazione di valori mancanti")
+    scale_parser.add_argument('--seed', type=int, default=42, help="Seed del generatore")
+    scale_parser.add_argument('--repeat', type=int, default=3, help="Ripetizioni misurate per caso")
+    scale_parser.add_argument('--warmup', type=int, default=0, help="Ripetizioni di riscaldamento non misurate")
+    scale_parser.add_argument('--run-id', help="Identificativo dell'esecuzione")
+    scale_parser.add_argument('--work-dir', default=os.path.join(BASE_DIR, 'benchmarks', 'synthetic'),
+                              help="Cartella dei dataset generati")
+    scale_parser.add_argument('--output-dir', default=RESULTS_DIR, help="Cartella dei report")
+    scale_parser.add_argument('--mongo-uri', help="mongod locale da usare al posto di mongomock")
+
+    startup_parser = subparsers.add_parser('startup', help="Profilo del tempo di import all'avvio (python -X importtime)")
+    startup_parser.add_argument('--module', default='app', help="Modulo da importare (default: app)")
+    startup_parser.add_argument('--runs', type=int, default=5, help="Avvii a freddo da misurare")
+    startup_parser.add_argument('--top', type=int, default=20, help="Righe per tabella")
+    startup_parser.add_argument('--budget-ms', type=float, help="Tempo massimo di avvio (p50); esce con 1 se superato")
+    startup_parser.add_argument('--output', help="Salva il profilo completo in JSON")
+
+    compare_parser = subparsers.add_parser('compare', help="Confronta due esecuzioni e segnala le regressioni")
+    compare_parser.add_argument('base', help="Run id o file del report di riferimento")
+    compare_parser.add_argument('new', help="Run id o file del nuovo report")
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help="Peggioramento relativo tollerato (0.2 = +20%%)")
+    compare_parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS,
+                                help="Peggioramento assoluto minimo per segnalare una regressione")
+    compare_parser.add_argument('--output-dir', default=RESULTS_DIR, help="Cartella dei report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.command == 'run':
+        run_benchmarks(args)
+        return 0
+    if args.command == 'scale':
+        run_scaling(args)
+        return 0
+    if args.command == 'startup':
+        return run_startup_profile(args)
+    base = load_report(args.base, args.output_dir)
+    new = load_report(args.new, args.output_dir)
+    rows = compare_reports(base, new, args.threshold, args.min_delta_ms)
+    print_comparison(rows, base['run_id'], new['run_id'])
+    regressions = [row['case'] for row in rows if row['regression']]
+    if regressions:
+        print(f"\n{len(regressions)} regressioni oltre la soglia del {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Scrittore asincrono con buffer per inserimenti MongoDB fuori dal percorso della richiesta.
+
+I documenti vengono accodati in memoria e scritti da un thread in background con insert_many,
+a lotti per dimensione o per età. Se MongoDB è lento la coda si riempie e i documenti in eccesso
+finiscono in un file locale append-only (JSON lines), che viene reimportato appena le scritture
+tornano a funzionare. Alla chiusura la coda viene svuotata.
+
+Durante la reimportazione lo spill viene rinominato in un file .<pid>.replay, rimosso solo dopo la
+scrittura di tutti i documenti; i file .replay di processi terminati vengono ripresi dagli altri.
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from bson import json_util
+
+from metrics import _pid_alive
+
+logger = logging.getLogger('apollo-buffered-writer')
+
+# Attesa minima prima di ritentare la reimportazione dello spill dopo un errore
+SPILL_RETRY_SECONDS = 30
+
+
+class BufferedWriter:
+    """Coda in memoria con flush in batch su MongoDB e file di spill per le eccedenze"""
+
+    def __init__(self, write_batch, name='writer', batch_size=100, max_age=2.0,
+                 max_queue=10000, spill_path=None):
+        """
+        Args:
+            write_batch: Funzione che scrive una lista di documenti (es. collection.insert_many)
+            name: Nome usato nei log
+            batch_size: Numero di documenti che provoca un flush immediato
+            max_age: Secondi massimi di attesa del documento più vecchio prima del flush
+            max_queue: Dimensione massima della coda in memoria
+            spill_path: File JSON lines per i documenti che non entrano in coda o non vengono scritti
+        """
+        self.write_batch = write_batch
+        self.name = name
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._replay_not_before = 0.0
+        self._stats = {
+            "enqueued": 0, "written": 0, "spilled": 0, "replayed": 0,
+            "dropped": 0, "corrupt": 0, "flushes": 0, "failed_flushes": 0,
+            "last_flush_at": None, "last_error": None
+        }
+        atexit.register(self.close)
+
+    def submit(self, doc):
+        """
+        Accoda un documento senza bloccare. Se la coda è piena il documento va nel file di spill.
+
+        Returns:
+            bool: True se il documento è stato accodato o salvato nello spill
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(doc)
+            self._incr("enqueued")
+            return True
+        except queue.Full:
+            return self._spill([doc])
+
+    def flush(self, timeout=10.0):
+        """Attende che la coda venga svuotata dal thread di scrittura"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self._queue.unfinished_tasks == 0
+
+    def close(self, timeout=10.0):
+        """Ferma il thread dopo aver scritto (o messo nello spill) tutti i documenti in coda"""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        """Restituisce profondità della coda e contatori (scritti, spill, scartati...)"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["spill_pending"] = self._spill_size()
+        return stats
+
+    def _incr(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _ensure_started(self):
+        """Avvia il thread al primo utilizzo (e di nuovo nei processi figli dopo un fork)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"apollo-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Ciclo del thread: raccoglie un lotto per dimensione o età e lo scrive"""
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+            elif self.spill_path and not self._stop.is_set():
+                self._replay_spill()
+        self._drain()
+
+    def _collect_batch(self):
+        try:
+            first = self._queue.get(timeout=self.max_age)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_age
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        """Scrive tutto ciò che resta in coda (usato alla chiusura)"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.write_batch(batch)
+            self._incr("written", len(batch))
+            self._incr("flushes")
+            with self._lock:
+                self._stats["last_flush_at"] = datetime.now().isoformat()
+        except Exception as e:
+            logger.error(f"[{self.name}] Scrittura di {len(batch)} documenti fallita: {str(e)}")
+            self._incr("failed_flushes")
+            with self._lock:
+                self._stats["last_error"] = str(e)
+            self._replay_not_before = time.monotonic() + SPILL_RETRY_SECONDS
+            self._spill(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _spill(self, docs):
+        """Accoda i documenti al file di spill; se non è possibile vengono scartati"""
+        if not self.spill_path:
+            self._incr("dropped", len(docs))
+            return False
+        try:
+            with self._spill_lock:
+                os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    for doc in docs:
+                        f.write(json_util.dumps(doc) + '\n')
+            self._incr("spilled", len(docs))
+            return True
+        except Exception as e:
+            logger.error(f"[{self.name}] Impossibile scrivere il file di spill: {str(e)}")
+            self._incr("dropped", len(docs))
+            return False
+
+    def _spill_size(self):
+        try:
+            return os.path.getsize(self.spill_path) if self.spill_path else 0
+        except OSError:
+            return 0
+
+    def _read_spill(self, path):
+        """
+        Legge i documenti di un file di spill; le righe non valide vengono scartate e contate.
+
+        Returns:
+            list: Documenti letti, None se il file non è leggibile (resta su disco per un nuovo tentativo)
+        """
+        docs = []
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        docs.append(json_util.loads(line))
+                    except Exception as e:
+                        logger.error(f"[{self.name}] Riga {number} del file di spill non valida, scartata: {str(e)}")
+                        self._incr("corrupt")
+        except OSError as e:
+            logger.error(f"[{self.name}] Impossibile leggere il file di spill {path}: {str(e)}")
+            with self._lock:
+                self._stats["last_error"] = str(e)
+            return None
+        return docs
+
+    def _claim_replay(self, replay_path):
+        """
+        File da reimportare: quello del processo, un .replay lasciato da un processo terminato
+        (es. un worker riavviato) oppure lo spill corrente, rinominato in replay_path.
+
+        Returns:
+            bool: True se replay_path contiene documenti da reimportare
+        """
+        if os.path.exists(replay_path):
+            return True
+        directory = os.path.dirname(self.spill_path) or '.'
+        prefix = os.path.basename(self.spill_path) + '.'
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            names = []
+        for name in names:
+            pid = name[len(prefix):-len('.replay')] if name.startswith(prefix) and name.endswith('.replay') else ''
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                try:
+                    os.replace(os.path.join(directory, name), replay_path)
+                    logger.info(f"[{self.name}] Ripreso il file di replay del processo terminato {pid}")
+                    return True
+                except OSError:
+                    continue
+        if not self._spill_size():
+            return False
+        with self._spill_lock:
+            try:
+                os.replace(self.spill_path, replay_path)
+                return True
+            except OSError:
+                return False
+
+    def _rewrite_replay(self, replay_path, docs):
+        """Sostituisce il file di replay con i soli documenti non ancora scritti"""
+        tmp_path = replay_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for doc in docs:
+                    f.write(json_util.dumps(doc) + '\n')
+            os.replace(tmp_path, replay_path)
+        except OSError as e:
+            # Il file originale resta intatto: i documenti già scritti verranno reinviati
+            logger.error(f"[{self.name}] Impossibile aggiornare il file di replay: {str(e)}")
+
+    def _replay_spill(self):
+        """
+        Reimporta il file di spill quando la coda è vuota; in caso di errore riprova più tardi.
+        Il file di replay viene rimosso solo dopo la scrittura di tutti i documenti: dopo un
+        crash a metà reimportazione i documenti vengono reinviati (almeno una volta).
+        """
+        if time.monotonic() < self._replay_not_before:
+            return
+        replay_path = f"{self.spill_path}.{os.getpid()}.replay"
+        if not self._claim_replay(replay_path):
+            return
+        docs = self._read_spill(replay_path)
+        if docs is None:
+            self._replay_not_before = time.monotonic() + SPILL_RETRY_SECONDS
+            return
+        done = 0
+        try:
+            while done < len(docs):
+                chunk = docs[done:done + self.batch_size]
+                self.write_batch(chunk)
+                done += len(chunk)
+                self._incr("replayed", len(chunk))
+        except Exception as e:
+            logger.warning(f"[{self.name}] Reimportazione dello spill rinviata: {str(e)}")
+            with self._lock:
+                self._stats["last_error"] = str(e)
+            self._replay_not_before = time.monotonic() + SPILL_RETRY_SECONDS
+            # Nel file di replay restano solo i documenti non ancora scritti
+            self._rewrite_replay(replay_path, docs[done:])
+            return
+        try:
+            os.remove(replay_path)
+        except OSError as e:
+            logger.error(f"[{self.name}] Impossibile rimuovere il file di replay: {str(e)}")
+        logger.info(f"[{self.name}] Reimportati {len(docs)} documenti dal file di spill")
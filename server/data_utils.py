@@ -5,13 +5,20 @@
 import pandas as pd
 import numpy as np
 import os
-import requests
 from datetime import datetime, timedelta
 import logging
 import json
+import threading
 
 # Importa il gestore del database MongoDB
-from db_manager import db_manager
+from db_manager import db_manager, AREA_NAME_FIELDS, TECHNICAL_FIELDS_PROJECTION
+from metrics import metrics
+from request_timing import span
+from downsampling import downsample_cache, downsample_frame
+from result_cache import ResultCache
+from feature_pipeline import update_features, CUMULATIVE_METRICS
+from rollup_pipeline import update_rollups
+from update_bus import update_bus
 
 logger = logging.getLogger('apollo-datautils')
 
@@ -25,11 +32,9 @@ PROVINCIAL_HISTORY_URL = "https://raw.githubusercontent.com/pcm-dpc/COVID-19/mas
 
 # Percorsi per salvare i file CSV scaricati
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # Directory corrente di data_utils.py
+# La cartella viene creata al primo download (download_csv_from_url), non all'import del modulo
 DATA_CACHE_DIR = os.path.join(BASE_DIR, "data_cache")
 
-# Assicurati che la directory esista
-os.makedirs(DATA_CACHE_DIR, exist_ok=True)
-
 # Percorsi per i file locali
 LOCAL_REGIONAL_CSV_PATH = os.path.join(DATA_CACHE_DIR, "dpc-covid19-ita-regioni-latest.csv")
 LOCAL_PROVINCIAL_CSV_PATH = os.path.join(DATA_CACHE_DIR, "dpc-covid19-ita-province-latest.csv")
@@ -51,6 +56,7 @@ def download_csv_from_url(url, save_path):
     Returns:
         bool: True se il download e il salvataggio hanno avuto successo, False altrimenti.
     """
+    import requests  # usato solo per i download: non rallenta l'avvio dei worker
     try:
         # Assicurati che la directory di destinazione esista
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
@@ -83,10 +89,11 @@ def load_regional_data_from_csv(file_path):
         pandas.DataFrame: DataFrame con i dati regionali, o None se si verifica un errore.
     """
     try:
-        df = pd.read_csv(file_path)
-        # Converti la colonna 'data' in oggetti datetime
-        # Prophet si aspetta la colonna data in formato datetime
-        df['data'] = pd.to_datetime(df['data'])
+        with metrics.timer('apollo_dataset_load_duration_seconds', dataset='regional'):
+            df = pd.read_csv(file_path)
+            # Converti la colonna 'data' in oggetti datetime
+            # Prophet si aspetta la colonna data in formato datetime
+            df['data'] = pd.to_datetime(df['data'])
         print(f"Dati regionali caricati con successo da: {file_path}")
         return df
     except FileNotFoundError:
@@ -161,9 +168,10 @@ def load_provincial_data_from_csv(file_path):
         pandas.DataFrame: DataFrame con i dati provinciali, o None se si verifica un errore.
     """
     try:
-        df = pd.read_csv(file_path)
-        # Converti la colonna 'data' in oggetti datetime
-        df['data'] = pd.to_datetime(df['data'])
+        with metrics.timer('apollo_dataset_load_duration_seconds', dataset='provincial'):
+            df = pd.read_csv(file_path)
+            # Converti la colonna 'data' in oggetti datetime
+            df['data'] = pd.to_datetime(df['data'])
         logger.info(f"Dati provinciali caricati con successo da: {file_path} - {len(df)} record")
         return df
     except FileNotFoundError:
@@ -369,6 +377,26 @@ def download_historical_data(force_download=False):
         
     return result
 
+def _update_features_after_import(area_type, df, save_result):
+    """Aggiorna il feature store dopo un'importazione, senza interromperla in caso di errore"""
+    if 'first_changed' not in save_result:
+        return None
+    try:
+        return update_features(area_type, df, save_result.get('first_changed'))
+    except Exception as e:
+        logger.error(f"Errore nel calcolo delle feature {area_type}: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def _update_rollups_after_import(area_type, df, save_result):
+    """Aggiorna i rollup settimanali e mensili dopo un'importazione, senza interromperla in caso di errore"""
+    if 'first_changed' not in save_result:
+        return None
+    try:
+        return update_rollups(area_type, df, save_result.get('first_changed'))
+    except Exception as e:
+        logger.error(f"Errore nel calcolo dei rollup {area_type}: {str(e)}")
+        return {"success": False, "error": str(e)}
+
 def import_historical_data_to_mongodb(force_download=False):
     """
     Importa tutti i dati storici (nazionali, regionali e provinciali) in MongoDB
@@ -376,20 +404,25 @@ def import_historical_data_to_mongodb(force_download=False):
     # Scarica i dati storici se necessario (solo regionali e provinciali)
     download_result = download_historical_data(force_download)
     result = {
-        "national": {"success": False, "inserted": 0, "updated": 0, "errors": 0},
-        "regional": {"success": False, "inserted": 0, "updated": 0, "errors": 0},
-        "provincial": {"success": False, "inserted": 0, "updated": 0, "errors": 0}
+        "national": {"success": False, "inserted": 0, "updated": 0, "unchanged": 0, "errors": 0},
+        "regional": {"success": False, "inserted": 0, "updated": 0, "unchanged": 0, "errors": 0},
+        "provincial": {"success": False, "inserted": 0, "updated": 0, "unchanged": 0, "errors": 0}
     }
     # Importa dati nazionali
     try:
         if os.path.exists(LOCAL_NATIONAL_CSV_PATH):
-            df_national = pd.read_csv(LOCAL_NATIONAL_CSV_PATH)
-            df_national['data'] = pd.to_datetime(df_national['data'])
+            with metrics.timer('apollo_dataset_load_duration_seconds', dataset='national', source='import'):
+                df_national = pd.read_csv(LOCAL_NATIONAL_CSV_PATH)
+                df_national['data'] = pd.to_datetime(df_national['data'])
             national_data = df_national.to_dict('records')
             national_result = db_manager.save_national_data(national_data)
             result["national"] = national_result
             logger.info(f"Importazione dati nazionali completata: {len(national_data)} record elaborati")
-            logger.info(f"Risultato: {national_result['inserted']} inseriti, {national_result['updated']} aggiornati")
+            logger.info(f"Risultato: {national_result['inserted']} inseriti, {national_result['updated']} aggiornati, "
+                        f"{national_result.get('unchanged', 0)} invariati")
+            # Ricalcola le feature solo per le date modificate
+            result["national"]["features"] = _update_features_after_import('national', df_national, national_result)
+            result["national"]["rollups"] = _update_rollups_after_import('national', df_national, national_result)
         else:
             logger.error(f"File dati nazionali non trovato: {LOCAL_NATIONAL_CSV_PATH}")
             result["national"]["errors"] += 1
@@ -400,9 +433,10 @@ def import_historical_data_to_mongodb(force_download=False):
     if download_result["regional"]["success"]:
         try:
             # Carica il CSV
-            df_regional = pd.read_csv(LOCAL_REGIONAL_HISTORY_PATH)
-            # Converti la colonna data in oggetti datetime
-            df_regional['data'] = pd.to_datetime(df_regional['data'])
+            with metrics.timer('apollo_dataset_load_duration_seconds', dataset='regional', source='import'):
+                df_regional = pd.read_csv(LOCAL_REGIONAL_HISTORY_PATH)
+                # Converti la colonna data in oggetti datetime
+                df_regional['data'] = pd.to_datetime(df_regional['data'])
             
             # Prepara i dati per l'inserimento in MongoDB
             regional_data = df_regional.to_dict('records')
@@ -412,7 +446,11 @@ def import_historical_data_to_mongodb(force_download=False):
             result["regional"] = regional_result
             
             logger.info(f"Importazione dati regionali completata: {len(regional_data)} record elaborati")
-            logger.info(f"Risultato: {regional_result['inserted']} inseriti, {regional_result['updated']} aggiornati")
+            logger.info(f"Risultato: {regional_result['inserted']} inseriti, {regional_result['updated']} aggiornati, "
+                        f"{regional_result.get('unchanged', 0)} invariati")
+            # Ricalcola le feature solo per le date modificate
+            result["regional"]["features"] = _update_features_after_import('regional', df_regional, regional_result)
+            result["regional"]["rollups"] = _update_rollups_after_import('regional', df_regional, regional_result)
         except Exception as e:
             logger.error(f"Errore durante l'importazione dei dati regionali: {str(e)}")
             result["regional"]["errors"] += 1
@@ -421,9 +459,10 @@ def import_historical_data_to_mongodb(force_download=False):
     if download_result["provincial"]["success"]:
         try:
             # Carica il CSV
-            df_provincial = pd.read_csv(LOCAL_PROVINCIAL_HISTORY_PATH)
-            # Converti la colonna data in oggetti datetime
-            df_provincial['data'] = pd.to_datetime(df_provincial['data'])
+            with metrics.timer('apollo_dataset_load_duration_seconds', dataset='provincial', source='import'):
+                df_provincial = pd.read_csv(LOCAL_PROVINCIAL_HISTORY_PATH)
+                # Converti la colonna data in oggetti datetime
+                df_provincial['data'] = pd.to_datetime(df_provincial['data'])
             
             # Prepara i dati per l'inserimento in MongoDB
             provincial_data = df_provincial.to_dict('records')
@@ -433,11 +472,20 @@ def import_historical_data_to_mongodb(force_download=False):
             result["provincial"] = provincial_result
             
             logger.info(f"Importazione dati provinciali completata: {len(provincial_data)} record elaborati")
-            logger.info(f"Risultato: {provincial_result['inserted']} inseriti, {provincial_result['updated']} aggiornati")
+            logger.info(f"Risultato: {provincial_result['inserted']} inseriti, {provincial_result['updated']} aggiornati, "
+                        f"{provincial_result.get('unchanged', 0)} invariati")
+            # Ricalcola le feature solo per le date modificate
+            result["provincial"]["features"] = _update_features_after_import('provincial', df_provincial, provincial_result)
+            result["provincial"]["rollups"] = _update_rollups_after_import('provincial', df_provincial, provincial_result)
         except Exception as e:
             logger.error(f"Errore durante l'importazione dei dati provinciali: {str(e)}")
             result["provincial"]["errors"] += 1
     
+    # Notifica ai client (stream SSE) i livelli modificati, con il nuovo token di versione
+    for data_type, level_result in result.items():
+        if level_result.get("inserted") or level_result.get("updated"):
+            update_bus.publish('dataset', data_type=data_type, version=db_manager.get_data_version(data_type),
+                               inserted=level_result["inserted"], updated=level_result["updated"])
     return result
 
 def get_available_regions():
@@ -509,6 +557,217 @@ def get_available_provinces(region_name=None):
         return []
 
 
+# Istantanee per (livello, giorno, regione, versione dei dati)
+snapshot_cache = ResultCache(max_entries=int(os.environ.get('SNAPSHOT_CACHE_ENTRIES', 128)))
+# CSV indicizzati per data usati quando il database non è disponibile: livello -> (percorso, mtime, df, giorni)
+_snapshot_frames = {}
+_snapshot_frames_lock = threading.Lock()
+
+
+def _clean_snapshot_row(row):
+    """Data in formato YYYY-MM-DD, altre date in ISO e NaN -> None"""
+    clean = {}
+    for key, value in row.items():
+        if isinstance(value, float) and np.isnan(value):
+            value = None
+        elif isinstance(value, datetime):
+            value = value.strftime('%Y-%m-%d') if key == 'data' else value.isoformat()
+        clean[key] = value
+    return clean
+
+
+def _snapshot_frame(area_type):
+    """CSV storico (o, in mancanza, il più recente) del livello, ordinato e indicizzato per giorno"""
+    if area_type == 'regional':
+        paths = (LOCAL_REGIONAL_HISTORY_PATH, LOCAL_REGIONAL_CSV_PATH)
+    else:
+        paths = (LOCAL_PROVINCIAL_HISTORY_PATH, LOCAL_PROVINCIAL_CSV_PATH)
+    path = next((p for p in paths if os.path.exists(p)), None)
+    if path is None:
+        return None
+    mtime = os.path.getmtime(path)
+    with _snapshot_frames_lock:
+        cached = _snapshot_frames.get(area_type)
+    if cached and cached[0] == path and cached[1] == mtime:
+        return cached
+    with metrics.timer('apollo_dataset_load_duration_seconds', dataset=area_type, source='snapshot'), span('csv'):
+        df = pd.read_csv(path)
+        df['data'] = pd.to_datetime(df['data'])
+        df = df.sort_values('data').reset_index(drop=True)
+    entry = (path, mtime, df, df['data'].values.astype('datetime64[D]'))
+    with _snapshot_frames_lock:
+        _snapshot_frames[area_type] = entry
+    return entry
+
+
+def _csv_snapshot(frame, day, region_name=None):
+    """Sezione trasversale di un giorno del CSV indicizzato (ricerca binaria sui giorni)"""
+    _, _, df, days = frame
+    target = days[-1] if day is None else np.datetime64(day.strftime('%Y-%m-%d'), 'D')
+    lo, hi = np.searchsorted(days, target, 'left'), np.searchsorted(days, target, 'right')
+    rows = df.iloc[lo:hi]
+    if region_name:
+        rows = rows[rows['denominazione_regione'] == region_name]
+    return pd.Timestamp(target), rows.astype(object).where(rows.notna(), None).to_dict('records')
+
+
+def get_area_snapshot(area_type, day=None, region_name=None):
+    """
+    Dati di tutte le regioni o province per un giorno (per le mappe coropletiche).
+
+    Legge con una sola query dal database (indice per data) oppure, se il database non è
+    disponibile, dal CSV locale indicizzato per giorno. Il risultato è in cache per giorno,
+    regione e versione dei dati, quindi un nuovo import non restituisce istantanee vecchie.
+
+    Args:
+        area_type: 'regional' o 'provincial'
+        day: Giorno richiesto (datetime); None = giorno più recente disponibile
+        region_name: Per le province, solo quelle della regione indicata
+
+    Returns:
+        dict: {'date', 'source', 'data'} oppure None se non ci sono dati per il giorno
+    """
+    version = db_manager.get_data_version(area_type)
+    if version is not None:
+        source, frame = 'database', None
+    else:
+        frame = _snapshot_frame(area_type)
+        if frame is None:
+            return None
+        source, version = 'csv', frame[1]
+    day_key = day.strftime('%Y-%m-%d') if day else None
+
+    def compute():
+        if source == 'database':
+            target = day or db_manager.get_latest_date(area_type)
+            rows = db_manager.get_snapshot(area_type, target, region_name) if target else []
+        else:
+            target, rows = _csv_snapshot(frame, day, region_name)
+        if area_type == 'provincial':
+            # Esclude le pseudo-province DPC non rappresentabili su una mappa
+            # ("Fuori Regione" 8xx, "In fase di definizione" 9xx)
+            rows = [r for r in rows if not (pd.notna(r.get('codice_provincia')) and r['codice_provincia'] >= 800)]
+        if not rows:
+            return None
+        return {'date': target.strftime('%Y-%m-%d'), 'source': source,
+                'data': [_clean_snapshot_row(r) for r in rows]}
+
+    return snapshot_cache.get_or_compute((area_type, day_key, region_name, version), compute)
+
+
+# Ultimi giorni di una regione o provincia per (livello, area, giorni, versione dei dati)
+AREA_HISTORY_DAYS = 30
+area_history_cache = ResultCache(max_entries=int(os.environ.get('AREA_HISTORY_CACHE_ENTRIES', 256)))
+# Giorni letti in più prima della finestra: incrementi giornalieri e medie a 7 giorni del primo giorno
+AREA_HISTORY_LOOKBACK = 7
+
+
+def _with_derived_metrics(df):
+    """
+    Aggiunge a una serie di un'area (ordinata per data) le metriche derivate, in modo vettoriale:
+    incrementi giornalieri delle cumulative ('<metrica>_giornalieri'), medie mobili a 7 giorni
+    ('_ma7') e tasso di positività, con gli stessi nomi del feature store.
+    """
+    df = df.copy()
+    for metric in CUMULATIVE_METRICS:
+        if metric in df.columns:
+            daily = pd.to_numeric(df[metric], errors='coerce').diff()
+            df[f'{metric}_giornalieri'] = daily
+            df[f'{metric}_giornalieri_ma7'] = daily.rolling(7).mean().round(2)
+    if 'nuovi_positivi' in df.columns:
+        new_cases = pd.to_numeric(df['nuovi_positivi'], errors='coerce')
+        df['nuovi_positivi_ma7'] = new_cases.rolling(7).mean().round(2)
+        if 'tamponi' in df.columns:
+            positivity = new_cases / pd.to_numeric(df['tamponi'], errors='coerce').diff() * 100
+            df['tasso_positivita'] = positivity.replace([np.inf, -np.inf], np.nan).fillna(0).round(2)
+    return df
+
+
+def get_area_history(area_type, area_name, days=AREA_HISTORY_DAYS):
+    """
+    Ultimi giorni di dati di una regione o provincia con le metriche derivate, senza modelli.
+
+    Legge dal database solo la finestra richiesta (più AREA_HISTORY_LOOKBACK giorni per gli
+    incrementi e le medie mobili) senza i campi tecnici, oppure, se il database non è
+    disponibile, dal CSV storico locale. Il risultato è in cache per area, giorni e versione
+    dei dati.
+
+    Args:
+        area_type: 'regional' o 'provincial'
+        area_name: Nome della regione o della provincia
+        days: Numero di giorni da restituire
+
+    Returns:
+        dict: {'source', 'version', 'data'} oppure None se l'area non ha dati
+    """
+    area_col = AREA_NAME_FIELDS[area_type]
+    version = db_manager.get_data_version(area_type)
+    if version is not None:
+        source, frame = 'database', None
+    else:
+        frame = _snapshot_frame(area_type)
+        if frame is None:
+            return None
+        source, version = 'csv', frame[1]
+
+    def compute():
+        if source == 'database':
+            latest = db_manager.get_latest_date(area_type)
+            if latest is None:
+                return None
+            start = latest - timedelta(days=days - 1 + AREA_HISTORY_LOOKBACK)
+            if area_type == 'regional':
+                rows = db_manager.get_regional_data(region_name=area_name, start_date=start,
+                                                    projection=TECHNICAL_FIELDS_PROJECTION)
+            else:
+                rows = db_manager.get_provincial_data(province_name=area_name, start_date=start,
+                                                      projection=TECHNICAL_FIELDS_PROJECTION)
+            df = pd.DataFrame(rows)
+        else:
+            df = frame[2]
+            df = df[df[area_col] == area_name].tail(days + AREA_HISTORY_LOOKBACK)
+        if df.empty:
+            return None
+        if not pd.api.types.is_datetime64_any_dtype(df['data']):
+            df = df.assign(data=pd.to_datetime(df['data']))
+        df = _with_derived_metrics(df.sort_values('data').reset_index(drop=True)).tail(days)
+        return {'source': source, 'version': version, 'data': CovidDataProcessor._to_records(df)}
+
+    with span('history'):
+        return area_history_cache.get_or_compute((area_type, area_name, days, version), compute)
+
+
+def area_changed_since(area_type, area_name, history, since):
+    """
+    Prima data da restituire a un client che ha già i dati fino a since (sincronizzazione incrementale).
+
+    Con una versione del database i documenti aggiunti o corretti dopo di essa sono individuati
+    dal campo 'updated_at' scritto dall'importazione (indice dedicato); le metriche derivate
+    cambiano dal primo giorno modificato in poi, quindi basta restituire le righe da quel giorno.
+
+    Args:
+        area_type: 'regional' o 'provincial'
+        area_name: Nome della regione o della provincia
+        history: Risultato di get_area_history
+        since: Data (datetime, il client ha le righe fino a quel giorno) o token di versione (str)
+
+    Returns:
+        tuple: (prima data da restituire, None se non è cambiato nulla; True se il client deve
+        sostituire tutti i suoi dati perché la versione non è confrontabile)
+    """
+    if isinstance(since, datetime):
+        return since + timedelta(days=1), False
+    if since == str(history['version']):
+        return None, False
+    if history['source'] != 'database':
+        return None, True
+    try:
+        since = datetime.fromisoformat(since)
+    except ValueError:
+        return None, True
+    return db_manager.get_first_changed_date(area_type, since, area_name), False
+
+
 def validate_forecast_data(forecast_data):
     """
     Verifica che i dati di previsione siano in un formato valido e serializzabile
@@ -607,6 +866,42 @@ def process_prophet_forecast(forecast_data):
     logger.warning("Formato dati di previsione non riconosciuto dopo la validazione")
     return []
 
+# Processori già caricati per paese: country_code -> (mtime del CSV, CovidDataProcessor)
+_processors = {}
+_processors_lock = threading.Lock()
+
+
+def get_processor(country_code="ITA"):
+    """
+    Restituisce un CovidDataProcessor con i dati già caricati, condiviso dal processo.
+    Il CSV viene riletto solo se il file è cambiato (mtime); i chiamanti non devono
+    modificare national_data (usare .copy()).
+
+    Returns:
+        CovidDataProcessor o None se i dati del paese non sono disponibili
+    """
+    code = country_code.upper()
+    path = CovidDataProcessor.get_data_file_for_country(code)
+    try:
+        mtime = os.path.getmtime(path) if path else None
+    except OSError:
+        mtime = None
+    if mtime is None:
+        logger.error(f"File dati non trovato per il paese: {code}")
+        return None
+    with _processors_lock:
+        cached = _processors.get(code)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    processor = CovidDataProcessor(country_code=code)
+    # Le righe invariate rispetto al CSV precedente mantengono la loro versione (since=)
+    if not processor.load_data(previous=cached[1] if cached else None) or processor.national_data is None:
+        return None
+    with _processors_lock:
+        _processors[code] = (mtime, processor)
+    return processor
+
+
 class CovidDataProcessor:
     """Classe per il caricamento e l'elaborazione dei dati COVID-19 per qualsiasi paese"""
 
@@ -631,30 +926,139 @@ class CovidDataProcessor:
         self.country_code = country_code.upper()
         self.national_file = self.get_data_file_for_country(self.country_code)
         self.national_data = None
+        # Colonna data ordinata (datetime64) per la ricerca binaria delle finestre temporali
+        self.dates = None
+        # Versione del dataset (mtime del CSV) usata nelle chiavi delle cache
+        self.version = None
+        # Per ogni riga: impronta dei valori e versione del caricamento in cui è cambiata l'ultima volta
+        self.row_hashes = None
+        self.row_versions = None
         self.prepared_data = {}
         self.last_update = None
 
-    def load_data(self):
-        """Carica i dati dai file CSV"""
+    def load_data(self, previous=None):
+        """Carica i dati dai file CSV
+
+        Args:
+            previous: Processore del caricamento precedente: le righe con la stessa data e gli
+                      stessi valori ne ereditano la versione, le altre prendono quella nuova
+        """
         try:
             # Carica dati nazionali per il paese richiesto
             if not self.national_file or not os.path.exists(self.national_file):
                 logger.error(f"File dati non trovato per il paese: {self.country_code}")
                 self.national_data = None
                 return False
-            self.national_data = pd.read_csv(self.national_file)
-            # Converti la colonna data in datetime
-            self.national_data['data'] = pd.to_datetime(self.national_data['data'])
-            # Ordina per data
-            self.national_data = self.national_data.sort_values('data')
+            with metrics.timer('apollo_dataset_load_duration_seconds', dataset='national', country=self.country_code), \
+                    span('csv'):
+                self.national_data = pd.read_csv(self.national_file)
+                # Converti la colonna data in datetime
+                self.national_data['data'] = pd.to_datetime(self.national_data['data'])
+                # Ordina per data
+                self.national_data = self.national_data.sort_values('data').reset_index(drop=True)
+                self.dates = self.national_data['data'].values
             # Aggiorna timestamp dell'ultimo aggiornamento
             self.last_update = datetime.now()
+            self.version = os.path.getmtime(self.national_file)
+            self._track_row_changes(previous)
             logger.info(f"Dati caricati per {self.country_code}: {len(self.national_data)} record da {self.national_data['data'].min().strftime('%Y-%m-%d')}")
             return True
         except Exception as e:
             logger.error(f"Errore nel caricamento dei dati per {self.country_code}: {str(e)}")
             self.national_data = None
+            self.dates = None
             return False
+
+    def _track_row_changes(self, previous):
+        """Versione di ogni riga: quella del caricamento precedente se la riga è invariata"""
+        self.row_hashes = pd.util.hash_pandas_object(self.national_data, index=False).values
+        self.row_versions = np.full(len(self.row_hashes), self.version)
+        if previous is None or previous.row_hashes is None:
+            return
+        known = pd.Index(previous.dates)
+        if not known.is_unique:
+            return
+        # Posizione di ogni data nel caricamento precedente (-1 = riga nuova)
+        pos = known.get_indexer(self.dates)
+        unchanged = pos >= 0
+        unchanged[unchanged] = previous.row_hashes[pos[unchanged]] == self.row_hashes[unchanged]
+        self.row_versions[unchanged] = previous.row_versions[pos[unchanged]]
+
+    def changed_since(self, since):
+        """
+        Prima data da restituire a un client che ha già i dati fino a since (sincronizzazione incrementale)
+
+        Args:
+            since: Data (datetime, il client ha le righe fino a quel giorno) o token di versione (str)
+
+        Returns:
+            tuple: (prima data da restituire, None se non è cambiato nulla; True se il client deve
+            sostituire tutti i suoi dati perché la versione non è riconosciuta)
+        """
+        if isinstance(since, datetime):
+            return pd.Timestamp(since) + pd.Timedelta(days=1), False
+        if self.row_versions is None and not self.load_data():
+            return None, True
+        try:
+            since = float(since)
+        except ValueError:
+            return None, True
+        changed = self.row_versions > since
+        if not changed.any():
+            return None, False
+        # Le date sono ordinate: la prima riga modificata è la più vecchia
+        return pd.Timestamp(self.dates[int(changed.argmax())]), False
+
+    def get_history(self, start=None, end=None, fields=None, cursor=None, limit=None, default_rows=None,
+                    max_points=None, since=None):
+        """Restituisce una finestra dei dati nazionali, individuata con ricerca binaria sulla data
+
+        Args:
+            start: Primo giorno incluso (Timestamp o None)
+            end: Ultimo giorno incluso (Timestamp o None)
+            fields: Colonne da restituire ('data' è sempre inclusa); None = tutte
+            cursor: Ultimo giorno della pagina precedente: si riparte dal giorno successivo
+            limit: Numero massimo di righe della pagina
+            default_rows: Senza start/end, la finestra è limitata alle prime N righe
+            max_points: Riduce la pagina con LTTB ad al più max_points righe (in cache)
+            since: Solo le righe della finestra dal giorno indicato in poi (vedi changed_since)
+
+        Returns:
+            (records, next_cursor, total): righe con data 'YYYY-MM-DD' e NaN -> None, cursore della
+            pagina successiva (None se la finestra è esaurita), righe totali della finestra
+        """
+        if self.national_data is None and not self.load_data():
+            return [], None, 0
+        dates = self.dates
+        one_day = np.timedelta64(1, 'D')
+        if start is None and end is None and default_rows is not None:
+            lo, hi = 0, min(default_rows, len(dates))
+        else:
+            lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start, 'D'), 'left'))
+            hi = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(end, 'D') + one_day, 'left'))
+        if since is not None:
+            lo = max(lo, int(np.searchsorted(dates, np.datetime64(since, 'D'), 'left')))
+        total = max(hi - lo, 0)
+        if cursor is not None:
+            lo = max(lo, int(np.searchsorted(dates, np.datetime64(cursor, 'D') + one_day, 'left')))
+        stop = hi if limit is None else min(hi, lo + limit)
+        window = self.national_data.iloc[lo:max(stop, lo)]
+        if fields:
+            window = window[['data'] + [f for f in fields if f != 'data']]
+        next_cursor = window['data'].iloc[-1].strftime('%Y-%m-%d') if stop < hi and len(window) else None
+        if max_points is not None and len(window) > max_points:
+            key = ('national', self.country_code, self.version, lo, stop, tuple(fields or ()), max_points)
+            records = downsample_cache.get_or_compute(
+                key, lambda: self._to_records(downsample_frame(window, max_points)))
+            return records, next_cursor, total
+        return self._to_records(window), next_cursor, total
+
+    @staticmethod
+    def _to_records(df):
+        """Righe per le API: data 'YYYY-MM-DD' e NaN -> None"""
+        records = df.astype(object).where(df.notna(), None)
+        records['data'] = df['data'].dt.strftime('%Y-%m-%d')
+        return records.to_dict(orient='records')
     
     def prepare_timeseries(self, column="nuovi_positivi"):
         """Prepara una serie temporale per l'analisi e previsione
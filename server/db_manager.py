@@ -4,16 +4,32 @@ Fornisce funzionalità per salvare e recuperare dati COVID nazionali, regionali
 """
 
 import os
+import json
+import time
+import math
+import hashlib
 import logging
 import pymongo
-from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
-import redis
+from datetime import datetime, timedelta
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, BulkWriteError
+
+from buffered_writer import BufferedWriter
+from metrics import metrics as apollo_metrics
+from request_timing import traced
+from update_bus import update_bus
 
 # Configurazione logging
 logger = logging.getLogger('apollo-db-manager')
 
+# Latenza ed errori delle operazioni MongoDB (label operation = nome del metodo)
+_db_metrics = apollo_metrics.timed('apollo_db_operation_duration_seconds', errors_name='apollo_db_operation_errors_total')
+
+
+def db_timed(func):
+    """Metriche Prometheus e span 'mongo' della richiesta corrente per un metodo di DatabaseManager"""
+    return traced('mongo')(_db_metrics(func))
+
 # Configurazione del database
 # In un ambiente di produzione, queste informazioni dovrebbero essere in un file .env
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
@@ -27,6 +43,70 @@ COLLECTION_METADATA = 'metadata'
 COLLECTION_MODEL_REGISTRY = 'model_registry'
 COLLECTION_FEATURE_STORE = 'feature_store'
 COLLECTION_AB_TEST_RESULTS = 'ab_test_results'
+COLLECTION_BACKTEST_RESULTS = 'backtest_results'
+COLLECTION_ROLLUPS = 'rollups'
+
+# Chiave univoca di un risultato di backtesting
+BACKTEST_KEY_FIELDS = ('area_type', 'area_name', 'indicator', 'horizon', 'model_version')
+
+# Campo con l'impronta del contenuto di ogni documento importato
+FINGERPRINT_FIELD = 'content_hash'
+# Campi tecnici esclusi dal calcolo dell'impronta
+FINGERPRINT_EXCLUDED_FIELDS = ('_id', 'imported_at', 'updated_at', FINGERPRINT_FIELD)
+# Numero di record elaborati per ogni bulk_write
+SAVE_BATCH_SIZE = 1000
+
+# Campo che identifica l'area per livello geografico e campi tecnici esclusi dalle letture per le API
+AREA_NAME_FIELDS = {
+    'national': None,
+    'regional': 'denominazione_regione',
+    'provincial': 'denominazione_provincia'
+}
+DATA_COLLECTIONS = {
+    'national': COLLECTION_NATIONAL,
+    'regional': COLLECTION_REGIONAL,
+    'provincial': COLLECTION_PROVINCIAL
+}
+TECHNICAL_FIELDS_PROJECTION = {"_id": 0, FINGERPRINT_FIELD: 0, "imported_at": 0, "updated_at": 0}
+# Secondi di validità della versione dei dati letta dai metadati (chiave delle cache delle API)
+DATA_VERSION_TTL = float(os.environ.get('DATA_VERSION_TTL', 30))
+
+# Scrittura asincrona dei risultati A/B test
+AB_TEST_BATCH_SIZE = int(os.environ.get('AB_TEST_BATCH_SIZE', 100))
+AB_TEST_FLUSH_SECONDS = float(os.environ.get('AB_TEST_FLUSH_SECONDS', 2.0))
+AB_TEST_MAX_QUEUE = int(os.environ.get('AB_TEST_MAX_QUEUE', 10000))
+AB_TEST_SPILL_PATH = os.environ.get(
+    'AB_TEST_SPILL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spill', 'ab_test_results.jsonl')
+)
+
+def _normalize_value(value):
+    """Porta un valore in forma canonica (NaN -> None, tipi numpy -> Python, date -> ISO)"""
+    if hasattr(value, 'item') and not isinstance(value, (list, dict, str)):
+        # Scalari numpy/pandas
+        try:
+            value = value.item()
+        except (ValueError, AttributeError):
+            pass
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def compute_fingerprint(item):
+    """
+    Calcola l'impronta SHA-1 del contenuto di un documento.
+    
+    I campi tecnici (id, timestamp di importazione, impronta stessa) sono esclusi, così due
+    importazioni degli stessi dati DPC producono la stessa impronta.
+    """
+    payload = {k: _normalize_value(v) for k, v in item.items() if k not in FINGERPRINT_EXCLUDED_FIELDS}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
 
 class DatabaseManager:
     """Classe per gestire le operazioni con il database MongoDB e la cache Redis"""
@@ -42,6 +122,10 @@ class DatabaseManager:
             cls._instance.is_connected = False
             # Redis
             cls._instance.redis_client = None
+            # Scrittore asincrono dei risultati A/B test
+            cls._instance.ab_test_writer = None
+            # Versioni dei dati per tipo: data_type -> (scadenza, versione)
+            cls._instance._data_versions = {}
         return cls._instance
     
     def connect(self):
@@ -67,6 +151,17 @@ class DatabaseManager:
             self.is_connected = False
             return False
     
+    def use_client(self, client, db_name=DB_NAME):
+        """
+        Usa un client MongoDB già creato al posto della connessione a MONGO_URI
+        (ad es. mongomock o un mongod locale per benchmark e load test)
+        """
+        self.client = client
+        self.db = client[db_name]
+        self.is_connected = True
+        self._create_indices()
+        return True
+    
     def _create_indices(self):
         """Crea gli indici necessari per ottimizzare le query"""
         try:
@@ -85,6 +180,34 @@ class DatabaseManager:
                 ("data", pymongo.ASCENDING)
             ], unique=True)
             
+            # Indici per data usati dalla lettura delle impronte durante l'importazione
+            self.db[COLLECTION_REGIONAL].create_index([("data", pymongo.ASCENDING)])
+            self.db[COLLECTION_PROVINCIAL].create_index([("data", pymongo.ASCENDING)])
+            
+            # Indici per istante di modifica usati dalla sincronizzazione incrementale (since=)
+            for collection_name in (COLLECTION_NATIONAL, COLLECTION_REGIONAL, COLLECTION_PROVINCIAL):
+                self.db[collection_name].create_index([("updated_at", pymongo.ASCENDING)])
+            
+            # Indice composito per area e data nel feature store
+            self.db[COLLECTION_FEATURE_STORE].create_index([
+                ("area_type", pymongo.ASCENDING),
+                ("area_name", pymongo.ASCENDING),
+                ("data", pymongo.ASCENDING)
+            ], unique=True)
+            
+            # Indice composito per la lettura dei rollup di un'area in un intervallo di periodi
+            self.db[COLLECTION_ROLLUPS].create_index([
+                ("area_type", pymongo.ASCENDING),
+                ("granularity", pymongo.ASCENDING),
+                ("area_name", pymongo.ASCENDING),
+                ("period_start", pymongo.ASCENDING)
+            ], unique=True)
+            
+            # Indice univoco per la lettura dell'accuratezza per area, indicatore e orizzonte
+            self.db[COLLECTION_BACKTEST_RESULTS].create_index(
+                [(field, pymongo.ASCENDING) for field in BACKTEST_KEY_FIELDS], unique=True
+            )
+            
             logger.info("Indici MongoDB creati o verificati")
             
         except Exception as e:
@@ -97,6 +220,7 @@ class DatabaseManager:
             self.is_connected = False
             logger.info("Connessione a MongoDB chiusa")
     
+    @db_timed
     def save_national_data(self, data_list):
         """
         Salva o aggiorna i dati nazionali
@@ -107,49 +231,9 @@ class DatabaseManager:
         Returns:
             dict: Risultato dell'operazione con conteggi
         """
-        if not self.is_connected and not self.connect():
-            return {"success": False, "error": "Connessione al database non disponibile"}
-        
-        if not data_list:
-            return {"success": False, "error": "Nessun dato fornito"}
-        
-        collection = self.db[COLLECTION_NATIONAL]
-        result = {"inserted": 0, "updated": 0, "errors": 0}
-        
-        for item in data_list:
-            try:
-                # Assicurati che la data sia in formato datetime
-                if isinstance(item.get('data'), str):
-                    item['data'] = datetime.fromisoformat(item['data'].replace('Z', '+00:00'))
-                
-                # Aggiungi timestamp di importazione
-                item['imported_at'] = datetime.now()
-                
-                # Usa upsert per inserire o aggiornare
-                update_result = collection.update_one(
-                    {"data": item['data']},  # filtro per trovare il documento
-                    {"$set": item},  # dati da aggiornare
-                    upsert=True  # crea se non esiste
-                )
-                
-                if update_result.upserted_id:
-                    result["inserted"] += 1
-                elif update_result.modified_count:
-                    result["updated"] += 1
-                    
-            except Exception as e:
-                logger.error(f"Errore nel salvataggio dei dati nazionali: {str(e)}")
-                result["errors"] += 1
-        
-        # Aggiorna metadata
-        self._update_metadata("national", {
-            "last_update": datetime.now(),
-            "record_count": collection.count_documents({})
-        })
-        
-        result["success"] = result["errors"] == 0
-        return result
+        return self._save_records(COLLECTION_NATIONAL, ("data",), data_list, "national", "nazionali")
     
+    @db_timed
     def save_regional_data(self, data_list):
         """
         Salva o aggiorna i dati regionali
@@ -160,52 +244,10 @@ class DatabaseManager:
         Returns:
             dict: Risultato dell'operazione con conteggi
         """
-        if not self.is_connected and not self.connect():
-            return {"success": False, "error": "Connessione al database non disponibile"}
-        
-        if not data_list:
-            return {"success": False, "error": "Nessun dato fornito"}
-        
-        collection = self.db[COLLECTION_REGIONAL]
-        result = {"inserted": 0, "updated": 0, "errors": 0}
-        
-        for item in data_list:
-            try:
-                # Assicurati che la data sia in formato datetime
-                if isinstance(item.get('data'), str):
-                    item['data'] = datetime.fromisoformat(item['data'].replace('Z', '+00:00'))
-                
-                # Aggiungi timestamp di importazione
-                item['imported_at'] = datetime.now()
-                
-                # Usa upsert per inserire o aggiornare
-                update_result = collection.update_one(
-                    {
-                        "denominazione_regione": item['denominazione_regione'],
-                        "data": item['data']
-                    },
-                    {"$set": item},
-                    upsert=True
-                )
-                
-                if update_result.upserted_id:
-                    result["inserted"] += 1
-                elif update_result.modified_count:
-                    result["updated"] += 1
-                    
-            except Exception as e:
-                logger.error(f"Errore nel salvataggio dei dati regionali: {str(e)}")
-                result["errors"] += 1
-        
-        # Aggiorna metadata
-        self._update_metadata("regional", {
-            "last_update": datetime.now(),
-            "record_count": collection.count_documents({})
-        })
-        
-        result["success"] = result["errors"] == 0
-        return result
+        return self._save_records(COLLECTION_REGIONAL, ("denominazione_regione", "data"),
+                                  data_list, "regional", "regionali")
     
+    @db_timed
     def save_provincial_data(self, data_list):
         """
         Salva o aggiorna i dati provinciali
@@ -216,54 +258,165 @@ class DatabaseManager:
         Returns:
             dict: Risultato dell'operazione con conteggi
         """
+        return self._save_records(COLLECTION_PROVINCIAL, ("denominazione_provincia", "data"),
+                                  data_list, "provincial", "provinciali")
+    
+    def _save_records(self, collection_name, key_fields, data_list, data_type, label):
+        """
+        Upsert condizionale di una lista di documenti basato sull'impronta del contenuto.
+        
+        Per ogni lotto vengono lette (con proiezione) le impronte già salvate: i documenti
+        identici vengono saltati, quelli nuovi o modificati vengono scritti con un'unica
+        bulk_write. 'imported_at' e 'updated_at' vengono aggiornati solo sulle modifiche reali,
+        quindi una reimportazione di dati invariati costa quanto una lettura. Tutti i documenti
+        modificati da un'importazione hanno lo stesso 'updated_at', salvato anche come
+        'last_change' nei metadati: è la versione dei dati usata dalle API con since=.
+        
+        Args:
+            collection_name: Nome della collezione di destinazione
+            key_fields: Campi che identificano univocamente un documento
+            data_list: Lista di dizionari da salvare
+            data_type: Tipo di dati per i metadati ('national', 'regional', 'provincial')
+            label: Etichetta usata nei messaggi di log
+            
+        Returns:
+            dict: Risultato con conteggi inserted/updated/unchanged/errors
+        """
         if not self.is_connected and not self.connect():
             return {"success": False, "error": "Connessione al database non disponibile"}
         
         if not data_list:
             return {"success": False, "error": "Nessun dato fornito"}
         
-        collection = self.db[COLLECTION_PROVINCIAL]
-        result = {"inserted": 0, "updated": 0, "errors": 0}
+        collection = self.db[collection_name]
+        result = {"inserted": 0, "updated": 0, "unchanged": 0, "errors": 0}
+        # Prima data modificata per area (None per i dati nazionali), usata per i ricalcoli incrementali
+        first_changed = {}
+        # Istante dell'importazione, uguale per tutti i documenti modificati
+        now = datetime.now()
         
-        for item in data_list:
+        for start in range(0, len(data_list), SAVE_BATCH_SIZE):
+            # Normalizza il lotto e calcola le impronte; a parità di chiave vince l'ultimo record
+            batch = {}
+            for item in data_list[start:start + SAVE_BATCH_SIZE]:
+                try:
+                    # Assicurati che la data sia in formato datetime
+                    if isinstance(item.get('data'), str):
+                        item['data'] = datetime.fromisoformat(item['data'].replace('Z', '+00:00'))
+                    key = tuple(_normalize_value(item[field]) for field in key_fields)
+                    batch[key] = (item, compute_fingerprint(item))
+                except Exception as e:
+                    logger.error(f"Errore nella preparazione dei dati {label}: {str(e)}")
+                    result["errors"] += 1
+            
+            if not batch:
+                continue
+            
             try:
-                # Assicurati che la data sia in formato datetime
-                if isinstance(item.get('data'), str):
-                    item['data'] = datetime.fromisoformat(item['data'].replace('Z', '+00:00'))
-                
-                # Aggiungi timestamp di importazione
-                item['imported_at'] = datetime.now()
-                
-                # Usa upsert per inserire o aggiornare
-                update_result = collection.update_one(
-                    {
-                        "denominazione_provincia": item['denominazione_provincia'],
-                        "data": item['data']
-                    },
-                    {"$set": item},
-                    upsert=True
-                )
-                
-                if update_result.upserted_id:
-                    result["inserted"] += 1
-                elif update_result.modified_count:
-                    result["updated"] += 1
-                    
+                existing = self._fetch_fingerprints(collection, key_fields, batch)
             except Exception as e:
-                logger.error(f"Errore nel salvataggio dei dati provinciali: {str(e)}")
-                result["errors"] += 1
+                logger.error(f"Errore nella lettura delle impronte dei dati {label}: {str(e)}")
+                result["errors"] += len(batch)
+                continue
+            
+            operations = []
+            for key, (item, fingerprint) in batch.items():
+                if existing.get(key) == fingerprint:
+                    continue
+                area = item[key_fields[0]] if len(key_fields) > 1 else None
+                if area not in first_changed or item['data'] < first_changed[area]:
+                    first_changed[area] = item['data']
+                key_filter = {field: item[field] for field in key_fields}
+                doc = {k: v for k, v in item.items() if k != '_id'}
+                doc[FINGERPRINT_FIELD] = fingerprint
+                doc['imported_at'] = now
+                doc['updated_at'] = now
+                if key in existing:
+                    # Aggiorna solo se l'impronta salvata è ancora diversa
+                    key_filter[FINGERPRINT_FIELD] = {"$ne": fingerprint}
+                    operations.append(UpdateOne(key_filter, {"$set": doc}))
+                else:
+                    operations.append(UpdateOne(key_filter, {"$set": doc}, upsert=True))
+            
+            if not operations:
+                result["unchanged"] += len(batch)
+                continue
+            
+            try:
+                write_result = collection.bulk_write(operations, ordered=False)
+                inserted = write_result.upserted_count
+                updated = write_result.modified_count
+                errors = 0
+            except BulkWriteError as e:
+                details = e.details or {}
+                inserted = details.get("nUpserted", 0)
+                updated = details.get("nModified", 0)
+                errors = len(details.get("writeErrors", []))
+                logger.error(f"Errore nel salvataggio dei dati {label}: {errors} scritture fallite")
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio dei dati {label}: {str(e)}")
+                inserted, updated, errors = 0, 0, len(operations)
+            
+            result["inserted"] += inserted
+            result["updated"] += updated
+            result["errors"] += errors
+            result["unchanged"] += len(batch) - inserted - updated - errors
         
         # Aggiorna metadata
-        self._update_metadata("provincial", {
+        metadata = {
             "last_update": datetime.now(),
             "record_count": collection.count_documents({})
-        })
+        }
+        if result["inserted"] or result["updated"]:
+            metadata["last_change"] = now
+        self._update_metadata(data_type, metadata)
         
+        logger.info(f"Dati {label}: {result['inserted']} inseriti, {result['updated']} aggiornati, "
+                    f"{result['unchanged']} invariati, {result['errors']} errori")
+        result["first_changed"] = first_changed
         result["success"] = result["errors"] == 0
         return result
     
+    def _fetch_fingerprints(self, collection, key_fields, batch):
+        """
+        Legge le impronte già salvate per le chiavi di un lotto.
+        
+        I documenti importati prima dell'introduzione dell'impronta vengono letti per intero:
+        se il contenuto coincide l'impronta viene solo aggiunta, senza toccare i timestamp.
+        
+        Returns:
+            dict: Mappa chiave -> impronta salvata (None se diversa/assente)
+        """
+        dates = list({item['data'] for item, _ in batch.values()})
+        projection = {field: 1 for field in key_fields}
+        projection[FINGERPRINT_FIELD] = 1
+        
+        existing = {}
+        legacy_ids = []
+        for doc in collection.find({"data": {"$in": dates}}, projection):
+            key = tuple(_normalize_value(doc.get(field)) for field in key_fields)
+            if key not in batch:
+                continue
+            existing[key] = doc.get(FINGERPRINT_FIELD)
+            if existing[key] is None:
+                legacy_ids.append(doc["_id"])
+        
+        if legacy_ids:
+            backfill = []
+            for doc in collection.find({"_id": {"$in": legacy_ids}}):
+                key = tuple(_normalize_value(doc.get(field)) for field in key_fields)
+                fingerprint = compute_fingerprint(doc)
+                if batch[key][1] == fingerprint:
+                    existing[key] = fingerprint
+                    backfill.append(UpdateOne({"_id": doc["_id"]}, {"$set": {FINGERPRINT_FIELD: fingerprint}}))
+            if backfill:
+                collection.bulk_write(backfill, ordered=False)
+        
+        return existing
+    
     def _update_metadata(self, data_type, metadata):
         """Aggiorna i metadati per un tipo di dati"""
+        self._data_versions.pop(data_type, None)
         try:
             self.db[COLLECTION_METADATA].update_one(
                 {"data_type": data_type},
@@ -273,7 +426,52 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Errore nell'aggiornamento dei metadati: {str(e)}")
     
-    def get_regional_data(self, region_name=None, start_date=None, end_date=None, limit=None):
+    @db_timed
+    def get_national_data(self, start_date=None, end_date=None, limit=None):
+        """
+        Recupera i dati nazionali dal database
+        
+        Args:
+            start_date: Data di inizio per il filtro (opzionale)
+            end_date: Data di fine per il filtro (opzionale)
+            limit: Numero massimo di risultati (opzionale)
+            
+        Returns:
+            list: Lista di dati nazionali
+        """
+        if not self.is_connected and not self.connect():
+            logger.error("Impossibile connettersi al database")
+            return []
+        
+        collection = self.db[COLLECTION_NATIONAL]
+        query = {}
+        
+        # Filtro per date
+        if start_date or end_date:
+            query["data"] = {}
+            if start_date:
+                query["data"]["$gte"] = start_date if isinstance(start_date, datetime) else datetime.fromisoformat(start_date)
+            if end_date:
+                query["data"]["$lte"] = end_date if isinstance(end_date, datetime) else datetime.fromisoformat(end_date)
+        
+        # Esegui query
+        cursor = collection.find(query).sort("data", pymongo.ASCENDING)
+        
+        # Applica limite se specificato
+        if limit:
+            cursor = cursor.limit(limit)
+        
+        # Converti risultati in lista
+        results = list(cursor)
+        
+        # Converti ObjectId in stringa per serializzazione JSON
+        for item in results:
+            item["_id"] = str(item["_id"])
+        
+        return results
+    
+    @db_timed
+    def get_regional_data(self, region_name=None, start_date=None, end_date=None, limit=None, projection=None):
         """
         Recupera i dati regionali dal database
         
@@ -282,6 +480,7 @@ class DatabaseManager:
             start_date: Data di inizio per il filtro (opzionale)
             end_date: Data di fine per il filtro (opzionale)
             limit: Numero massimo di risultati (opzionale)
+            projection: Campi da restituire o escludere (opzionale, es. TECHNICAL_FIELDS_PROJECTION)
             
         Returns:
             list: Lista di dati regionali
@@ -306,7 +505,7 @@ class DatabaseManager:
                 query["data"]["$lte"] = end_date if isinstance(end_date, datetime) else datetime.fromisoformat(end_date)
         
         # Esegui query
-        cursor = collection.find(query).sort("data", pymongo.ASCENDING)
+        cursor = collection.find(query, projection).sort("data", pymongo.ASCENDING)
         
         # Applica limite se specificato
         if limit:
@@ -317,11 +516,14 @@ class DatabaseManager:
         
         # Converti ObjectId in stringa per serializzazione JSON
         for item in results:
-            item["_id"] = str(item["_id"])
+            if "_id" in item:
+                item["_id"] = str(item["_id"])
         
         return results
     
-    def get_provincial_data(self, province_name=None, region_name=None, start_date=None, end_date=None, limit=None):
+    @db_timed
+    def get_provincial_data(self, province_name=None, region_name=None, start_date=None, end_date=None, limit=None,
+                            projection=None):
         """
         Recupera i dati provinciali dal database
         
@@ -331,6 +533,7 @@ class DatabaseManager:
             start_date: Data di inizio per il filtro (opzionale)
             end_date: Data di fine per il filtro (opzionale)
             limit: Numero massimo di risultati (opzionale)
+            projection: Campi da restituire o escludere (opzionale, es. TECHNICAL_FIELDS_PROJECTION)
             
         Returns:
             list: Lista di dati provinciali
@@ -358,7 +561,7 @@ class DatabaseManager:
                 query["data"]["$lte"] = end_date if isinstance(end_date, datetime) else datetime.fromisoformat(end_date)
         
         # Esegui query
-        cursor = collection.find(query).sort("data", pymongo.ASCENDING)
+        cursor = collection.find(query, projection).sort("data", pymongo.ASCENDING)
         
         # Applica limite se specificato
         if limit:
@@ -369,10 +572,82 @@ class DatabaseManager:
         
         # Converti ObjectId in stringa per serializzazione JSON
         for item in results:
-            item["_id"] = str(item["_id"])
+            if "_id" in item:
+                item["_id"] = str(item["_id"])
         
         return results
     
+    def get_data_version(self, data_type):
+        """
+        Versione dei dati di un livello: istante dell'ultima importazione che ha modificato dei record.
+        Letta dai metadati con una validità di DATA_VERSION_TTL secondi (subito aggiornata dopo
+        un'importazione nello stesso processo); None se il database non è disponibile.
+        """
+        cached = self._data_versions.get(data_type)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        if not self.is_connected and not self.connect():
+            # Anche l'indisponibilità resta valida per il TTL: niente timeout di connessione a ogni richiesta
+            self._data_versions[data_type] = (time.monotonic() + DATA_VERSION_TTL, None)
+            return None
+        doc = self.db[COLLECTION_METADATA].find_one({"data_type": data_type}, {"last_change": 1, "last_update": 1})
+        changed = (doc or {}).get("last_change") or (doc or {}).get("last_update")
+        version = changed.isoformat() if changed else "0"
+        self._data_versions[data_type] = (time.monotonic() + DATA_VERSION_TTL, version)
+        return version
+
+    @db_timed
+    def get_latest_date(self, area_type):
+        """Data più recente presente per un livello geografico (None se non ci sono dati)"""
+        if not self.is_connected and not self.connect():
+            return None
+        doc = self.db[DATA_COLLECTIONS[area_type]].find_one({}, {"data": 1}, sort=[("data", pymongo.DESCENDING)])
+        return doc["data"] if doc else None
+
+    @db_timed
+    def get_first_changed_date(self, area_type, since, area_name=None):
+        """
+        Prima data (campo 'data') tra i documenti aggiunti o modificati dopo since
+        
+        Args:
+            area_type: Tipo di area ('national', 'regional', 'provincial')
+            since: Istante di riferimento (versione dei dati del client)
+            area_name: Nome della regione o provincia (opzionale)
+            
+        Returns:
+            datetime: Data più vecchia modificata, None se non ci sono modifiche
+        """
+        if not self.is_connected and not self.connect():
+            return None
+        query = {"updated_at": {"$gt": since}}
+        if area_name and AREA_NAME_FIELDS[area_type]:
+            query[AREA_NAME_FIELDS[area_type]] = area_name
+        doc = self.db[DATA_COLLECTIONS[area_type]].find_one(query, {"data": 1}, sort=[("data", pymongo.ASCENDING)])
+        return doc["data"] if doc else None
+
+    @db_timed
+    def get_snapshot(self, area_type, day, region_name=None):
+        """
+        Dati di tutte le aree di un livello per un giorno, con una sola query sull'indice per data
+        
+        Args:
+            area_type: Tipo di area ('regional', 'provincial')
+            day: Giorno richiesto (datetime; conta solo la data)
+            region_name: Per le province, filtra per regione (opzionale)
+            
+        Returns:
+            list: Documenti senza _id e campi tecnici, ordinati per area
+        """
+        if not self.is_connected and not self.connect():
+            return []
+        start = datetime(day.year, day.month, day.day)
+        query = {"data": {"$gte": start, "$lt": start + timedelta(days=1)}}
+        if region_name:
+            query["denominazione_regione"] = region_name
+        cursor = self.db[DATA_COLLECTIONS[area_type]].find(query, TECHNICAL_FIELDS_PROJECTION)
+        return sorted(cursor, key=lambda doc: doc.get(AREA_NAME_FIELDS[area_type]) or "")
+
+    @db_timed
     def get_prophet_ready_data(self, area_type, area_name, metric_column='nuovi_positivi'):
         """
         Recupera i dati già formattati per Prophet (ds, y)
@@ -419,6 +694,7 @@ class DatabaseManager:
         
         return results
     
+    @db_timed
     def get_available_regions(self):
         """Recupera l'elenco delle regioni disponibili nel database"""
         if not self.is_connected and not self.connect():
@@ -426,6 +702,7 @@ class DatabaseManager:
             
         return self.db[COLLECTION_REGIONAL].distinct("denominazione_regione")
     
+    @db_timed
     def get_available_provinces(self, region_name=None):
         """
         Recupera l'elenco delle province disponibili
@@ -446,8 +723,9 @@ class DatabaseManager:
         return self.db[COLLECTION_PROVINCIAL].distinct("denominazione_provincia", query)
 
     def connect_redis(self, host='localhost', port=6379, db=0):
-        """Connessione a Redis"""
+        """Connessione a Redis (il client redis viene importato solo qui)"""
         try:
+            import redis
             self.redis_client = redis.Redis(host=host, port=port, db=db, decode_responses=True)
             # Test connessione
             self.redis_client.ping()
@@ -460,17 +738,33 @@ class DatabaseManager:
 
     def cache_set(self, key, value, ex=60):
         """Salva un valore in cache Redis (default: 60s)"""
-        if self.redis_client:
+        if not self.redis_client:
+            apollo_metrics.inc('apollo_redis_cache_requests_total', op='set', result='unavailable')
+            return
+        try:
             self.redis_client.set(key, value, ex=ex)
+        except Exception:
+            apollo_metrics.inc('apollo_redis_cache_requests_total', op='set', result='error')
+            raise
+        apollo_metrics.inc('apollo_redis_cache_requests_total', op='set', result='ok')
 
     def cache_get(self, key):
         """Recupera un valore dalla cache Redis"""
-        if self.redis_client:
-            return self.redis_client.get(key)
-        return None
+        if not self.redis_client:
+            apollo_metrics.inc('apollo_redis_cache_requests_total', op='get', result='unavailable')
+            return None
+        try:
+            value = self.redis_client.get(key)
+        except Exception:
+            apollo_metrics.inc('apollo_redis_cache_requests_total', op='get', result='error')
+            raise
+        apollo_metrics.inc('apollo_redis_cache_requests_total', op='get', result='hit' if value is not None else 'miss')
+        return value
 
-    def register_model(self, model_name, area_type, area_name, version, file_path, metrics=None, note=None):
-        """Registra un nuovo modello Prophet nel model registry"""
+    @db_timed
+    def register_model(self, model_name, area_type, area_name, version, file_path, metrics=None, note=None,
+                       compact_path=None):
+        """Registra un nuovo modello Prophet nel model registry (compact_path: JSON per la sola previsione)"""
         if not self.is_connected and not self.connect():
             return False
         doc = {
@@ -483,9 +777,14 @@ class DatabaseManager:
             "metrics": metrics or {},
             "note": note or ""
         }
+        if compact_path:
+            doc["compact_path"] = compact_path
         self.db[COLLECTION_MODEL_REGISTRY].insert_one(doc)
+        update_bus.publish('model', model_name=model_name, area_type=area_type, area_name=area_name,
+                           version=version, created_at=doc["created_at"].isoformat())
         return True
 
+    @db_timed
     def get_latest_model(self, model_name, area_type, area_name=None):
         """Recupera l'ultimo modello registrato per nome/area"""
         if not self.is_connected and not self.connect():
@@ -496,6 +795,7 @@ class DatabaseManager:
         doc = self.db[COLLECTION_MODEL_REGISTRY].find(query).sort("created_at", -1).limit(1)
         return next(doc, None)
 
+    @db_timed
     def list_models(self, area_type=None, area_name=None):
         """Elenca tutti i modelli registrati, opzionalmente filtrando per area"""
         if not self.is_connected and not self.connect():
@@ -509,42 +809,226 @@ class DatabaseManager:
 
     def save_features(self, area_type, area_name, features_list):
         """Salva una lista di feature (dict) per una certa area nel feature store"""
-        if not self.is_connected and not self.connect():
-            return False
         # Ogni elemento di features_list deve avere almeno 'data' e le feature
-        for feat in features_list:
-            doc = {
-                "area_type": area_type,
-                "area_name": area_name,
-                "data": feat["data"],
-                "features": {k: v for k, v in feat.items() if k != "data"}
-            }
-            # upsert per data/area
-            self.db[COLLECTION_FEATURE_STORE].update_one(
-                {"area_type": area_type, "area_name": area_name, "data": feat["data"]},
-                {"$set": doc},
-                upsert=True
-            )
-        return True
+        records = [dict(feat, area_name=area_name) for feat in features_list]
+        return self.save_features_bulk(area_type, records).get("success", False)
 
+    @db_timed
+    def save_features_bulk(self, area_type, records):
+        """
+        Salva nel feature store le feature di più aree con operazioni bulk
+        
+        Args:
+            area_type: Tipo di area ('national', 'regional', 'provincial')
+            records: Lista di dict con 'area_name', 'data' e le feature
+            
+        Returns:
+            dict: Risultato dell'operazione con conteggi
+        """
+        if not self.is_connected and not self.connect():
+            return {"success": False, "error": "Connessione al database non disponibile"}
+        
+        collection = self.db[COLLECTION_FEATURE_STORE]
+        result = {"inserted": 0, "updated": 0, "errors": 0}
+        now = datetime.now()
+        
+        for start in range(0, len(records), SAVE_BATCH_SIZE):
+            operations = []
+            for rec in records[start:start + SAVE_BATCH_SIZE]:
+                key = {"area_type": area_type, "area_name": rec["area_name"], "data": rec["data"]}
+                doc = dict(key, updated_at=now,
+                           features={k: v for k, v in rec.items() if k not in ("area_name", "data")})
+                # upsert per data/area
+                operations.append(UpdateOne(key, {"$set": doc}, upsert=True))
+            try:
+                write_result = collection.bulk_write(operations, ordered=False)
+                result["inserted"] += write_result.upserted_count
+                result["updated"] += write_result.modified_count
+            except BulkWriteError as e:
+                details = e.details or {}
+                result["inserted"] += details.get("nUpserted", 0)
+                result["updated"] += details.get("nModified", 0)
+                result["errors"] += len(details.get("writeErrors", []))
+                logger.error(f"Errore nel salvataggio delle feature {area_type}: {str(e)}")
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio delle feature {area_type}: {str(e)}")
+                result["errors"] += len(operations)
+        
+        result["success"] = result["errors"] == 0
+        return result
+
+    @db_timed
     def get_features(self, area_type, area_name, start_date=None, end_date=None):
         """Recupera le feature per una certa area e intervallo di date"""
         if not self.is_connected and not self.connect():
             return []
+        return list(self.iter_features(area_type, area_name, start_date, end_date, include_id=True))
+
+    def iter_features(self, area_type, area_name, start_date=None, end_date=None,
+                      fields=None, after=None, limit=None, include_id=False):
+        """
+        Restituisce un cursore sulle feature di un'area, ordinato per data
+        
+        Args:
+            area_type: Tipo di area ('national', 'regional', 'provincial')
+            area_name: Nome dell'area
+            start_date: Data di inizio (inclusa, opzionale)
+            end_date: Data di fine (inclusa, opzionale)
+            fields: Lista di feature da restituire (proiezione lato server, opzionale)
+            after: Cursore di paginazione: solo date strettamente successive (opzionale)
+            limit: Numero massimo di documenti (opzionale)
+            include_id: Se False l'_id viene escluso dalla proiezione
+            
+        Returns:
+            Cursor: Cursore MongoDB (lista vuota se il database non è disponibile)
+        """
+        if not self.is_connected and not self.connect():
+            return iter([])
         query = {"area_type": area_type, "area_name": area_name}
-        if start_date or end_date:
+        if start_date or end_date or after:
             query["data"] = {}
             if start_date:
                 query["data"]["$gte"] = start_date
             if end_date:
                 query["data"]["$lte"] = end_date
-        cursor = self.db[COLLECTION_FEATURE_STORE].find(query).sort("data", 1)
-        return list(cursor)
+            if after:
+                query["data"]["$gt"] = after
+        projection = None
+        if fields or not include_id:
+            projection = {"_id": 1 if include_id else 0}
+            if fields:
+                projection.update({"area_type": 1, "area_name": 1, "data": 1})
+                projection.update({f"features.{field}": 1 for field in fields})
+        cursor = self.db[COLLECTION_FEATURE_STORE].find(query, projection).sort("data", 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
 
-    def log_ab_test_result(self, area_type, area_name, model_used, prediction, input_data=None, note=None):
-        """Logga un risultato di A/B test nel database"""
+    @db_timed
+    def save_rollups_bulk(self, area_type, granularity, records):
+        """
+        Salva (upsert) i rollup di più aree e periodi con operazioni bulk
+        
+        Args:
+            area_type: Tipo di area ('national', 'regional', 'provincial')
+            granularity: Granularità dei periodi ('weekly', 'monthly')
+            records: Lista di dict con 'area_name', 'period_start' e le statistiche del periodo
+            
+        Returns:
+            dict: Risultato dell'operazione con conteggi
+        """
         if not self.is_connected and not self.connect():
-            return False
+            return {"success": False, "error": "Connessione al database non disponibile"}
+        
+        collection = self.db[COLLECTION_ROLLUPS]
+        result = {"inserted": 0, "updated": 0, "errors": 0}
+        now = datetime.now()
+        
+        for start in range(0, len(records), SAVE_BATCH_SIZE):
+            operations = []
+            for rec in records[start:start + SAVE_BATCH_SIZE]:
+                key = {"area_type": area_type, "granularity": granularity,
+                       "area_name": rec["area_name"], "period_start": rec["period_start"]}
+                doc = dict(rec, **key, updated_at=now)
+                operations.append(UpdateOne(key, {"$set": doc}, upsert=True))
+            try:
+                write_result = collection.bulk_write(operations, ordered=False)
+                result["inserted"] += write_result.upserted_count
+                result["updated"] += write_result.modified_count
+            except BulkWriteError as e:
+                details = e.details or {}
+                result["inserted"] += details.get("nUpserted", 0)
+                result["updated"] += details.get("nModified", 0)
+                result["errors"] += len(details.get("writeErrors", []))
+                logger.error(f"Errore nel salvataggio dei rollup {area_type}: {str(e)}")
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio dei rollup {area_type}: {str(e)}")
+                result["errors"] += len(operations)
+        
+        result["success"] = result["errors"] == 0
+        return result
+
+    @db_timed
+    def get_rollups(self, area_type, granularity, area_name, start_date=None, end_date=None, fields=None):
+        """
+        Recupera i rollup di un'area ordinati per periodo
+        
+        Args:
+            area_type: Tipo di area ('national', 'regional', 'provincial')
+            granularity: Granularità dei periodi ('weekly', 'monthly')
+            area_name: Nome dell'area
+            start_date: Solo i periodi che terminano da questa data in poi (opzionale)
+            end_date: Solo i periodi che iniziano entro questa data (opzionale)
+            fields: Metriche da restituire (proiezione lato server, opzionale)
+            
+        Returns:
+            list: Documenti senza _id, con period_start, period_end, days e stats
+        """
+        if not self.is_connected and not self.connect():
+            return []
+        query = {"area_type": area_type, "granularity": granularity, "area_name": area_name}
+        if start_date:
+            query["period_end"] = {"$gte": start_date}
+        if end_date:
+            query["period_start"] = {"$lte": end_date}
+        projection = {"_id": 0, "updated_at": 0}
+        if fields:
+            projection = {"_id": 0, "area_name": 1, "period_start": 1, "period_end": 1, "days": 1}
+            projection.update({f"stats.{field}": 1 for field in fields})
+        return list(self.db[COLLECTION_ROLLUPS].find(query, projection).sort("period_start", 1))
+
+    @db_timed
+    def save_backtest_results(self, results):
+        """
+        Salva (upsert) i risultati di backtesting, uno per area, indicatore, orizzonte e versione del modello
+        
+        Args:
+            results: Lista di dict con i campi di BACKTEST_KEY_FIELDS e le metriche
+            
+        Returns:
+            dict: Risultato dell'operazione con conteggi
+        """
+        if not self.is_connected and not self.connect():
+            return {"success": False, "error": "Connessione al database non disponibile"}
+        
+        collection = self.db[COLLECTION_BACKTEST_RESULTS]
+        result = {"inserted": 0, "updated": 0, "errors": 0}
+        now = datetime.now()
+        
+        for start in range(0, len(results), SAVE_BATCH_SIZE):
+            operations = []
+            for rec in results[start:start + SAVE_BATCH_SIZE]:
+                key = {field: rec[field] for field in BACKTEST_KEY_FIELDS}
+                operations.append(UpdateOne(key, {"$set": dict(rec, updated_at=now)}, upsert=True))
+            try:
+                write_result = collection.bulk_write(operations, ordered=False)
+                result["inserted"] += write_result.upserted_count
+                result["updated"] += write_result.modified_count
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio dei risultati di backtesting: {str(e)}")
+                result["errors"] += len(operations)
+        
+        result["success"] = result["errors"] == 0
+        return result
+
+    @db_timed
+    def get_backtest_results(self, area_type, area_name, indicator, model_version, horizon=None):
+        """Recupera i risultati di backtesting di un'area e indicatore (tutti gli orizzonti o uno solo)"""
+        if not self.is_connected and not self.connect():
+            return []
+        query = {"area_type": area_type, "area_name": area_name,
+                 "indicator": indicator, "model_version": model_version}
+        if horizon is not None:
+            query["horizon"] = horizon
+        return list(self.db[COLLECTION_BACKTEST_RESULTS].find(query, {"_id": 0}).sort("horizon", 1))
+
+    def log_ab_test_result(self, area_type, area_name, model_used, prediction, input_data=None, note=None):
+        """
+        Logga un risultato di A/B test nel database.
+        
+        Il documento viene solo accodato: la scrittura avviene in batch in background
+        (vedi BufferedWriter), quindi la chiamata non attende MongoDB.
+        """
         doc = {
             "timestamp": datetime.now(),
             "area_type": area_type,
@@ -554,8 +1038,43 @@ class DatabaseManager:
             "prediction": prediction,
             "note": note or ""
         }
-        self.db[COLLECTION_AB_TEST_RESULTS].insert_one(doc)
-        return True
+        return self._get_ab_test_writer().submit(doc)
+
+    def flush_ab_test_results(self, timeout=10.0):
+        """Attende la scrittura dei risultati A/B test ancora in coda"""
+        if self.ab_test_writer is None:
+            return True
+        return self.ab_test_writer.flush(timeout)
+
+    def get_ab_test_writer_stats(self):
+        """Restituisce profondità della coda e contatori dello scrittore dei risultati A/B test"""
+        return self._get_ab_test_writer().stats()
+
+    def _get_ab_test_writer(self):
+        """Crea al primo utilizzo lo scrittore asincrono dei risultati A/B test"""
+        if self.ab_test_writer is None:
+            self.ab_test_writer = BufferedWriter(
+                self._insert_ab_test_batch,
+                name='ab-test-writer',
+                batch_size=AB_TEST_BATCH_SIZE,
+                max_age=AB_TEST_FLUSH_SECONDS,
+                max_queue=AB_TEST_MAX_QUEUE,
+                spill_path=AB_TEST_SPILL_PATH
+            )
+        return self.ab_test_writer
+
+    @db_timed
+    def _insert_ab_test_batch(self, docs):
+        """Scrive un lotto di risultati A/B test (chiamato dal thread dello scrittore)"""
+        if not self.is_connected and not self.connect():
+            raise ConnectionFailure("Connessione al database non disponibile")
+        try:
+            self.db[COLLECTION_AB_TEST_RESULTS].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # I documenti già presenti (es. reimportati dallo spill) non sono un errore
+            errors = (e.details or {}).get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
 
 # Singleton instance
 db_manager = DatabaseManager()
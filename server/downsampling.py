@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Riduzione delle serie temporali per i grafici (Largest-Triangle-Three-Buckets).
+
+LTTB divide la serie in max_points - 2 bucket e da ciascuno tiene il punto che forma il
+triangolo di area massima con il punto scelto nel bucket precedente e con la media del bucket
+successivo: picchi e cambi di pendenza restano visibili anche con pochi punti.
+Le medie dei bucket e le aree sono calcolate con NumPy; resta un ciclo Python per bucket
+(la scelta dipende dal punto precedente), quindi il costo è O(n) con max_points iterazioni.
+
+Con più metriche nella stessa risposta le righe devono restare condivise (una riga = una data):
+le aree di ogni metrica, normalizzate per la sua escursione, vengono sommate e ogni bucket tiene
+la data che le massimizza. Con una sola metrica è l'LTTB classico; la risposta ha comunque al
+più max_points righe.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from result_cache import ResultCache
+
+MAX_POINTS_LIMIT = 5000
+DOWNSAMPLE_CACHE_ENTRIES = int(os.environ.get('DOWNSAMPLE_CACHE_ENTRIES', 256))
+
+# Serie ridotte per (serie, metriche, max_points, versione del dataset)
+downsample_cache = ResultCache(max_entries=DOWNSAMPLE_CACHE_ENTRIES)
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Indici dei punti scelti da LTTB.
+
+    Args:
+        x: Ascisse crescenti (es. giorni)
+        y: Valori della serie, oppure matrice (punti x metriche); i NaN non contribuiscono alle aree
+        max_points: Numero di punti da restituire
+
+    Returns:
+        numpy.ndarray: Indici ordinati dei punti tenuti (primo e ultimo sempre inclusi)
+    """
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1][:max_points])
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if y.ndim == 1:
+        y = y[:, None]
+    else:
+        # Le metriche senza valori non contribuiscono; le altre pesano allo stesso modo
+        y = y[:, ~np.isnan(y).all(axis=0)]
+        if y.shape[1] == 0:
+            return np.linspace(0, n - 1, max_points).astype(np.int64)
+        span = np.nanmax(y, axis=0) - np.nanmin(y, axis=0)
+        y = y / np.where(np.isfinite(span) & (span > 0), span, 1.0)
+    valid = ~np.isnan(y)
+    y_filled = np.where(valid, y, 0.0)
+    # Inizio dei bucket interni; l'ultimo "bucket" è il solo punto finale
+    every = (n - 2) / (max_points - 2)
+    starts = (np.floor(np.arange(max_points - 1) * every) + 1).astype(np.int64)
+    counts = np.diff(np.append(starts, n))
+    avg_x = np.add.reduceat(x, starts) / counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_y = np.add.reduceat(y_filled, starts, axis=0) / np.add.reduceat(valid, starts, axis=0)
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = starts[i], starts[i + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        # Doppio dell'area del triangolo (a, b, c) per ogni b del bucket e ogni metrica
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi, None]) * (cy - ay))
+        a = lo + int(np.argmax(np.nansum(area, axis=1)))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_frame(df, max_points, columns=None, x_col='data'):
+    """
+    Riduce un DataFrame ordinato per x_col ad al più max_points righe con LTTB sulle metriche.
+
+    Args:
+        df: DataFrame ordinato per data
+        max_points: Numero massimo di righe
+        columns: Metriche da considerare (default: tutte le colonne numeriche)
+        x_col: Colonna delle ascisse (date)
+
+    Returns:
+        pandas.DataFrame: Sottoinsieme delle righe di df (lo stesso df se è già abbastanza corto)
+    """
+    if max_points is None or len(df) <= max_points:
+        return df
+    if columns is None:
+        columns = [c for c in df.columns if c != x_col and pd.api.types.is_numeric_dtype(df[c])]
+    if not columns:
+        return df.iloc[np.linspace(0, len(df) - 1, max_points).astype(np.int64)]
+    x = pd.to_datetime(df[x_col]).values.astype('datetime64[s]').astype(np.int64) / 86400.0
+    y = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        return df.iloc[lttb_indices(x, y, max_points)]
+
+
+def downsample_records(records, max_points, cache_key=None, x_col='data'):
+    """
+    Riduce una lista di righe (dict con data e metriche) ordinata per data.
+
+    Args:
+        records: Righe da ridurre
+        max_points: Numero massimo di righe (None = nessuna riduzione)
+        cache_key: Chiave della serie comprensiva della versione del dataset; None = nessuna cache
+        x_col: Campo delle date
+
+    Returns:
+        list: Righe tenute, nello stesso formato dell'input
+    """
+    if max_points is None or not records or len(records) <= max_points:
+        return records
+
+    def compute():
+        df = pd.DataFrame(records)
+        return [records[i] for i in downsample_frame(df.reset_index(drop=True), max_points, x_col=x_col).index]
+
+    if cache_key is None:
+        return compute()
+    return downsample_cache.get_or_compute((cache_key, max_points), compute)
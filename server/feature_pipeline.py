@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline di feature engineering per il feature store di Apollo Project.
+
+Calcola in un unico passaggio vettoriale (groupby per area) le feature derivate dai dati DPC:
+- lag a 1, 7 e 14 giorni
+- medie mobili a 7 e 14 giorni
+- tassi di crescita giornalieri
+- tasso di positività (come in CovidDataProcessor.get_latest_data)
+- tassi per 100.000 abitanti
+
+Le feature vengono salvate nel feature store con operazioni bulk. Dopo un'importazione
+vengono ricalcolate solo le date interessate dalle modifiche (più la finestra di look-back).
+"""
+
+import os
+import sys
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db_manager import db_manager
+
+logger = logging.getLogger('apollo-features')
+
+# Colonna che identifica l'area per ogni livello geografico
+AREA_COLUMNS = {
+    'national': 'stato',
+    'regional': 'denominazione_regione',
+    'provincial': 'denominazione_provincia'
+}
+
+# Metriche cumulative: le feature vengono calcolate sull'incremento giornaliero
+CUMULATIVE_METRICS = ['deceduti', 'dimessi_guariti', 'totale_casi']
+# Metriche già giornaliere o di stato (posti letto, positivi attuali)
+DAILY_METRICS = ['nuovi_positivi', 'terapia_intensiva', 'ricoverati_con_sintomi', 'totale_positivi']
+# Serie su cui calcolare i tassi per 100.000 abitanti
+PER_CAPITA_SERIES = ['nuovi_positivi', 'nuovi_positivi_ma7', 'deceduti_giornalieri',
+                     'totale_casi', 'totale_casi_giornalieri_ma7', 'terapia_intensiva', 'totale_positivi']
+
+LAGS = (1, 7, 14)
+ROLLING_WINDOWS = (7, 14)
+# Giorni precedenti necessari per ricalcolare correttamente una data (lag sull'incremento giornaliero)
+LOOKBACK_DAYS = max(LAGS + ROLLING_WINDOWS) + 1
+
+# Popolazione residente ISTAT al 1° gennaio 2020
+NATIONAL_POPULATION = {'ITA': 59641488}
+REGIONAL_POPULATION = {
+    'Abruzzo': 1293941, 'Basilicata': 553254, 'Calabria': 1894110, 'Campania': 5712143,
+    'Emilia-Romagna': 4464119, 'Friuli Venezia Giulia': 1206216, 'Lazio': 5755700,
+    'Liguria': 1524826, 'Lombardia': 10027602, 'Marche': 1512672, 'Molise': 300516,
+    'P.A. Bolzano': 532644, 'P.A. Trento': 545425, 'Piemonte': 4311217, 'Puglia': 3953305,
+    'Sardegna': 1611621, 'Sicilia': 4875290, 'Toscana': 3692555, 'Umbria': 870165,
+    "Valle d'Aosta": 125034, 'Veneto': 4879133
+}
+# CSV opzionale (denominazione_provincia,popolazione) per i tassi provinciali
+PROVINCIAL_POPULATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                          'data_cache', 'popolazione_province.csv')
+
+
+def load_population(area_type):
+    """
+    Restituisce la popolazione per area del livello richiesto.
+
+    Returns:
+        dict: Mappa nome area -> popolazione (vuota se non disponibile)
+    """
+    if area_type == 'national':
+        return NATIONAL_POPULATION
+    if area_type == 'regional':
+        return REGIONAL_POPULATION
+    if area_type == 'provincial' and os.path.exists(PROVINCIAL_POPULATION_PATH):
+        try:
+            df = pd.read_csv(PROVINCIAL_POPULATION_PATH)
+            return dict(zip(df['denominazione_provincia'], df['popolazione']))
+        except Exception as e:
+            logger.error(f"Errore nel caricamento della popolazione provinciale: {str(e)}")
+    return {}
+
+
+def _prepare_frame(df, area_type):
+    """Ordina per area e data ed esclude le pseudo-province DPC (codici >= 900)"""
+    area_col = AREA_COLUMNS[area_type]
+    df = df.copy()
+    if area_col not in df.columns:
+        # I CSV nazionali hanno sempre 'stato', ma i dati da MongoDB potrebbero non averlo
+        df[area_col] = 'ITA'
+    if not pd.api.types.is_datetime64_any_dtype(df['data']):
+        df['data'] = pd.to_datetime(df['data'])
+    if area_type == 'provincial' and 'codice_provincia' in df.columns:
+        codes = pd.to_numeric(df['codice_provincia'], errors='coerce')
+        df = df[codes < 900]
+    return df.sort_values([area_col, 'data']).reset_index(drop=True)
+
+
+def compute_features(df, area_type, population=None):
+    """
+    Calcola le feature per tutte le aree di un DataFrame in un unico passaggio vettoriale.
+
+    Args:
+        df: DataFrame in formato DPC (una riga per area e data)
+        area_type: Tipo di area ('national', 'regional', 'provincial')
+        population: Mappa area -> popolazione (se None usa load_population)
+
+    Returns:
+        pandas.DataFrame: Colonne 'area_name', 'data' e una colonna per ogni feature
+    """
+    area_col = AREA_COLUMNS[area_type]
+    df = _prepare_frame(df, area_type)
+    if df.empty:
+        return pd.DataFrame(columns=['area_name', 'data'])
+
+    grouped = df.groupby(area_col, sort=False)
+    base = pd.DataFrame(index=df.index)
+
+    # Serie di base: metriche giornaliere così come sono, cumulative come incremento giornaliero
+    for metric in DAILY_METRICS:
+        if metric in df.columns:
+            base[metric] = pd.to_numeric(df[metric], errors='coerce')
+    cumulative = [m for m in CUMULATIVE_METRICS if m in df.columns]
+    if cumulative:
+        daily = grouped[cumulative].diff()
+        for metric in cumulative:
+            base[f'{metric}_giornalieri'] = daily[metric]
+
+    base[area_col] = df[area_col]
+    base_grouped = base.groupby(area_col, sort=False)
+    series = [c for c in base.columns if c != area_col]
+
+    parts = [base[series]]
+    for lag in LAGS:
+        parts.append(base_grouped[series].shift(lag).add_suffix(f'_lag{lag}'))
+    for window in ROLLING_WINDOWS:
+        rolled = base_grouped[series].rolling(window, min_periods=window).mean()
+        parts.append(rolled.reset_index(level=0, drop=True).sort_index().round(2).add_suffix(f'_ma{window}'))
+    growth = base_grouped[series].pct_change(fill_method=None) * 100
+    parts.append(growth.replace([np.inf, -np.inf], np.nan).round(2).add_suffix('_crescita_pct'))
+
+    # Tasso di positività calcolato sull'incremento giornaliero dei tamponi
+    if 'tamponi' in df.columns and 'nuovi_positivi' in df.columns:
+        tests = grouped['tamponi'].diff()
+        positivity = (pd.to_numeric(df['nuovi_positivi'], errors='coerce') / tests) * 100
+        parts.append(positivity.replace([np.inf, -np.inf], np.nan).fillna(0).round(2).rename('tasso_positivita'))
+
+    features = pd.concat(parts, axis=1)
+    if 'totale_casi' in df.columns:
+        features['totale_casi'] = pd.to_numeric(df['totale_casi'], errors='coerce')
+
+    # Tassi per 100.000 abitanti
+    population = load_population(area_type) if population is None else population
+    if population:
+        per_100k = 100000 / df[area_col].map(population).astype(float)
+        for name in PER_CAPITA_SERIES:
+            if name in features.columns:
+                features[f'{name}_per_100k'] = (features[name] * per_100k).round(3)
+
+    features.insert(0, 'data', df['data'])
+    features.insert(0, 'area_name', df[area_col])
+    return features
+
+
+def update_features(area_type, df, changed_from=None):
+    """
+    Ricalcola e salva le feature delle date interessate da un'importazione.
+
+    Args:
+        area_type: Tipo di area ('national', 'regional', 'provincial')
+        df: DataFrame con i dati completi del livello (ad es. appena importati)
+        changed_from: Mappa area -> prima data modificata (None = ricalcolo completo).
+                      Per i dati nazionali la chiave è None.
+
+    Returns:
+        dict: Risultato del salvataggio con il numero di righe ricalcolate
+    """
+    if changed_from is not None and not changed_from:
+        return {"success": True, "recomputed": 0, "inserted": 0, "updated": 0}
+
+    area_col = AREA_COLUMNS[area_type]
+    df = _prepare_frame(df, area_type)
+
+    if changed_from is not None:
+        # I dati nazionali sono registrati senza nome area
+        changed = {('ITA' if k is None else k): pd.Timestamp(v) for k, v in changed_from.items()}
+        first_changed = df[area_col].map(changed)
+        # Tieni solo le aree modificate con la finestra di look-back necessaria a lag e medie mobili
+        df = df[df['data'] >= first_changed - pd.Timedelta(days=LOOKBACK_DAYS)]
+
+    features = compute_features(df, area_type)
+    if changed_from is not None:
+        features = features[features['data'] >= features['area_name'].map(changed)]
+
+    # NaN -> None per avere documenti serializzabili in JSON
+    records = features.astype(object).where(features.notna(), None).to_dict('records')
+    result = db_manager.save_features_bulk(area_type, records)
+    result["recomputed"] = len(features)
+    logger.info(f"Feature {area_type} ricalcolate per {len(features)} righe")
+    return result
+
+
+def parse_arguments():
+    """Analizza gli argomenti dalla riga di comando"""
+    parser = argparse.ArgumentParser(description="Ricalcolo del feature store di Apollo")
+    parser.add_argument("--area-type", choices=list(AREA_COLUMNS), action="append",
+                        help="Livello da ricalcolare (ripetibile, default: tutti)")
+    parser.add_argument("--since", help="Ricalcola solo dalle date >= YYYY-MM-DD")
+    return parser.parse_args()
+
+
+def main():
+    """Ricalcola il feature store leggendo i dati da MongoDB"""
+    args = parse_arguments()
+    if not db_manager.connect():
+        logger.error("Impossibile connettersi al database MongoDB.")
+        return 1
+
+    since = datetime.fromisoformat(args.since) if args.since else None
+    start_date = since - timedelta(days=LOOKBACK_DAYS) if since else None
+    loaders = {
+        'national': lambda: db_manager.get_national_data(start_date=start_date),
+        'regional': lambda: db_manager.get_regional_data(start_date=start_date),
+        'provincial': lambda: db_manager.get_provincial_data(start_date=start_date)
+    }
+    for area_type in args.area_type or list(AREA_COLUMNS):
+        df = pd.DataFrame(loaders[area_type]())
+        if df.empty:
+            logger.warning(f"Nessun dato {area_type} nel database")
+            continue
+        changed_from = None
+        if since:
+            areas = df[AREA_COLUMNS[area_type]].unique() if AREA_COLUMNS[area_type] in df.columns else ['ITA']
+            changed_from = {area: since for area in areas}
+        result = update_features(area_type, df, changed_from)
+        logger.info(f"Feature {area_type}: {result}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
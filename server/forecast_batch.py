@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Previsioni di più aree in una sola richiesta (POST /api/forecast/batch).
+
+Ogni area viene risolta nel modo più economico disponibile:
+1. 'cache': previsione già calcolata per gli stessi parametri e la stessa versione dei dati
+2. 'fit_cache': tutti i fit necessari sono già in memoria, resta solo la previsione NumPy
+3. 'pool': i fit mancanti vengono eseguiti in parallelo in un pool di processi limitato
+
+I processi del pool restituiscono, oltre alla previsione, i parametri compatti dei fit
+eseguiti, che vengono aggiunti a fit_cache: le richieste successive sulle stesse aree (anche
+da /api/forecast/regional e /api/forecast/provincial) non riaddestrano i modelli.
+
+Variabili d'ambiente:
+- FORECAST_POOL_WORKERS: processi del pool (default: min(4, CPU))
+- FORECAST_BATCH_MAX_ITEMS: aree massime per richiesta (default: 50)
+- FORECAST_CACHE_ENTRIES: previsioni in cache (default: 256)
+"""
+
+import os
+import re
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from db_manager import db_manager
+from metrics import metrics
+from request_timing import span
+from result_cache import ResultCache
+from update_bus import update_bus
+
+logger = logging.getLogger('apollo-forecast-batch')
+
+AREA_TYPES = ('national', 'regional', 'provincial')
+FORECAST_POOL_WORKERS = int(os.environ.get('FORECAST_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+FORECAST_BATCH_MAX_ITEMS = int(os.environ.get('FORECAST_BATCH_MAX_ITEMS', 50))
+FORECAST_BATCH_MAX_DAYS = 365
+
+_INDICATOR = re.compile(r'^[a-z_]+$')
+
+# Previsioni per (area, indicatori, giorni, intervalli, versione dei dati)
+forecast_cache = ResultCache(max_entries=int(os.environ.get('FORECAST_CACHE_ENTRIES', 256)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_items(payload, default_days=30):
+    """
+    Valida le aree richieste: una lista di oggetti {area_type, area_name, indicators, days},
+    direttamente o nel campo 'items' del corpo JSON.
+
+    Returns:
+        tuple: (lista di aree normalizzate, None) oppure (None, messaggio di errore)
+    """
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        return None, "Il corpo deve contenere una lista 'items' di aree"
+    if len(items) > FORECAST_BATCH_MAX_ITEMS:
+        return None, f"Massimo {FORECAST_BATCH_MAX_ITEMS} aree per richiesta"
+    parsed = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            return None, f"items[{i}]: atteso un oggetto"
+        area_type = item.get('area_type', 'regional')
+        area_name = item.get('area_name')
+        if area_type not in AREA_TYPES:
+            return None, f"items[{i}]: area_type deve essere uno tra {', '.join(AREA_TYPES)}"
+        if area_type != 'national' and not (isinstance(area_name, str) and area_name):
+            return None, f"items[{i}]: area_name obbligatorio per area_type {area_type}"
+        indicators = item.get('indicators')
+        if indicators is not None and (not isinstance(indicators, list) or not indicators or
+                                       not all(isinstance(c, str) and _INDICATOR.match(c) for c in indicators)):
+            return None, f"items[{i}]: indicators deve essere una lista di nomi di colonne"
+        days = item.get('days', default_days)
+        if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= FORECAST_BATCH_MAX_DAYS:
+            return None, f"items[{i}]: days deve essere un intero tra 1 e {FORECAST_BATCH_MAX_DAYS}"
+        parsed.append({'area_type': area_type, 'area_name': area_name if area_type != 'national' else None,
+                       'indicators': indicators, 'days': days})
+    return parsed, None
+
+
+def _forecast_in_worker(area_type, area_name, indicators, days, intervals):
+    """
+    Eseguito in un processo del pool: addestra i modelli mancanti e calcola la previsione.
+
+    Returns:
+        tuple: (previsione, lista di (impronta della serie, parametri CompactProphet))
+    """
+    from models.fit_cache import series_signature
+    from models.geo_prophet_model import GeoProphetModel
+    model = GeoProphetModel(area_type=area_type, area_name=area_name, columns=indicators)
+    forecast = model.forecast(days=days, intervals=intervals)
+    fits = []
+    for col, compact in model.compact_models.items():
+        series = model.training_series(col)
+        if compact is not None and series is not None:
+            fits.append((series_signature(*series), compact.params))
+    return forecast, fits
+
+
+def _get_pool():
+    """Pool di processi condiviso, creato al primo uso (spawn: sicuro con i thread del server)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=FORECAST_POOL_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"Pool delle previsioni batch avviato con {FORECAST_POOL_WORKERS} processi")
+        return _pool
+
+
+def _reset_pool(pool):
+    """Scarta un pool non più utilizzabile (es. un processo terminato in modo anomalo)"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def shutdown_pool():
+    """Termina i processi del pool"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _result(item, source, forecast=None, error=None):
+    result = dict(item, source=source, success=error is None)
+    if error is None:
+        result['data'] = forecast
+    else:
+        result['error'] = error
+    metrics.inc('apollo_forecast_batch_items_total', source=source, success=str(error is None).lower())
+    return result
+
+
+def _store(item, key, forecast):
+    """Memorizza una previsione calcolata e la notifica ai client (una volta per versione dei dati)"""
+    if key is None:
+        return
+    forecast_cache.put(key, forecast)
+    update_bus.publish('forecast', area_type=item['area_type'], area_name=item['area_name'], version=key[-1])
+
+
+def run_batch(items, intervals):
+    """
+    Calcola le previsioni delle aree, restituendo i risultati man mano che sono pronti.
+
+    Args:
+        items: Aree validate da parse_items
+        intervals: Modalità degli intervalli di incertezza
+
+    Yields:
+        dict: Risultato di un'area (campi della richiesta più 'index', 'source', 'success'
+        e 'data' oppure 'error'), prima quelli in cache, poi quelli calcolati nel pool
+    """
+    from models.compact_prophet import CompactProphet
+    from models.fit_cache import fit_cache
+    from models.geo_prophet_model import GeoProphetModel
+
+    local, remote = [], []
+    for index, item in enumerate(items):
+        item = dict(item, index=index)
+        version = db_manager.get_data_version(item['area_type'])
+        key = None
+        if version is not None:
+            key = (item['area_type'], item['area_name'], tuple(item['indicators'] or ()), item['days'],
+                   intervals, version)
+            cached = forecast_cache.get(key)
+            if cached is not None:
+                yield _result(item, 'cache', cached)
+                continue
+        model = GeoProphetModel(area_type=item['area_type'], area_name=item['area_name'],
+                                columns=item['indicators'])
+        if model.train_df is None:
+            yield _result(item, 'none', error=f"Dati non disponibili per {item['area_name'] or 'ITA'}")
+        elif all(model.is_fitted(col) for col in model.columns if col in model.train_df.columns):
+            local.append((item, key, model))
+        else:
+            remote.append((item, key))
+
+    # Prima si avviano i fit nel pool, poi si servono le aree che non ne hanno bisogno
+    futures = {}
+    pool = _get_pool() if remote else None
+    for item, key in remote:
+        future = pool.submit(_forecast_in_worker, item['area_type'], item['area_name'],
+                             item['indicators'], item['days'], intervals)
+        futures[future] = (item, key)
+
+    for item, key, model in local:
+        forecast = model.forecast(days=item['days'], intervals=intervals)
+        if not forecast:
+            yield _result(item, 'fit_cache', error='Impossibile generare la previsione')
+            continue
+        _store(item, key, forecast)
+        yield _result(item, 'fit_cache', forecast)
+
+    if not futures:
+        return
+    with span('pool'):
+        for future in as_completed(futures):
+            item, key = futures[future]
+            try:
+                forecast, fits = future.result()
+            except Exception as e:
+                logger.error(f"Previsione batch fallita per {item['area_type']} - {item['area_name']}: {e}")
+                if isinstance(e, BrokenProcessPool):
+                    _reset_pool(pool)
+                yield _result(item, 'pool', error=str(e) or type(e).__name__)
+                continue
+            for signature, params in fits:
+                fit_cache.add(signature, CompactProphet(params))
+            if not forecast:
+                yield _result(item, 'pool', error='Impossibile generare la previsione')
+                continue
+            _store(item, key, forecast)
+            yield _result(item, 'pool', forecast)
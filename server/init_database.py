@@ -78,18 +78,21 @@ def main():
     logger.info(f"  Successo: {import_result['national'].get('success', False)}")
     logger.info(f"  Inseriti: {import_result['national'].get('inserted', 0)}")
     logger.info(f"  Aggiornati: {import_result['national'].get('updated', 0)}")
+    logger.info(f"  Invariati: {import_result['national'].get('unchanged', 0)}")
     logger.info(f"  Errori: {import_result['national'].get('errors', 0)}")
     
     logger.info("Risultati dati REGIONALI:")
     logger.info(f"  Successo: {import_result['regional'].get('success', False)}")
     logger.info(f"  Inseriti: {import_result['regional'].get('inserted', 0)}")
     logger.info(f"  Aggiornati: {import_result['regional'].get('updated', 0)}")
+    logger.info(f"  Invariati: {import_result['regional'].get('unchanged', 0)}")
     logger.info(f"  Errori: {import_result['regional'].get('errors', 0)}")
     
     logger.info("Risultati dati PROVINCIALI:")
     logger.info(f"  Successo: {import_result['provincial'].get('success', False)}")
     logger.info(f"  Inseriti: {import_result['provincial'].get('inserted', 0)}")
     logger.info(f"  Aggiornati: {import_result['provincial'].get('updated', 0)}")
+    logger.info(f"  Invariati: {import_result['provincial'].get('unchanged', 0)}")
     logger.info(f"  Errori: {import_result['provincial'].get('errors', 0)}")
     
     end_time = datetime.now()
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Load test offline di Apollo Project: riproduce il mix di richieste delle pagine della dashboard.
+
+Ogni utente virtuale sceglie una pagina secondo i pesi di PAGE_MIX ed esegue in sequenza le
+chiamate che i relativi script (static/js/main.js, data.js, globe.js, forecasting.js, statistics.js)
+fanno al caricamento, poi passa alla pagina successiva. Il test procede per livelli di
+concorrenza crescenti e per ciascuno riporta throughput, percentili di latenza e tasso di
+errore per endpoint, più il punto di saturazione (il livello oltre il quale aggiungere utenti
+non aumenta più il throughput in modo significativo).
+
+Di default l'app gira in-process (client di test Flask, un thread per utente, come un worker
+gunicorn con thread) su mongomock o un mongod locale; con --url il test colpisce un server già
+avviato (es. gunicorn con più worker), che usa il proprio database.
+
+Esempi:
+    python loadtest.py --concurrency 1,2,4,8 --duration 20
+    python loadtest.py --url http://localhost:8000 --concurrency 4,16,64 --duration 60
+    python loadtest.py --synthetic-days 1000 --synthetic-regions 21 --concurrency 1,4,16
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from collections import defaultdict
+from datetime import date, datetime
+
+from benchmark import (RESULTS_DIR, NATIONAL_CSV, REGIONAL_CSV, PROVINCIAL_CSV,
+                       use_standin_database, prepare_api_data, summarize, peak_rss_mb, save_report)
+
+logger = logging.getLogger('apollo-loadtest')
+
+# Richieste eseguite al caricamento di ogni pagina, nell'ordine degli script del frontend.
+# {country}, {region} e {province} vengono sostituiti con i valori dei dati caricati,
+# {start} e {end} con l'intervallo predefinito della pagina statistiche (ultimo anno).
+STATISTICS_FIELDS = ('nuovi_positivi,totale_positivi,totale_casi,deceduti,dimessi_guariti,'
+                     'ricoverati_con_sintomi,terapia_intensiva')
+PAGE_MIX = {
+    'dashboard': {
+        'weight': 0.5,
+        'requests': [
+            '/',
+            '/api/data/historical',                                     # data.js loadHistoricalData
+            '/api/dashboard',                                           # data.js loadDashboard (previsioni, statistiche, MAPE)
+            '/api/regions',                                             # data.js loadAvailableRegions
+            '/api/data/regional?region={region}',                       # data.js loadRegionalData
+            '/api/data/regional/snapshot'                               # globe.js, livello regionale
+        ]
+    },
+    'previsioni': {
+        'weight': 0.3,
+        'requests': [
+            '/previsioni',
+            '/api/data/forecast?country={country}',                     # forecasting.js
+            '/api/data/forecast?days=30&country={country}',             # forecasting.js, periodo fisso
+            '/api/model/mape?indicator=nuovi_positivi&country={country}'
+        ]
+    },
+    'statistiche': {
+        'weight': 0.2,
+        'requests': [
+            '/statistiche',
+            '/api/data/historical?start={start}&end={end}&fields=' + STATISTICS_FIELDS,   # statistics.js
+            '/api/model/mape',                                          # statistics.js updateMapeMetric
+            '/api/model/mape'
+        ]
+    }
+}
+DEFAULT_CONCURRENCY = '1,2,4,8'
+DEFAULT_DURATION = 15.0
+# Aumento relativo minimo di throughput tra due livelli prima di considerare il sistema saturo
+DEFAULT_SATURATION_GAIN = 0.10
+
+
+def statistics_window(today=None):
+    """Intervallo predefinito della pagina statistiche (statistics.js setupDefaultDates: da un anno fa a oggi)"""
+    today = today or date.today()
+    try:
+        start = today.replace(year=today.year - 1)
+    except ValueError:          # 29 febbraio
+        start = today.replace(year=today.year - 1, day=28)
+    return {'start': start.isoformat(), 'end': today.isoformat()}
+
+
+def endpoint_label(url):
+    """Etichetta di aggregazione: percorso senza query string"""
+    return url.split('?', 1)[0]
+
+
+class InProcessClient:
+    """Client di test Flask (uno per utente virtuale)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, url):
+        response = self.client.get(url)
+        response.get_data()
+        return response.status_code
+
+
+class HttpClient:
+    """Client HTTP verso un server già avviato"""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def get(self, url):
+        try:
+            with urllib.request.urlopen(self.base_url + url, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class LoadStep:
+    """Esecuzione a concorrenza fissa: utenti virtuali in ciclo chiuso per una durata data"""
+
+    def __init__(self, make_client, concurrency, duration, params, page_mix=PAGE_MIX, seed=None):
+        self.make_client = make_client
+        self.concurrency = concurrency
+        self.duration = duration
+        self.params = params
+        self.page_mix = page_mix
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.pages = defaultdict(int)
+
+    def _record(self, endpoint, elapsed, status):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+
+    def _user(self, index, deadline):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        client = self.make_client()
+        names = list(self.page_mix)
+        weights = [self.page_mix[name]['weight'] for name in names]
+        while time.perf_counter() < deadline:
+            page = rng.choices(names, weights)[0]
+            for template in self.page_mix[page]['requests']:
+                url = template.format(**self.params)
+                start = time.perf_counter()
+                try:
+                    status = str(client.get(url))
+                except Exception as e:
+                    status = type(e).__name__
+                self._record(endpoint_label(template), time.perf_counter() - start, status)
+            with self._lock:
+                self.pages[page] += 1
+
+    def run(self):
+        """Esegue il livello e restituisce le statistiche aggregate e per endpoint"""
+        start = time.perf_counter()
+        deadline = start + self.duration
+        threads = [threading.Thread(target=self._user, args=(i, deadline), daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return self._summary(elapsed)
+
+    def _summary(self, elapsed):
+        endpoints = {}
+        all_latencies = []
+        total_errors = 0
+        for endpoint, latencies in sorted(self.latencies.items()):
+            statuses = dict(self.statuses[endpoint])
+            errors = sum(count for status, count in statuses.items() if not status[:1] in ('2', '3'))
+            stats = summarize(latencies)
+            stats.update({
+                'throughput_rps': round(len(latencies) / elapsed, 2),
+                'errors': errors,
+                'error_rate': round(errors / len(latencies), 4),
+                'statuses': statuses
+            })
+            endpoints[endpoint] = stats
+            all_latencies.extend(latencies)
+            total_errors += errors
+        overall = summarize(all_latencies) if all_latencies else {'calls': 0}
+        overall.update({
+            'throughput_rps': round(len(all_latencies) / elapsed, 2),
+            'pages_per_s': round(sum(self.pages.values()) / elapsed, 2),
+            'errors': total_errors,
+            'error_rate': round(total_errors / len(all_latencies), 4) if all_latencies else None
+        })
+        return {
+            'concurrency': self.concurrency,
+            'duration_s': round(elapsed, 2),
+            'pages': dict(self.pages),
+            'overall': overall,
+            'endpoints': endpoints,
+            'peak_rss_mb': peak_rss_mb()
+        }
+
+
+def find_saturation(steps, min_gain=DEFAULT_SATURATION_GAIN):
+    """
+    Punto di saturazione: il primo livello di concorrenza dopo il quale il throughput cresce
+    meno di min_gain (in proporzione) rispetto al livello precedente.
+
+    Returns:
+        dict: concurrency (None se la saturazione non è stata raggiunta), throughput massimo
+              e p95 al punto di saturazione
+    """
+    best = max(steps, key=lambda s: s['overall']['throughput_rps'], default=None)
+    saturation = None
+    for previous, current in zip(steps, steps[1:]):
+        before = previous['overall']['throughput_rps']
+        after = current['overall']['throughput_rps']
+        if before and (after - before) / before < min_gain:
+            saturation = previous
+            break
+    return {
+        'concurrency': saturation['concurrency'] if saturation else None,
+        'p95_ms': saturation['overall'].get('p95_ms') if saturation else None,
+        'max_throughput_rps': best['overall']['throughput_rps'] if best else None,
+        'max_throughput_concurrency': best['concurrency'] if best else None
+    }
+
+
+def print_step(step):
+    overall = step['overall']
+    print(f"\n== Concorrenza {step['concurrency']}: {overall['throughput_rps']} req/s, "
+          f"{overall['pages_per_s']} pagine/s, p50 {overall.get('p50_ms')} ms, p95 {overall.get('p95_ms')} ms, "
+          f"errori {overall['error_rate']:.1%}")
+    print(f"{'endpoint':32s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'max ms':>9s} {'errori':>7s}")
+    for endpoint, stats in step['endpoints'].items():
+        print(f"{endpoint:32s} {stats['throughput_rps']:8.2f} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} "
+              f"{stats['max_ms']:9.2f} {stats['error_rate']:7.1%}")
+
+
+def prepare_in_process(args):
+    """
+    Avvia l'app in-process su un database di prova popolato con dati reali o sintetici.
+    Le route nazionali (/api/data/historical, /api/data/forecast) leggono comunque i CSV
+    per paese del repository, come in produzione.
+    """
+    paths = {'national': NATIONAL_CSV, 'regional': REGIONAL_CSV, 'provincial': PROVINCIAL_CSV}
+    if args.synthetic_days:
+        from synthetic_data import generate_dataset
+        generated = generate_dataset(args.work_dir, ('ITA',), args.synthetic_days, args.synthetic_regions,
+                                     args.synthetic_provinces_per_region, seed=args.seed or 42)
+        paths = {'national': generated['national']['ITA'], 'regional': generated['regional'],
+                 'provincial': generated['provincial']}
+    use_standin_database(args.mongo_uri)
+    region, province = prepare_api_data(paths)
+    from app import app
+    return (lambda: InProcessClient(app)), dict(statistics_window(), region=quote(region or ''),
+                                                province=quote(province or ''), country=args.country), paths
+
+
+def run_loadtest(args):
+    if args.url:
+        make_client = lambda: HttpClient(args.url, args.timeout)
+        params = dict(statistics_window(), region=quote(args.region), province=quote(args.province),
+                      country=args.country)
+        paths = None
+    else:
+        make_client, params, paths = prepare_in_process(args)
+        # Gli errori dell'app sono conteggiati per endpoint: i log dell'app resterebbero illeggibili
+        logging.getLogger().setLevel(logging.WARNING if args.verbose else logging.CRITICAL)
+
+    if args.warmup:
+        # Un passaggio su ogni pagina per caricare dati e modelli prima delle misure
+        client = make_client()
+        for page in PAGE_MIX.values():
+            for template in page['requests']:
+                client.get(template.format(**params))
+
+    steps = []
+    for concurrency in [int(c) for c in args.concurrency.split(',') if c.strip()]:
+        step = LoadStep(make_client, concurrency, args.duration, params, seed=args.seed).run()
+        print_step(step)
+        steps.append(step)
+        if args.max_error_rate is not None and (step['overall']['error_rate'] or 0) > args.max_error_rate:
+            logger.warning(f"Tasso di errore oltre {args.max_error_rate:.0%}: test interrotto")
+            break
+
+    saturation = find_saturation(steps, args.saturation_gain)
+    print(f"\nThroughput massimo {saturation['max_throughput_rps']} req/s con concorrenza "
+          f"{saturation['max_throughput_concurrency']}; saturazione: "
+          f"{saturation['concurrency'] if saturation['concurrency'] else 'non raggiunta'}")
+
+    run_id = args.run_id or datetime.now().strftime('loadtest-%Y%m%d-%H%M%S')
+    report = {
+        'run_id': run_id,
+        'created_at': datetime.now().isoformat(),
+        'target': args.url or 'in-process',
+        'page_mix': PAGE_MIX,
+        'params': params,
+        'paths': paths,
+        'duration_s': args.duration,
+        'steps': steps,
+        'saturation': saturation,
+        'peak_rss_mb': peak_rss_mb()
+    }
+    save_report(report, args.output_dir)
+    return report
+
+
+def parse_arguments(argv=None):
+    """Analizza gli argomenti dalla riga di comando"""
+    parser = argparse.ArgumentParser(description="Load test di Apollo con il mix di richieste della dashboard")
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY, help="Livelli di concorrenza (es. '1,4,16')")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="Secondi per livello")
+    parser.add_argument('--url', help="Server da colpire (default: app in-process)")
+    parser.add_argument('--timeout', type=float, default=60, help="Timeout HTTP in secondi (solo con --url)")
+    parser.add_argument('--country', default='ITA', help="Paese selezionato nelle pagine")
+    parser.add_argument('--region', default='Lombardia', help="Regione richiesta (solo con --url)")
+    parser.add_argument('--province', default='Milano', help="Provincia richiesta (solo con --url)")
+    parser.add_argument('--mongo-uri', help="mongod locale da usare al posto di mongomock (in-process)")
+    parser.add_argument('--synthetic-days', type=int, help="Usa un dataset sintetico con questi giorni di storico")
+    parser.add_argument('--synthetic-regions', type=int, default=21, help="Regioni del dataset sintetico")
+    parser.add_argument('--synthetic-provinces-per-region', type=int, default=5, help="Province per regione")
+    parser.add_argument('--work-dir', default=os.path.join(os.path.dirname(RESULTS_DIR), 'synthetic', 'loadtest'),
+                        help="Cartella del dataset sintetico")
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false', help="Salta il riscaldamento")
+    parser.add_argument('--saturation-gain', type=float, default=DEFAULT_SATURATION_GAIN,
+                        help="Aumento minimo di throughput tra due livelli (0.1 = +10%%)")
+    parser.add_argument('--max-error-rate', type=float, help="Interrompe il test oltre questo tasso di errore")
+    parser.add_argument('--verbose', action='store_true', help="Mostra i log dell'app in-process")
+    parser.add_argument('--seed', type=int, help="Seed per la scelta delle pagine")
+    parser.add_argument('--run-id', help="Identificativo dell'esecuzione")
+    parser.add_argument('--output-dir', default=RESULTS_DIR, help="Cartella dei report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    run_loadtest(parse_arguments(argv))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    sys.exit(main())
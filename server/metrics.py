@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Metriche in formato Prometheus per Apollo Project (senza dipendenze esterne).
+
+Ogni processo accumula contatori, gauge e istogrammi in memoria (un lock e qualche
+operazione su dizionario per misura). Con più worker gunicorn impostare APOLLO_METRICS_DIR:
+ogni processo scrive periodicamente una istantanea metrics_<pid>.json in quella cartella e
+/metrics, servito da qualsiasi worker, somma le istantanee di tutti i processi.
+Contatori e istogrammi dei processi terminati restano nel totale (sono cumulativi);
+i gauge contano solo i processi ancora vivi.
+
+Uso:
+    from metrics import metrics
+    metrics.inc('apollo_redis_cache_requests_total', op='get', result='hit')
+    with metrics.timer('apollo_db_operation_duration_seconds', operation='get_regional_data'):
+        ...
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger('apollo-metrics')
+
+METRICS_DIR = os.environ.get('APOLLO_METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('APOLLO_METRICS_FLUSH_SECONDS', 5))
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Descrizioni mostrate nelle righe # HELP
+HELP = {
+    'apollo_http_requests_total': 'Richieste HTTP per route, metodo e codice di stato',
+    'apollo_http_request_duration_seconds': 'Latenza delle richieste HTTP per route',
+    'apollo_prophet_fit_duration_seconds': 'Durata dei fit Prophet (solo fit eseguiti, non in cache)',
+    'apollo_prophet_fits_in_flight': 'Fit Prophet in corso',
+    'apollo_prophet_predict_duration_seconds': 'Durata delle previsioni CompactProphet',
+    'apollo_dataset_load_duration_seconds': 'Caricamento e parsing dei dataset CSV',
+    'apollo_db_operation_duration_seconds': 'Latenza delle operazioni di DatabaseManager',
+    'apollo_db_operation_errors_total': 'Operazioni di DatabaseManager terminate con eccezione',
+    'apollo_redis_cache_requests_total': 'Richieste alla cache Redis per esito',
+    'apollo_update_events_total': 'Eventi di aggiornamento consegnati allo stream SSE per tipo',
+    'apollo_forecast_batch_items_total': 'Aree di /api/forecast/batch per origine della previsione ed esito',
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Registro delle metriche del processo"""
+
+    def __init__(self, metrics_dir=METRICS_DIR, flush_seconds=METRICS_FLUSH_SECONDS, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            metrics_dir: Cartella delle istantanee per processo (None = solo processo corrente)
+            flush_seconds: Intervallo di scrittura dell'istantanea
+            buckets: Limiti superiori degli istogrammi in secondi
+        """
+        self.metrics_dir = metrics_dir
+        self.flush_seconds = flush_seconds
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}       # chiave -> [conteggi per bucket..., sum, count]
+        self._collectors = []
+        self._flusher = None
+        self._pid = None
+
+    # ----------------------------------------------------------------- misure
+
+    def inc(self, name, amount=1, **labels):
+        """Incrementa un contatore"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._ensure_flusher()
+
+    def gauge_add(self, name, amount, **labels):
+        """Somma amount a un gauge (negativo per decrementare)"""
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + amount
+        self._ensure_flusher()
+
+    def observe(self, name, value, **labels):
+        """Registra un valore (in secondi) in un istogramma"""
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+        self._ensure_flusher()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Misura la durata del blocco in un istogramma (anche se solleva un'eccezione)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def in_flight(self, name, **labels):
+        """Gauge incrementato per la durata del blocco"""
+        self.gauge_add(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.gauge_add(name, -1, **labels)
+
+    def timed(self, name, errors_name=None, **labels):
+        """
+        Decoratore: durata della funzione in un istogramma con label operation=<nome funzione>;
+        se errors_name è indicato conta anche le eccezioni.
+        """
+        def decorator(func):
+            operation = func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    if errors_name:
+                        self.inc(errors_name, operation=operation, **labels)
+                    raise
+                finally:
+                    self.observe(name, time.perf_counter() - start, operation=operation, **labels)
+            return wrapper
+        return decorator
+
+    def register_collector(self, prefix, func):
+        """
+        Registra una funzione che restituisce un dict di statistiche numeriche, esportate come
+        gauge <prefix>_<chiave> al momento dell'istantanea (es. model_cache.stats).
+        """
+        with self._lock:
+            self._collectors.append((prefix, func))
+
+    # ------------------------------------------------------------- istantanee
+
+    def snapshot(self):
+        """Stato del processo serializzabile in JSON"""
+        gauges = {}
+        for prefix, func in list(self._collectors):
+            try:
+                stats = func()
+            except Exception as e:
+                logger.debug(f"Collector {prefix} non disponibile: {e}")
+                continue
+            for key, value in (stats or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[_key(f"{prefix}_{key}", {})] = value
+        with self._lock:
+            gauges.update(self._gauges)
+            return {
+                'pid': os.getpid(),
+                'time': time.time(),
+                'buckets': list(self.buckets),
+                'counters': [[k[0], list(k[1]), v] for k, v in self._counters.items()],
+                'gauges': [[k[0], list(k[1]), v] for k, v in gauges.items()],
+                'histograms': [[k[0], list(k[1]), v] for k, v in self._histograms.items()]
+            }
+
+    def write_snapshot(self):
+        """Scrive l'istantanea del processo (scrittura atomica); no-op senza metrics_dir"""
+        if not self.metrics_dir:
+            return None
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = os.path.join(self.metrics_dir, f"metrics_{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        return path
+
+    def _ensure_flusher(self):
+        """Avvia il thread di scrittura delle istantanee (di nuovo nei figli dopo un fork)"""
+        if not self.metrics_dir or (self._pid == os.getpid() and self._flusher is not None):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._flusher is not None:
+                return
+            self._pid = os.getpid()
+            self._flusher = threading.Thread(target=self._flush_loop, name='apollo-metrics', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logger.warning(f"Impossibile scrivere l'istantanea delle metriche: {e}")
+
+    def _load_snapshots(self):
+        """Istantanee di tutti i processi (quella corrente è sempre aggiornata)"""
+        if not self.metrics_dir:
+            return [self.snapshot()]
+        self.write_snapshot()
+        snapshots = []
+        for filename in os.listdir(self.metrics_dir):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, filename), 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    # ------------------------------------------------------------------ output
+
+    def render(self):
+        """Testo nel formato di esposizione Prometheus (0.0.4), aggregato su tutti i processi"""
+        counters, gauges, histograms = {}, {}, {}
+        buckets = self.buckets
+        for snap in self._load_snapshots():
+            alive = _pid_alive(snap['pid'])
+            for name, labels, value in snap['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            if alive:
+                for name, labels, value in snap['gauges']:
+                    key = (name, tuple(map(tuple, labels)))
+                    gauges[key] = gauges.get(key, 0) + value
+            if tuple(snap.get('buckets', buckets)) != buckets:
+                continue
+            for name, labels, value in snap['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                current = histograms.get(key)
+                histograms[key] = value if current is None else [a + b for a, b in zip(current, value)]
+
+        lines = []
+        self._render_family(lines, counters, 'counter', lambda name, labels, value: [
+            f"{name}{_format_labels(labels)} {_format_value(value)}"])
+        self._render_family(lines, gauges, 'gauge', lambda name, labels, value: [
+            f"{name}{_format_labels(labels)} {_format_value(value)}"])
+
+        def histogram_lines(name, labels, value):
+            out, cumulative = [], 0
+            for bound, count in zip(buckets + (float('inf'),), value[:len(buckets)] + [None]):
+                cumulative = value[-1] if count is None else cumulative + count
+                out.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(float(bound)))])} {cumulative}")
+            out.append(f"{name}_sum{_format_labels(labels)} {_format_value(round(value[-2], 6))}")
+            out.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+            return out
+        self._render_family(lines, histograms, 'histogram', histogram_lines)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_family(lines, values, metric_type, format_sample):
+        by_name = {}
+        for (name, labels), value in values.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name[name]):
+                lines.extend(format_sample(name, labels, value))
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+# Istanza condivisa dal processo
+metrics = Metrics()
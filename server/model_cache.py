@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Cache in-process dei modelli Prophet deserializzati dal model registry.
+
+- Il puntatore "ultimo modello" del registry viene memorizzato con un TTL breve,
+  così le previsioni a regime non interrogano MongoDB.
+- I modelli deserializzati sono indicizzati per id del registry e mtime del file,
+  con evizione LRU per numero di voci e per memoria occupata (stimata dalla dimensione del file).
+- In cache finisce la rappresentazione compatta (CompactProphet): se il registry indica un
+  file compact_path viene letto il JSON, altrimenti il .joblib viene deserializzato una volta
+  e convertito. Nel primo caso prophet non viene mai importato.
+
+A regime una previsione non fa né I/O su disco né query al database.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from db_manager import db_manager
+from models.compact_prophet import CompactProphet
+
+logger = logging.getLogger('apollo-model-cache')
+
+MODEL_CACHE_MAX_ENTRIES = int(os.environ.get('MODEL_CACHE_MAX_ENTRIES', 32))
+MODEL_CACHE_MAX_MB = float(os.environ.get('MODEL_CACHE_MAX_MB', 512))
+MODEL_REGISTRY_TTL = float(os.environ.get('MODEL_REGISTRY_TTL', 60))
+
+
+def _artifact_path(doc):
+    """File da cui viene caricato il modello: il JSON compatto se registrato, altrimenti il .joblib"""
+    compact_path = doc.get('compact_path')
+    if compact_path and os.path.exists(compact_path):
+        return compact_path
+    return doc['file_path']
+
+
+def _load_compact(doc):
+    """Carica il modello compatto; per i modelli registrati senza JSON lo estrae dal .joblib"""
+    path = _artifact_path(doc)
+    if path == doc.get('compact_path'):
+        return CompactProphet.load(path)
+    import joblib
+    return CompactProphet.from_model(joblib.load(path))
+
+
+class ModelCache:
+    """Cache LRU dei modelli deserializzati e dei puntatori 'latest' del registry"""
+
+    def __init__(self, max_entries=MODEL_CACHE_MAX_ENTRIES, max_bytes=MODEL_CACHE_MAX_MB * 1024 * 1024,
+                 registry_ttl=MODEL_REGISTRY_TTL, loader=_load_compact):
+        """
+        Args:
+            max_entries: Numero massimo di modelli in memoria
+            max_bytes: Memoria massima stimata per i modelli in cache
+            registry_ttl: Secondi di validità del puntatore al modello più recente
+            loader: Funzione che carica il modello di un documento del registry
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.registry_ttl = registry_ttl
+        self.loader = loader
+        self._models = OrderedDict()    # (registry_id, mtime) -> (model, size)
+        self._pointers = {}             # (model_name, area_type, area_name) -> (expires, doc, mtime)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "registry_lookups": 0}
+
+    def get_model(self, model_name, area_type, area_name=None):
+        """
+        Restituisce il modello più recente registrato per nome/area.
+
+        Returns:
+            tuple: (documento del registry, CompactProphet) oppure (None, None) se non registrato
+
+        Raises:
+            Exception: Se il file del modello non può essere deserializzato
+        """
+        doc, mtime = self.get_latest(model_name, area_type, area_name)
+        if doc is None:
+            return None, None
+        return doc, self.load(doc, mtime)
+
+    def get_latest(self, model_name, area_type, area_name=None):
+        """Restituisce (documento, mtime del file) dal registry, con cache a TTL"""
+        pointer_key = (model_name, area_type, area_name)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._pointers.get(pointer_key)
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+        with self._lock:
+            self._stats["registry_lookups"] += 1
+        doc = db_manager.get_latest_model(model_name, area_type, area_name)
+        mtime = None
+        if doc is not None:
+            try:
+                mtime = os.path.getmtime(_artifact_path(doc))
+            except (OSError, KeyError):
+                mtime = None
+        if not db_manager.is_connected:
+            # Database non raggiungibile: nessun puntatore in cache, si riprova alla richiesta successiva
+            return doc, mtime
+        with self._lock:
+            self._pointers[pointer_key] = (now + self.registry_ttl, doc, mtime)
+        return doc, mtime
+
+    def load(self, doc, mtime=None):
+        """Deserializza il modello di un documento del registry, riusando la copia in cache"""
+        key = (str(doc.get('_id')), mtime)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Un solo thread per chiave deserializza il file, gli altri attendono il risultato
+        with key_lock:
+            try:
+                with self._lock:
+                    entry = self._models.get(key)
+                    if entry is not None:
+                        self._stats["hits"] += 1
+                        return entry[0]
+                    self._stats["misses"] += 1
+                path = _artifact_path(doc)
+                model = self.loader(doc)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+                self._store(key, model, size)
+                logger.info(f"Modello {doc.get('model_name')} caricato in cache ({size / 1024:.0f} KB)")
+                return model
+            finally:
+                # Anche se il caricamento fallisce il lock della chiave non resta in memoria
+                with self._lock:
+                    self._key_locks.pop(key, None)
+
+    def _store(self, key, model, size):
+        with self._lock:
+            self._models[key] = (model, size)
+            self._bytes += size
+            # Evizione LRU per numero di voci e per memoria stimata
+            while self._models and (len(self._models) > self.max_entries or self._bytes > self.max_bytes):
+                if len(self._models) == 1:
+                    break
+                _, (_, evicted_size) = self._models.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def invalidate(self, model_name=None, area_type=None, area_name=None):
+        """Invalida i puntatori del registry (tutti se non si specifica il modello)"""
+        with self._lock:
+            if model_name is None:
+                self._pointers.clear()
+            else:
+                self._pointers.pop((model_name, area_type, area_name), None)
+
+    def clear(self):
+        """Svuota completamente la cache"""
+        with self._lock:
+            self._models.clear()
+            self._pointers.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Restituisce contatori e occupazione della cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._models)
+            stats["bytes"] = self._bytes
+            stats["pointers"] = len(self._pointers)
+        return stats
+
+
+# Istanza condivisa dal server
+model_cache = ModelCache()
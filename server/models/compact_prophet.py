@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Modulo CompactProphet per Apollo Project
+- Estrae da un modello Prophet addestrato solo i parametri necessari alla previsione
+  (trend a tratti, coefficienti di Fourier delle stagionalità, scala e rumore)
+- Valuta yhat, trend e componenti stagionali con sole operazioni NumPy,
+  senza importare prophet né pandas
+- Salva e carica la rappresentazione compatta in JSON
+
+Gli intervalli (yhat_lower/yhat_upper) si calcolano in tre modalità:
+- 'none': nessun intervallo
+- 'fast': bande analitiche, varianza del rumore di osservazione (sigma_obs) più varianza
+  dei cambi di pendenza futuri simulati da Prophet (Laplace con tasso pari ai changepoint storici)
+- 'full': stessa simulazione Monte Carlo di Prophet (uncertainty_samples campioni, vettorizzata);
+  le bande vengono riutilizzate finché orizzonte e modello non cambiano
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+from statistics import NormalDist
+
+import numpy as np
+
+# Versione del formato JSON della rappresentazione compatta
+COMPACT_FORMAT_VERSION = 1
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Modalità di calcolo degli intervalli di incertezza
+INTERVAL_MODES = ('none', 'fast', 'full')
+DEFAULT_INTERVAL_MODE = 'fast'
+# Bande 'full' memorizzate per modello (una voce per data iniziale e orizzonte)
+FULL_BANDS_CACHE_SIZE = 32
+
+
+def _to_datetime64(dates):
+    """Converte date (stringhe, datetime, DatetimeIndex...) in un array datetime64[ns]"""
+    values = np.asarray(dates)
+    if values.dtype.kind != 'M':
+        values = np.array([np.datetime64(str(d)[:19]) for d in values.ravel()])
+    return values.astype('datetime64[ns]')
+
+
+class CompactProphet:
+    """Rappresentazione minima di un modello Prophet (crescita lineare o piatta) per la sola previsione"""
+
+    def __init__(self, params):
+        """
+        Args:
+            params: Dizionario prodotto da extract_params() o letto dal file JSON
+        """
+        if params.get('format') != COMPACT_FORMAT_VERSION:
+            raise ValueError(f"Formato del modello compatto non supportato: {params.get('format')}")
+        self.params = params
+        self.growth = params['growth']
+        self.start = np.datetime64(params['start'], 'ns')
+        self.t_scale = float(params['t_scale_seconds'])
+        self.y_scale = float(params['y_scale'])
+        self.floor = float(params['floor'])
+        self.k = float(params['k'])
+        self.m = float(params['m'])
+        self.deltas = np.asarray(params['delta'], dtype=float)
+        self.changepoints_t = np.asarray(params['changepoints_t'], dtype=float)
+        self.sigma_obs = float(params['sigma_obs'])
+        self.interval_width = float(params['interval_width'])
+        self.uncertainty_samples = int(params.get('uncertainty_samples', 1000))
+        self.history_step_t = float(params.get('history_step_t') or SECONDS_PER_DAY / self.t_scale)
+        self.seasonalities = [
+            dict(s, beta=np.asarray(s['beta'], dtype=float)) for s in params['seasonalities']
+        ]
+        self._full_bands = OrderedDict()
+        self._full_bands_lock = threading.Lock()
+
+    @classmethod
+    def from_model(cls, model):
+        """Crea la rappresentazione compatta da un modello Prophet addestrato"""
+        return cls(extract_params(model))
+
+    @classmethod
+    def load(cls, path):
+        """Carica la rappresentazione compatta da un file JSON"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        """Salva la rappresentazione compatta in JSON (scrittura atomica)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.params, f)
+        os.replace(tmp_path, path)
+        return path
+
+    def _time(self, ds):
+        """Tempo scalato come in Prophet.setup_dataframe: 0 = inizio, 1 = fine dello storico"""
+        return (ds - self.start).astype('timedelta64[ns]').astype(float) / 1e9 / self.t_scale
+
+    def _trend(self, t):
+        """Trend lineare a tratti (Prophet.piecewise_linear) o piatto, in scala normalizzata"""
+        if self.growth == 'flat':
+            return np.full_like(t, self.m)
+        deltas_t = (self.changepoints_t[None, :] <= t[:, None]) * self.deltas
+        k_t = deltas_t.sum(axis=1) + self.k
+        m_t = (deltas_t * -self.changepoints_t).sum(axis=1) + self.m
+        return k_t * t + m_t
+
+    def _trend_variance(self, t):
+        """
+        Varianza (in scala normalizzata) del trend futuro dovuta ai nuovi changepoint:
+        cambi di pendenza Laplace(0, lambda) con tasso S per unità di tempo dopo t = 1.
+        """
+        if self.growth == 'flat' or not len(self.changepoints_t):
+            return np.zeros_like(t)
+        rate = len(self.changepoints_t)
+        lambda_ = np.mean(np.abs(self.deltas)) + 1e-8
+        horizon = np.clip(t - 1.0, 0.0, None)
+        return 2.0 * rate * lambda_ ** 2 * horizon ** 3 / 3.0
+
+    def _sample_trend_shifts(self, t, n_samples):
+        """
+        Campioni dei cambi di trend futuri come in Prophet._sample_uncertainty (crescita lineare):
+        cambi di pendenza Laplace con probabilità S * passo temporale, integrati due volte.
+        """
+        shifts = np.zeros((n_samples, len(t)))
+        future = t > 1
+        n_length = int(future.sum())
+        if self.growth == 'flat' or n_length == 0:
+            return shifts
+        single_diff = np.diff(t[future]).mean() if n_length > 1 else self.history_step_t
+        likelihood = len(self.changepoints_t) * single_diff
+        mean_delta = np.mean(np.abs(self.deltas)) + 1e-8
+        changes = np.random.uniform(size=(n_samples, n_length)) < likelihood
+        mat = np.random.laplace(0, mean_delta, size=changes.shape) * changes
+        previous = np.hstack([np.zeros((n_samples, 1)), mat])[:, :-1]
+        mat = (previous + mat) / 2
+        shifts[:, future] = mat.cumsum(axis=1).cumsum(axis=1) * single_diff
+        return shifts
+
+    def _full_intervals(self, t, trend, additive, multiplicative):
+        """Percentili dei campioni simulati di yhat (stessa procedura di Prophet.predict_uncertainty)"""
+        order = np.argsort(t, kind='mergesort')
+        t_sorted = t[order]
+        trends = (trend[order][None, :]
+                  + self._sample_trend_shifts(t_sorted, self.uncertainty_samples) * self.y_scale)
+        noise = np.random.normal(0, self.sigma_obs, trends.shape) * self.y_scale
+        samples = trends * (1 + multiplicative[order]) + additive[order] + noise
+        lower_p = 100 * (1.0 - self.interval_width) / 2
+        upper_p = 100 * (1.0 + self.interval_width) / 2
+        lower = np.empty_like(t)
+        upper = np.empty_like(t)
+        lower[order] = np.nanpercentile(samples, lower_p, axis=0)
+        upper[order] = np.nanpercentile(samples, upper_p, axis=0)
+        return lower, upper
+
+    def _cached_full_intervals(self, ds, t, trend, additive, multiplicative):
+        """Riusa le bande 'full' già calcolate per le stesse date (orizzonte invariato)"""
+        key = (ds[0].item(), ds[-1].item(), len(ds))
+        with self._full_bands_lock:
+            bands = self._full_bands.get(key)
+            if bands is not None:
+                self._full_bands.move_to_end(key)
+                return bands
+        bands = self._full_intervals(t, trend, additive, multiplicative)
+        with self._full_bands_lock:
+            self._full_bands[key] = bands
+            while len(self._full_bands) > FULL_BANDS_CACHE_SIZE:
+                self._full_bands.popitem(last=False)
+        return bands
+
+    def predict(self, dates, intervals=DEFAULT_INTERVAL_MODE):
+        """
+        Calcola la previsione per le date richieste.
+
+        Args:
+            dates: Sequenza di date (datetime, stringhe ISO, DatetimeIndex...)
+            intervals: Modalità degli intervalli di incertezza ('none', 'fast', 'full')
+
+        Returns:
+            dict: Array NumPy per 'ds', 'trend', 'yhat', 'additive_terms', 'multiplicative_terms',
+                  una voce per ogni stagionalità e, salvo intervals='none', 'yhat_lower' e 'yhat_upper'
+
+        Raises:
+            ValueError: Se la modalità degli intervalli non è valida
+        """
+        if intervals not in INTERVAL_MODES:
+            raise ValueError(f"Modalità intervalli non valida: {intervals}. Valori ammessi: {', '.join(INTERVAL_MODES)}")
+        ds = _to_datetime64(dates)
+        t = self._time(ds)
+        trend = self._trend(t) * self.y_scale + self.floor
+
+        # Giorni dall'epoch come in Prophet.fourier_series
+        days = ds.astype('datetime64[ns]').astype(float) / 1e9 / SECONDS_PER_DAY
+        result = {'ds': ds, 'trend': trend}
+        additive = np.zeros_like(t)
+        multiplicative = np.zeros_like(t)
+        for season in self.seasonalities:
+            orders = np.arange(1, season['fourier_order'] + 1)
+            angles = 2.0 * np.pi * days[:, None] * orders[None, :] / season['period']
+            # Colonne alternate sin/cos come in Prophet
+            features = np.empty((len(days), 2 * len(orders)))
+            features[:, 0::2] = np.sin(angles)
+            features[:, 1::2] = np.cos(angles)
+            component = features @ season['beta']
+            if season['mode'] == 'additive':
+                component = component * self.y_scale
+                additive += component
+            else:
+                multiplicative += component
+            result[season['name']] = component
+
+        result['additive_terms'] = additive
+        result['multiplicative_terms'] = multiplicative
+        result['yhat'] = trend * (1 + multiplicative) + additive
+
+        if intervals == 'fast':
+            z = NormalDist().inv_cdf((1.0 + self.interval_width) / 2.0)
+            variance = self.sigma_obs ** 2 + (1 + multiplicative) ** 2 * self._trend_variance(t)
+            half_width = z * np.sqrt(variance) * self.y_scale
+            result['yhat_lower'] = result['yhat'] - half_width
+            result['yhat_upper'] = result['yhat'] + half_width
+        elif intervals == 'full' and len(ds):
+            result['yhat_lower'], result['yhat_upper'] = self._cached_full_intervals(
+                ds, t, trend, additive, multiplicative)
+        return result
+
+
+def extract_params(model):
+    """
+    Estrae i parametri di previsione da un modello Prophet addestrato.
+
+    Returns:
+        dict: Parametri serializzabili in JSON
+
+    Raises:
+        ValueError: Se il modello usa funzionalità non supportate (crescita logistica,
+                    festività, regressori o stagionalità condizionali)
+    """
+    if model.history is None:
+        raise ValueError("Il modello Prophet non è stato addestrato")
+    if model.growth not in ('linear', 'flat'):
+        raise ValueError(f"Crescita non supportata: {model.growth}")
+    if model.extra_regressors or model.holidays is not None or getattr(model, 'country_holidays', None):
+        raise ValueError("Festività e regressori esterni non sono supportati")
+
+    # Con stima MAP i parametri hanno una sola riga; con MCMC si usa la media come in predict()
+    beta = np.nanmean(model.params['beta'], axis=0)
+    seasonalities = []
+    offset = 0
+    for name, props in model.seasonalities.items():
+        if props['condition_name'] is not None:
+            raise ValueError(f"Stagionalità condizionale non supportata: {name}")
+        width = 2 * props['fourier_order']
+        seasonalities.append({
+            'name': name,
+            'period': float(props['period']),
+            'fourier_order': int(props['fourier_order']),
+            'mode': props['mode'],
+            'beta': beta[offset:offset + width].tolist()
+        })
+        offset += width
+
+    floor = 0.0
+    if getattr(model, 'scaling', 'absmax') == 'minmax':
+        floor = float(model.y_min)
+
+    return {
+        'format': COMPACT_FORMAT_VERSION,
+        'growth': model.growth,
+        'start': model.start.isoformat(),
+        't_scale_seconds': model.t_scale.total_seconds(),
+        'y_scale': float(model.y_scale),
+        'floor': floor,
+        'k': float(np.nanmean(model.params['k'])),
+        'm': float(np.nanmean(model.params['m'])),
+        'delta': np.nanmean(model.params['delta'], axis=0).tolist(),
+        'changepoints_t': np.asarray(model.changepoints_t, dtype=float).tolist(),
+        'sigma_obs': float(np.nanmean(model.params['sigma_obs'])),
+        'interval_width': float(model.interval_width),
+        'uncertainty_samples': int(model.uncertainty_samples or 0) or 1000,
+        'history_step_t': float(np.diff(model.history['t']).mean()) if len(model.history) > 1 else None,
+        'seasonalities': seasonalities,
+        'history_end': model.history['ds'].max().isoformat()
+    }
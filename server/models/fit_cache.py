@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Cache in-process dei modelli Prophet addestrati, condivisa da ProphetModel e GeoProphetModel.
+
+La chiave è l'impronta della serie di addestramento (date e valori) più la configurazione
+di Prophet: due richieste sugli stessi dati riusano lo stesso fit, mentre dati nuovi
+producono automaticamente una chiave diversa. Ogni voce contiene il modello Prophet e la
+sua rappresentazione compatta (solo quest'ultima per i fit ricevuti dai processi del pool delle
+previsioni batch, perché i modelli Prophet non sono serializzabili); l'evizione è LRU per
+numero di voci.
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from models.compact_prophet import CompactProphet
+from metrics import metrics
+from request_timing import span
+
+logger = logging.getLogger('models.fit_cache')
+
+FIT_CACHE_MAX_ENTRIES = int(os.environ.get('FIT_CACHE_MAX_ENTRIES', 64))
+
+# Configurazione Prophet usata da tutti i modelli di Apollo
+PROPHET_PARAMS = {'weekly_seasonality': True, 'yearly_seasonality': True, 'daily_seasonality': False}
+# Versione della configurazione di modello: va incrementata quando cambiano PROPHET_PARAMS
+# o il modo di preparare le serie (i risultati di backtesting sono salvati per versione)
+MODEL_VERSION = 'prophet-wy-1'
+
+
+def fit_prophet(ds, y):
+    """Addestra un modello Prophet con la configurazione standard di Apollo"""
+    import pandas as pd
+    from prophet import Prophet
+    model = Prophet(**PROPHET_PARAMS)
+    model.fit(pd.DataFrame({'ds': ds, 'y': y}))
+    return model
+
+
+def series_signature(ds, y):
+    """Impronta SHA-1 di una serie (date, valori) e della configurazione Prophet"""
+    digest = hashlib.sha1(repr(sorted(PROPHET_PARAMS.items())).encode('utf-8'))
+    digest.update(np.asarray(ds, dtype='datetime64[ns]').view('int64').tobytes())
+    digest.update(np.asarray(y, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class FitCache:
+    """Cache LRU dei fit Prophet indicizzata per impronta della serie"""
+
+    def __init__(self, max_entries=FIT_CACHE_MAX_ENTRIES, fit=fit_prophet):
+        """
+        Args:
+            max_entries: Numero massimo di fit in memoria
+            fit: Funzione (ds, y) -> modello Prophet addestrato
+        """
+        self.max_entries = max_entries
+        self.fit = fit
+        self._entries = OrderedDict()   # signature -> (model, compact)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, ds, y, label=None, labels=None, require_model=False):
+        """
+        Restituisce il fit della serie, addestrando il modello solo se non è in cache.
+
+        Args:
+            ds: Date della serie
+            y: Valori della serie
+            label: Descrizione usata nei log (es. 'regional - Lombardia - deceduti')
+            labels: Label delle metriche del fit (es. {'area_type': 'regional', 'indicator': 'deceduti'})
+            require_model: Se True, una voce con il solo CompactProphet (aggiunta con add())
+                viene riaddestrata per ottenere anche il modello Prophet
+
+        Returns:
+            tuple: (modello Prophet, CompactProphet)
+
+        Raises:
+            Exception: Se l'addestramento fallisce
+        """
+        key = series_signature(ds, y)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is not None or not require_model):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Un solo thread per serie esegue il fit, gli altri attendono il risultato
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and (entry[0] is not None or not require_model):
+                    self._stats["hits"] += 1
+                    return entry
+                self._stats["misses"] += 1
+            try:
+                with metrics.in_flight('apollo_prophet_fits_in_flight'), \
+                        metrics.timer('apollo_prophet_fit_duration_seconds', **(labels or {})), span('stan'):
+                    model = self.fit(ds, y)
+                entry = (model, CompactProphet.from_model(model))
+                self._store(key, entry)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+            logger.info(f"Fit Prophet aggiunto alla cache: {label or key[:12]}")
+            return entry
+
+    def contains(self, ds, y):
+        """True se il fit della serie è in cache (non aggiorna l'ordine LRU né le statistiche)"""
+        key = series_signature(ds, y)
+        with self._lock:
+            return key in self._entries
+
+    def add(self, signature, compact, model=None):
+        """
+        Aggiunge un fit calcolato altrove (es. in un processo del pool delle previsioni batch).
+        Senza il modello Prophet la voce serve solo alle previsioni compatte: get() con
+        require_model=True la riaddestra.
+
+        Args:
+            signature: Impronta della serie (series_signature)
+            compact: CompactProphet del fit
+            model: Modello Prophet, se disponibile nel processo corrente
+        """
+        with self._lock:
+            if signature in self._entries:
+                return
+        self._store(signature, (model, compact))
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        """Svuota la cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Restituisce contatori e numero di fit in cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+# Istanza condivisa dal processo
+fit_cache = FitCache()
@@ -3,9 +3,8 @@
 Modulo GeoProphetModel per Apollo Project
 - Implementazione di Prophet per dati regionali e provinciali
 - Supporto per MongoDB come fonte dati
-- Previsioni multi-area (nazione, regione, provincia)
+- Previsioni multi-area (nazione, regione, provincia), valutate con CompactProphet
 """
-from prophet import Prophet
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -15,7 +14,11 @@ import os
 
 # Aggiungi server al path per importare i moduli
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_manager import db_manager
+from db_manager import db_manager, COLLECTION_NATIONAL, COLLECTION_REGIONAL, COLLECTION_PROVINCIAL
+from models.compact_prophet import DEFAULT_INTERVAL_MODE
+from models.fit_cache import fit_cache
+from metrics import metrics
+from request_timing import span, traced
 
 class GeoProphetModel:
     """
@@ -58,8 +61,10 @@ class GeoProphetModel:
         else:
             self.columns = columns
         
-        # Dizionario per memorizzare i modelli addestrati
+        # Dizionario dei modelli addestrati su richiesta, una colonna alla volta
         self.models = {}
+        # Rappresentazioni compatte usate per tutte le previsioni
+        self.compact_models = {}
         # DataFrame di addestramento
         self.train_df = None
         # Ultima data disponibile per i dati di addestramento
@@ -71,9 +76,10 @@ class GeoProphetModel:
         # Connessione al database
         self.db_available = db_manager.connect()
         
-        # Addestra i modelli
-        self._fit_all()
+        # Carica i dati di addestramento (i modelli vengono addestrati al primo utilizzo)
+        self._prepare_training_data()
 
+    @traced('load')
     def _load_data(self):
         """
         Carica i dati per l'addestramento, prima dal database, poi dal CSV.
@@ -86,17 +92,17 @@ class GeoProphetModel:
                 # Determina la query corretta in base al tipo di area
                 if self.area_type == 'national':
                     # Se nazionale, non serve area_name
-                    data = db_manager.db[db_manager.COLLECTION_NATIONAL].find().sort("data", 1)
+                    data = db_manager.db[COLLECTION_NATIONAL].find().sort("data", 1)
                     self.logger.info(f"Dati nazionali caricati dal database")
                 elif self.area_type == 'regional' and self.area_name:
                     # Se regionale, filtra per nome regione
-                    data = db_manager.db[db_manager.COLLECTION_REGIONAL].find(
+                    data = db_manager.db[COLLECTION_REGIONAL].find(
                         {"denominazione_regione": self.area_name}
                     ).sort("data", 1)
                     self.logger.info(f"Dati regionali caricati dal database per: {self.area_name}")
                 elif self.area_type == 'provincial' and self.area_name:
                     # Se provinciale, filtra per nome provincia
-                    data = db_manager.db[db_manager.COLLECTION_PROVINCIAL].find(
+                    data = db_manager.db[COLLECTION_PROVINCIAL].find(
                         {"denominazione_provincia": self.area_name}
                     ).sort("data", 1)
                     self.logger.info(f"Dati provinciali caricati dal database per: {self.area_name}")
@@ -107,11 +113,10 @@ class GeoProphetModel:
                 # Converti i dati dal database in DataFrame
                 df = pd.DataFrame(list(data))
                 
-                # Converti colonna data in datetime se non lo è già
-                if not pd.api.types.is_datetime64_any_dtype(df['data']):
-                    df['data'] = pd.to_datetime(df['data'])
-                
                 if not df.empty:
+                    # Converti colonna data in datetime se non lo è già
+                    if not pd.api.types.is_datetime64_any_dtype(df['data']):
+                        df['data'] = pd.to_datetime(df['data'])
                     return df
                 else:
                     self.logger.warning(f"Nessun dato trovato nel database per {self.area_type} - {self.area_name}")
@@ -141,9 +146,9 @@ class GeoProphetModel:
         self.logger.error(f"Impossibile caricare dati per {self.area_type} - {self.area_name}")
         return None
 
-    def _fit_all(self):
+    def _prepare_training_data(self):
         """
-        Addestra modelli Prophet per tutte le colonne specificate.
+        Carica i dati e seleziona la finestra di addestramento.
         """
         # Carica i dati
         df = self._load_data()
@@ -165,46 +170,108 @@ class GeoProphetModel:
         
         # Memorizza l'ultima data disponibile
         self.last_train_date = self.train_df['data'].max()
+
+    def training_series(self, col):
+        """
+        Serie di addestramento (date, valori) di una colonna, come passata a fit_cache.
         
-        # Addestra un modello per ogni colonna specificata
+        Returns:
+            tuple: (ds, y) oppure None se i dati o la colonna non sono disponibili
+        """
+        if self.train_df is None or col not in self.train_df.columns:
+            return None
+        return self.train_df['data'].values, pd.to_numeric(self.train_df[col], errors='coerce').values
+
+    def is_fitted(self, col):
+        """True se il fit della colonna è già disponibile (nel modello o in fit_cache)"""
+        if col in self.models:
+            return True
+        series = self.training_series(col)
+        return series is not None and fit_cache.contains(*series)
+
+    @traced('fit')
+    def _fit_column(self, col, require_model=False):
+        """
+        Addestra il modello Prophet di una colonna, riusando il fit in cache se i dati sono invariati.
+        Con require_model=True riaddestra un fit di cui è disponibile solo il modello compatto.
+        """
+        if self.train_df is None:
+            return
+        if col in self.models and not (require_model and self.models[col] is None
+                                       and self.compact_models.get(col) is not None):
+            return
+        
+        # Verifica che la colonna esista nei dati
+        series = self.training_series(col)
+        if series is None:
+            self.logger.warning(f"Colonna {col} non trovata nei dati. Modello non addestrato.")
+            return
+        
+        try:
+            model, compact = fit_cache.get(
+                *series,
+                label=f"{self.area_type} - {self.area_name} - {col}",
+                labels={'area_type': self.area_type, 'indicator': col},
+                require_model=require_model
+            )
+            
+            # Memorizza il modello e la sua rappresentazione compatta
+            self.models[col] = model
+            self.compact_models[col] = compact
+            self.logger.info(f"Modello Prophet pronto per {self.area_type} - {self.area_name} - {col}")
+        except Exception as e:
+            self.logger.error(f"Errore addestrando Prophet per {col}: {e}")
+            self.models[col] = None
+            self.compact_models[col] = None
+
+    def _fit_all(self):
+        """
+        Addestra modelli Prophet per tutte le colonne specificate.
+        """
         for col in self.columns:
-            try:
-                # Verifica che la colonna esista nei dati
-                if col not in self.train_df.columns:
-                    self.logger.warning(f"Colonna {col} non trovata nei dati. Modello non addestrato.")
-                    continue
-                
-                # Prepara DataFrame per Prophet (ds, y)
-                prophet_df = pd.DataFrame({
-                    'ds': self.train_df['data'],
-                    'y': self.train_df[col]
-                })
-                
-                # Crea e addestra il modello
-                model = Prophet(weekly_seasonality=True, yearly_seasonality=True, daily_seasonality=False)
-                model.fit(prophet_df)
-                
-                # Memorizza il modello
-                self.models[col] = model
-                self.logger.info(f"Modello Prophet addestrato per {self.area_type} - {self.area_name} - {col}")
-            except Exception as e:
-                self.logger.error(f"Errore addestrando Prophet per {col}: {e}")
-                self.models[col] = None
+            self._fit_column(col)
+
+    def get_model(self, col):
+        """
+        Restituisce il modello Prophet di una colonna, addestrandolo al primo accesso.
+        Se fit_cache contiene solo il modello compatto (fit eseguito nel pool delle previsioni
+        batch) il modello Prophet viene riaddestrato.
+        
+        Returns:
+            Prophet: Modello addestrato o None se non disponibile
+        """
+        if col not in self.columns:
+            return None
+        self._fit_column(col, require_model=True)
+        return self.models.get(col)
+
+    def get_compact_model(self, col):
+        """
+        Restituisce il modello compatto di una colonna, addestrandolo al primo accesso.
+        
+        Returns:
+            CompactProphet: Modello compatto o None se non disponibile
+        """
+        if col not in self.columns:
+            return None
+        self._fit_column(col)
+        return self.compact_models.get(col)
 
-    def forecast(self, days=30):
+    def forecast(self, days=30, intervals=DEFAULT_INTERVAL_MODE):
         """
         Genera previsioni per tutti gli indicatori modellati.
         
         Args:
             days: Numero di giorni futuri da prevedere
+            intervals: Modalità degli intervalli di incertezza ('none', 'fast', 'full')
             
         Returns:
             list: Lista di dizionari con le previsioni
         """
         try:
-            # Se nessun modello è stato addestrato, non possiamo fare previsioni
-            if not self.models or self.last_train_date is None:
-                self.logger.error("Nessun modello addestrato disponibile per la previsione.")
+            # Senza dati di addestramento non possiamo fare previsioni
+            if self.train_df is None or self.last_train_date is None:
+                self.logger.error("Nessun dato di addestramento disponibile per la previsione.")
                 return []
             
             # Crea DataFrame con le date future
@@ -212,17 +279,19 @@ class GeoProphetModel:
                 start=self.last_train_date + pd.Timedelta(days=1),
                 periods=days
             )
-            df_future = pd.DataFrame({'ds': future_dates})
-            
             # Dizionario per memorizzare i risultati per ogni colonna
             results = {col: [] for col in self.columns}
+            predictions = {}
             
             # Genera previsioni per ogni colonna
             for col in self.columns:
-                model = self.models.get(col)
-                if model is not None:
-                    # Esegui la previsione
-                    forecast = model.predict(df_future)
+                compact = self.get_compact_model(col)
+                if compact is not None:
+                    # Esegui la previsione (solo NumPy, una volta per colonna)
+                    with metrics.timer('apollo_prophet_predict_duration_seconds', area_type=self.area_type,
+                                       indicator=col, intervals=intervals), span('predict'):
+                        forecast = compact.predict(future_dates, intervals=intervals)
+                    predictions[col] = forecast
                     
                     # Estrai i valori previsti (yhat) e arrotonda
                     if self.area_type == 'provincial':
@@ -232,8 +301,8 @@ class GeoProphetModel:
                         # Per regioni e nazionale, arrotondiamo a interi
                         results[col] = [int(max(y, 0)) for y in forecast['yhat']]
                     
-                    # Salva anche intervallo di confidenza se disponibile
-                    if 'yhat_lower' in forecast.columns and 'yhat_upper' in forecast.columns:
+                    # Salva anche intervallo di confidenza se richiesto
+                    if 'yhat_lower' in forecast:
                         results[col + '_lower'] = [float(y) for y in forecast['yhat_lower']]
                         results[col + '_upper'] = [float(y) for y in forecast['yhat_upper']]
                     else:
@@ -327,28 +396,19 @@ class GeoProphetModel:
                         entry['totale_positivi'] = cum_values['totale_positivi']
                         entry['totale_positivi_lower'] = cum_values['totale_positivi_lower']
                         entry['totale_positivi_upper'] = cum_values['totale_positivi_upper']
-                
-                # Aggiungi trend e componente stagionale per la metrica principale
-                main_col = self.columns[0]  # Prima colonna come metrica principale
-                model = self.models.get(main_col)
-                
-                if model is not None:
-                    forecast = model.predict(df_future)
-                    
-                    # Estrai componente di trend
-                    entry['trend'] = float(forecast['trend'].iloc[i]) if 'trend' in forecast.columns else None
-                    
-                    # Somma tutte le colonne di stagionalità per la componente stagionale totale
-                    seasonal_cols = [col for col in forecast.columns 
-                                    if col not in ['ds', 'yhat', 'trend', 'yhat_lower', 'yhat_upper']]
-                    
-                    # Log informativo solo per il primo giorno
-                    if i == 0 and seasonal_cols:
-                        self.logger.info(f"Componenti stagionali trovate: {seasonal_cols}")
-                    
-                    # Calcola la componente stagionale totale
-                    entry['seasonal'] = (float(sum(forecast[col].iloc[i] for col in seasonal_cols)) 
-                                        if seasonal_cols else None)
+
+                    # Senza intervalli non ha senso propagare le bande sui cumulativi
+                    if intervals == 'none':
+                        for field in ('totale_casi', 'totale_positivi'):
+                            if field in entry:
+                                entry[field + '_lower'] = None
+                                entry[field + '_upper'] = None
+
+                # Aggiungi trend e componente stagionale (yhat - trend) per la metrica principale
+                main_forecast = predictions.get(self.columns[0])
+                if main_forecast is not None:
+                    entry['trend'] = float(main_forecast['trend'][i])
+                    entry['seasonal'] = float(main_forecast['yhat'][i] - main_forecast['trend'][i])
                 else:
                     entry['trend'] = None
                     entry['seasonal'] = None
@@ -403,7 +463,7 @@ class GeoProphetModel:
         if indicator is None and self.columns:
             indicator = self.columns[0]
             
-        if indicator not in self.columns or indicator not in self.models:
+        if indicator not in self.columns:
             return None
             
         df = self.train_df.sort_values('data')
@@ -413,14 +473,12 @@ class GeoProphetModel:
             days = len(df)
             
         y_true = df[indicator].values[-days:]
-        model = self.models.get(indicator)
+        compact = self.get_compact_model(indicator)
         
-        if model is None:
+        if compact is None:
             return None
             
-        df_future = pd.DataFrame({'ds': df['data'].values[-days:]})
-        forecast = model.predict(df_future)
-        y_pred = forecast['yhat'].values
+        y_pred = compact.predict(df['data'].values[-days:], intervals='none')['yhat']
         
         # Calcola MAPE solo per valori diversi da zero
         mask = y_true != 0
@@ -2,57 +2,115 @@
 """
 Modulo ProphetModel per Apollo Project
 - Permette di addestrare un modello Prophet su una serie temporale
-- Permette di generare previsioni future
+- Permette di generare previsioni future (valutate con CompactProphet, senza Prophet.predict)
 """
-from prophet import Prophet
 import pandas as pd
 
+from models.compact_prophet import DEFAULT_INTERVAL_MODE
+from models.fit_cache import fit_cache
+from metrics import metrics
+from request_timing import span, traced
+
 import logging
 
 class ProphetModel:
-    def __init__(self, csv_path, columns=None, train_days=300):
+    def __init__(self, csv_path, columns=None, train_days=300, data=None):
+        """
+        Args:
+            csv_path: CSV dei dati nazionali
+            columns: Indicatori da prevedere
+            train_days: Giorni iniziali della serie usati per l'addestramento
+            data: DataFrame già caricato dal CSV (es. CovidDataProcessor.national_data), per non
+                rileggere il file; non viene modificato
+        """
         self.csv_path = csv_path
         self.columns = columns or [
             'nuovi_positivi', 'deceduti', 'dimessi_guariti', 'terapia_intensiva', 'ricoverati_con_sintomi'
         ]
         self.train_days = train_days
+        # Modelli addestrati su richiesta, una colonna alla volta (condivisi tramite fit_cache)
         self.models = {}
+        # Rappresentazioni compatte usate per tutte le previsioni
+        self.compact_models = {}
         self.train_df = None
         self.last_train_date = None
         self.logger = logging.getLogger('models.prophet_model')
-        self._fit_all()
-
+        if data is not None:
+            self._use_data(data)
+        else:
+            self._load_data()
 
-    def _fit_all(self):
+    @traced('csv')
+    def _load_data(self):
         df = pd.read_csv(self.csv_path)
         self.logger.info(f"Dati caricati: {len(df)} record da {df['data'].iloc[0]} a {df['data'].iloc[-1]}")
         df['data'] = pd.to_datetime(df['data'])
+        self._use_data(df)
+
+    def _use_data(self, df):
+        """Seleziona la finestra di addestramento (i primi train_days giorni) da un DataFrame con 'data' datetime"""
         df = df.sort_values('data')
         self.train_df = df.iloc[:self.train_days].copy()
         self.last_train_date = self.train_df['data'].max()
+
+    @traced('fit')
+    def _fit_column(self, col, require_model=False):
+        """Addestra (o recupera dalla cache) il modello di una colonna (require_model: serve anche il modello Prophet)"""
+        if col in self.models and not (require_model and self.models[col] is None
+                                       and self.compact_models.get(col) is not None):
+            return
+        try:
+            model, compact = fit_cache.get(self.train_df['data'].values, self.train_df[col].values,
+                                           label=f"{self.csv_path} - {col}",
+                                           labels={'area_type': 'national', 'indicator': col},
+                                           require_model=require_model)
+            self.models[col] = model
+            self.compact_models[col] = compact
+            self.logger.info(f"Modello Prophet pronto per {col}")
+        except Exception as e:
+            self.logger.error(f"Errore addestrando Prophet per {col}: {e}")
+            self.models[col] = None
+            self.compact_models[col] = None
+
+    def _fit_all(self):
         for col in self.columns:
-            try:
-                prophet_df = pd.DataFrame({'ds': self.train_df['data'], 'y': self.train_df[col]})
-                model = Prophet(weekly_seasonality=True, yearly_seasonality=True, daily_seasonality=False)
-                model.fit(prophet_df)
-                self.models[col] = model
-                self.logger.info(f"Modello Prophet addestrato per {col}")
-            except Exception as e:
-                self.logger.error(f"Errore addestrando Prophet per {col}: {e}")
-                self.models[col] = None
+            self._fit_column(col)
+
+    def get_model(self, col):
+        """Restituisce il modello Prophet della colonna, addestrandolo al primo accesso (anche se in cache c'è solo il compatto)"""
+        if col not in self.columns:
+            return None
+        self._fit_column(col, require_model=True)
+        return self.models.get(col)
+
+    def get_compact_model(self, col):
+        """Restituisce il modello compatto della colonna, addestrandolo al primo accesso"""
+        if col not in self.columns:
+            return None
+        self._fit_column(col)
+        return self.compact_models.get(col)
+
+    def forecast(self, days=30, intervals=DEFAULT_INTERVAL_MODE):
+        """
+        Genera le previsioni per tutti gli indicatori.
 
-    def forecast(self, days=30):
+        Args:
+            days: Numero di giorni futuri da prevedere
+            intervals: Modalità degli intervalli di incertezza ('none', 'fast', 'full')
+        """
         try:
             future_dates = pd.date_range(start=self.last_train_date + pd.Timedelta(days=1), periods=days)
-            df_future = pd.DataFrame({'ds': future_dates})
             results = {col: [] for col in self.columns}
+            predictions = {}
             for col in self.columns:
-                model = self.models.get(col)
-                if model is not None:
-                    forecast = model.predict(df_future)
+                compact = self.get_compact_model(col)
+                if compact is not None:
+                    with metrics.timer('apollo_prophet_predict_duration_seconds', area_type='national',
+                                       indicator=col, intervals=intervals), span('predict'):
+                        forecast = compact.predict(future_dates, intervals=intervals)
+                    predictions[col] = forecast
                     results[col] = [int(max(y, 0)) for y in forecast['yhat']]
-                    # Salva anche intervallo di confidenza se disponibili
-                    if 'yhat_lower' in forecast.columns and 'yhat_upper' in forecast.columns:
+                    if 'yhat_lower' in forecast:
                         results[col + '_lower'] = [float(y) for y in forecast['yhat_lower']]
                         results[col + '_upper'] = [float(y) for y in forecast['yhat_upper']]
                     else:
@@ -63,6 +121,7 @@ class ProphetModel:
                     results[col + '_lower'] = [None] * days
                     results[col + '_upper'] = [None] * days
             forecast_json = []
+            main_col = 'nuovi_positivi' if 'nuovi_positivi' in self.columns else self.columns[0]
             # Calcolo cumulativo dei totali a partire dall'ultimo valore reale
             last_row = self.train_df.iloc[-1]
             last_totale_casi = int(last_row['totale_casi']) if not pd.isnull(last_row['totale_casi']) else 0
@@ -109,28 +168,16 @@ class ProphetModel:
                 entry['totale_positivi'] = cum_positivi
                 entry['totale_positivi_lower'] = cum_positivi_lower
                 entry['totale_positivi_upper'] = cum_positivi_upper
-                # Se vuoi aggiungere cumulativi anche ad altri indicatori derivati, aggiungi qui la logica.                
-                # # Aggiungi trend e seasonal dalla previsione Prophet SOLO per la colonna principale (nuovi_positivi)
-                main_col = 'nuovi_positivi' if 'nuovi_positivi' in self.columns else self.columns[0]
-                model = self.models.get(main_col)
-                if model is not None:
-                    forecast = model.predict(df_future)
-                    # Log diagnostico dei primi valori della componente stagionale totale
-                    if i == 0:
-                        seasonal_cols = [col for col in forecast.columns if col not in ['ds', 'yhat', 'trend', 'yhat_lower', 'yhat_upper']]
-                        first10 = [float(sum(forecast[col].iloc[j] for col in seasonal_cols)) if seasonal_cols else None for j in range(10)]
-                        self.logger.info(f"Primi 10 valori stagionalità totale Prophet ({main_col}): {first10}")
-                        self.logger.info(f"Colonne di stagionalità trovate da Prophet: {seasonal_cols}")
-                        if not seasonal_cols:
-                            self.logger.warning("Nessuna componente stagionale trovata: verifica che Prophet abbia weekly/yearly seasonality attive e che i dati abbiano pattern periodici.")
-                    entry['trend'] = float(forecast['trend'].iloc[i]) if 'trend' in forecast.columns else None
-                    # Somma tutte le colonne di stagionalità per la componente stagionale totale
-                    seasonal_cols = [col for col in forecast.columns if col not in ['ds', 'yhat', 'trend', 'yhat_lower', 'yhat_upper']]
-                    if i == 0:
-                        self.logger.info(f"Colonne di stagionalità trovate da Prophet: {seasonal_cols}")
-                        if not seasonal_cols:
-                            self.logger.warning("Nessuna componente stagionale trovata: verifica che Prophet abbia weekly/yearly seasonality attive e che i dati abbiano pattern periodici.")
-                    entry['seasonal'] = float(sum(forecast[col].iloc[i] for col in seasonal_cols)) if seasonal_cols else None
+                if intervals == 'none':
+                    # Senza intervalli non ha senso propagare le bande sui cumulativi
+                    for field in ('totale_casi', 'totale_positivi'):
+                        entry[field + '_lower'] = None
+                        entry[field + '_upper'] = None
+                # Trend e componente stagionale (yhat - trend) SOLO per la colonna principale
+                main_forecast = predictions.get(main_col)
+                if main_forecast is not None:
+                    entry['trend'] = float(main_forecast['trend'][i])
+                    entry['seasonal'] = float(main_forecast['yhat'][i] - main_forecast['trend'][i])
                 else:
                     entry['trend'] = None
                     entry['seasonal'] = None
@@ -161,12 +208,10 @@ class ProphetModel:
             return None
         df = self.train_df.sort_values('data')
         y_true = df[indicator].values[-days:]
-        model = self.models.get(indicator)
-        if model is None:
+        compact = self.get_compact_model(indicator)
+        if compact is None:
             return None
-        df_future = pd.DataFrame({'ds': df['data'].values[-days:]})
-        forecast = model.predict(df_future)
-        y_pred = forecast['yhat'].values
+        y_pred = compact.predict(df['data'].values[-days:], intervals='none')['yhat']
         mask = y_true != 0
         if not np.any(mask):
             return None
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Temporizzazione per richiesta e profilazione su richiesta per Apollo Project.
+
+Gli span (caricamento CSV, letture MongoDB, fit, predict, serializzazione JSON) vengono
+accumulati per nome nella richiesta corrente e restituiti nell'header Server-Timing e in una
+riga di log JSON. Gli span possono essere annidati (es. 'stan' è contenuto in 'fit'); fuori da
+una richiesta (thread di riscaldamento, script) span() non misura nulla.
+
+La profilazione cProfile di una richiesta si attiva con l'header X-Apollo-Profile (valore: il
+segreto admin) oppure a campione con APOLLO_PROFILE_SAMPLE_RATE; i profili vengono salvati in
+APOLLO_PROFILE_DIR e scaricati da /admin/profiles. Entrambe richiedono APOLLO_ADMIN_SECRET:
+senza il segreto la profilazione è disattivata.
+
+Variabili d'ambiente:
+- APOLLO_TIMING_LOG_MS: richieste più lente di questa soglia loggate a INFO (default: 250, le altre a DEBUG)
+- APOLLO_PROFILE_SAMPLE_RATE: frazione di richieste profilate a campione (default: 0)
+- APOLLO_PROFILE_DIR: cartella dei profili (default: server/profiles)
+- APOLLO_PROFILE_KEEP: numero massimo di profili conservati (default: 50)
+"""
+
+import os
+import re
+import io
+import json
+import time
+import uuid
+import random
+import pstats
+import logging
+import cProfile
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger('apollo-timing')
+
+TIMING_LOG_MS = float(os.environ.get('APOLLO_TIMING_LOG_MS', 250))
+PROFILE_SAMPLE_RATE = float(os.environ.get('APOLLO_PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('APOLLO_PROFILE_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_KEEP = int(os.environ.get('APOLLO_PROFILE_KEEP', 50))
+
+_PROFILE_ID = re.compile(r'^[0-9]+-[0-9]+-[0-9a-f]{8}$')
+
+# Temporizzazione della richiesta in corso (None fuori dalle richieste)
+_current = contextvars.ContextVar('apollo_request_timing', default=None)
+
+
+class RequestTiming:
+    """Span di una richiesta, sommati per nome"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}             # nome -> [durata in secondi, numero di span]
+
+    def add(self, name, duration):
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [duration, 1]
+        else:
+            entry[0] += duration
+            entry[1] += 1
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total=None):
+        """Valore dell'header Server-Timing (es. 'mongo;desc="3x";dur=12.4, total;dur=40.1')"""
+        parts = []
+        for name, (duration, count) in self.spans.items():
+            desc = f';desc="{count}x"' if count > 1 else ''
+            parts.append(f"{name}{desc};dur={duration * 1000:.1f}")
+        parts.append(f"total;dur={(self.elapsed if total is None else total) * 1000:.1f}")
+        return ', '.join(parts)
+
+    def to_dict(self):
+        return {name: {'ms': round(duration * 1000, 2), 'count': count}
+                for name, (duration, count) in self.spans.items()}
+
+
+def start_request():
+    """Inizia la temporizzazione della richiesta corrente"""
+    timing = RequestTiming()
+    _current.set(timing)
+    return timing
+
+
+def end_request():
+    """Chiude la temporizzazione della richiesta corrente e la restituisce"""
+    timing = _current.get()
+    _current.set(None)
+    return timing
+
+
+def current():
+    """Temporizzazione della richiesta corrente (None fuori dalle richieste)"""
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Misura il blocco come span della richiesta corrente"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+def traced(name):
+    """Decoratore: la chiamata diventa uno span della richiesta corrente"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def log_request(timing, method, path, status, profile_id=None):
+    """Riga di log JSON con durata e span della richiesta"""
+    total_ms = round(timing.elapsed * 1000, 2)
+    record = {
+        'event': 'request_timing',
+        'method': method,
+        'path': path,
+        'status': status,
+        'duration_ms': total_ms,
+        'spans': timing.to_dict()
+    }
+    if profile_id:
+        record['profile_id'] = profile_id
+    level = logging.INFO if total_ms >= TIMING_LOG_MS else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps(record))
+
+
+class RequestProfiler:
+    """Profilazione cProfile delle richieste selezionate, salvata su disco"""
+
+    def __init__(self, profile_dir=PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE, keep=PROFILE_KEEP):
+        """
+        Args:
+            profile_dir: Cartella dei profili (.prof + .json con i dati della richiesta)
+            sample_rate: Frazione di richieste profilate anche senza header
+            keep: Numero massimo di profili conservati (i più vecchi vengono eliminati)
+        """
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.keep = keep
+
+    def should_profile(self, requested):
+        """True se la richiesta va profilata (header valido o estrazione a campione)"""
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self):
+        """Avvia il profiler; None se un altro profiler è già attivo (es. richiesta concorrente)"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            logger.debug(f"Profilazione non avviata: {e}")
+            return None
+        return profile
+
+    def stop(self, profile, **info):
+        """Ferma il profiler, salva il profilo e restituisce il suo id"""
+        profile.disable()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile_id = f"{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        profile.dump_stats(os.path.join(self.profile_dir, f"{profile_id}.prof"))
+        with open(os.path.join(self.profile_dir, f"{profile_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(dict(info, id=profile_id, created_at=time.time()), f)
+        self._prune()
+        return profile_id
+
+    def list(self):
+        """Profili salvati, dal più recente"""
+        if not os.path.isdir(self.profile_dir):
+            return []
+        profiles = []
+        for filename in os.listdir(self.profile_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.profile_dir, filename), 'r', encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda p: p.get('created_at', 0), reverse=True)
+
+    def path(self, profile_id):
+        """Percorso del file .prof (None se l'id non è valido o il profilo non esiste)"""
+        if not _PROFILE_ID.match(profile_id or ''):
+            return None
+        path = os.path.join(self.profile_dir, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=50):
+        """Riepilogo testuale pstats del profilo (None se non esiste)"""
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def _prune(self):
+        profiles = self.list()
+        for info in profiles[self.keep:]:
+            for ext in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(self.profile_dir, f"{info['id']}{ext}"))
+                except OSError:
+                    pass
+
+
+# Istanza condivisa dal processo
+profiler = RequestProfiler()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Cache LRU in-process per risultati di calcolo delle API (serie ridotte, finestre di dati...).
+
+Le chiavi includono sempre la versione del dataset da cui il risultato è derivato, così un
+nuovo import rende irraggiungibili le voci vecchie senza invalidazioni esplicite: vengono
+eliminate dall'LRU. I valori restituiti sono condivisi e non vanno modificati.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Cache LRU thread-safe con calcolo su richiesta"""
+
+    def __init__(self, max_entries=256):
+        """
+        Args:
+            max_entries: Numero massimo di risultati in memoria
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_or_compute(self, key, compute):
+        """Restituisce il risultato in cache per key, altrimenti lo calcola con compute() e lo memorizza"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._entries[key]
+            self._stats["misses"] += 1
+        # Calcolo fuori dal lock: due richieste concorrenti possono calcolare lo stesso valore
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def get(self, key):
+        """Risultato in cache per key, None se assente"""
+        with self._lock:
+            if key not in self._entries:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Memorizza un risultato calcolato fuori da get_or_compute (es. in un altro processo)"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Statistiche della cache (hit, miss, evizioni, voci)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Aggregati settimanali e mensili (rollup) dei dati DPC per area.
+
+Per ogni area e periodo vengono salvati somma, media, minimo e massimo di ogni metrica
+giornaliera; le metriche cumulative (deceduti, dimessi_guariti, totale_casi) vengono aggregate
+sull'incremento giornaliero (es. deceduti_giornalieri), più il valore cumulativo a fine periodo
+('last'). Ogni documento ha la forma {area_name, period_start, period_end, days,
+stats: {metrica: {sum, mean, min, max}}}.
+Le settimane iniziano il lunedì, i mesi il primo giorno del mese.
+
+Dopo un'importazione vengono ricalcolati solo i periodi che contengono date modificate
+(stessa mappa first_changed usata dal feature store), così le API di lungo periodo leggono
+poche decine di documenti di rollup invece di migliaia di righe giornaliere.
+"""
+
+import sys
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db_manager import db_manager
+from feature_pipeline import AREA_COLUMNS, CUMULATIVE_METRICS, DAILY_METRICS, _prepare_frame
+
+logger = logging.getLogger('apollo-rollups')
+
+# Frequenza pandas dei periodi per ogni granularità
+GRANULARITIES = {
+    'weekly': 'W-SUN',
+    'monthly': 'M'
+}
+STATISTICS = ('sum', 'mean', 'min', 'max')
+# Giorni precedenti al periodo necessari per l'incremento giornaliero delle metriche cumulative
+LOOKBACK_DAYS = 7
+
+
+def _daily_series(df, area_col):
+    """Metriche giornaliere: quelle DPC già giornaliere e gli incrementi di quelle cumulative"""
+    series = pd.DataFrame(index=df.index)
+    for metric in DAILY_METRICS:
+        if metric in df.columns:
+            series[metric] = pd.to_numeric(df[metric], errors='coerce')
+    cumulative = [m for m in CUMULATIVE_METRICS if m in df.columns]
+    if cumulative:
+        values = df[cumulative].apply(pd.to_numeric, errors='coerce')
+        daily = values.groupby(df[area_col], sort=False).diff()
+        for metric in cumulative:
+            series[f'{metric}_giornalieri'] = daily[metric]
+    return series, cumulative
+
+
+def compute_rollups(df, area_type, granularity):
+    """
+    Calcola i rollup di tutte le aree di un DataFrame con un'unica aggregazione vettoriale.
+
+    Args:
+        df: DataFrame in formato DPC (una riga per area e data)
+        area_type: Tipo di area ('national', 'regional', 'provincial')
+        granularity: 'weekly' o 'monthly'
+
+    Returns:
+        pandas.DataFrame: Colonne 'area_name', 'period_start', 'period_end', 'days' e
+        '<metrica>_<statistica>' per ogni metrica e statistica ('<metrica>_last' per le cumulative)
+    """
+    area_col = AREA_COLUMNS[area_type]
+    df = _prepare_frame(df, area_type)
+    if df.empty:
+        return pd.DataFrame(columns=['area_name', 'period_start', 'period_end', 'days'])
+
+    series, cumulative = _daily_series(df, area_col)
+    metrics = list(series.columns)
+    period = df['data'].dt.to_period(GRANULARITIES[granularity])
+    keys = [df[area_col].rename('area_name'), period.dt.start_time.rename('period_start')]
+
+    grouped = series.groupby(keys, sort=True)
+    stats = grouped.agg(list(STATISTICS))
+    stats.columns = [f'{metric}_{stat}' for metric, stat in stats.columns]
+    # La somma di un periodo senza valori è NaN, non 0
+    counts = grouped.count()
+    for metric in metrics:
+        stats.loc[counts[metric] == 0, f'{metric}_sum'] = np.nan
+    stats['days'] = df.groupby(keys, sort=True)['data'].nunique()
+    for metric in cumulative:
+        last = pd.to_numeric(df[metric], errors='coerce').groupby(keys, sort=True).last()
+        stats[f'{metric}_last'] = last
+    mean_columns = [f'{metric}_mean' for metric in metrics]
+    stats[mean_columns] = stats[mean_columns].round(2)
+    stats = stats.reset_index()
+    stats.insert(2, 'period_end', stats['period_start'].dt.to_period(GRANULARITIES[granularity])
+                 .dt.end_time.dt.normalize())
+    return stats
+
+
+def to_documents(rollups):
+    """Righe di compute_rollups -> documenti con le statistiche raggruppate per metrica (NaN -> None)"""
+    documents = []
+    for row in rollups.astype(object).where(rollups.notna(), None).to_dict('records'):
+        doc = {key: row.pop(key) for key in ('area_name', 'period_start', 'period_end', 'days')}
+        stats = {}
+        for column, value in row.items():
+            metric, _, stat = column.rpartition('_')
+            stats.setdefault(metric, {})[stat] = value
+        doc['stats'] = stats
+        documents.append(doc)
+    return documents
+
+
+def update_rollups(area_type, df, changed_from=None, granularities=None):
+    """
+    Ricalcola e salva i rollup dei periodi interessati da un'importazione.
+
+    Args:
+        area_type: Tipo di area ('national', 'regional', 'provincial')
+        df: DataFrame con i dati completi del livello (ad es. appena importati)
+        changed_from: Mappa area -> prima data modificata (None = ricalcolo completo).
+                      Per i dati nazionali la chiave è None.
+        granularities: Granularità da aggiornare (default: tutte)
+
+    Returns:
+        dict: Per ogni granularità il risultato del salvataggio con il numero di periodi ricalcolati
+    """
+    granularities = granularities or list(GRANULARITIES)
+    if changed_from is not None and not changed_from:
+        return {g: {"success": True, "recomputed": 0, "inserted": 0, "updated": 0} for g in granularities}
+
+    area_col = AREA_COLUMNS[area_type]
+    df = _prepare_frame(df, area_type)
+    changed = None
+    if changed_from is not None:
+        # I dati nazionali sono registrati senza nome area
+        changed = {('ITA' if k is None else k): pd.Timestamp(v) for k, v in changed_from.items()}
+
+    result = {}
+    for granularity in granularities:
+        frame = df
+        if changed is not None:
+            # Primo periodo da ricalcolare per ogni area modificata, più il look-back per gli incrementi
+            first_period = df[area_col].map(changed).dt.to_period(GRANULARITIES[granularity]).dt.start_time
+            frame = df[df['data'] >= first_period - pd.Timedelta(days=LOOKBACK_DAYS)]
+        rollups = compute_rollups(frame, area_type, granularity)
+        if changed is not None:
+            first_period = rollups['area_name'].map(changed).dt.to_period(GRANULARITIES[granularity]).dt.start_time
+            rollups = rollups[rollups['period_start'] >= first_period]
+        saved = db_manager.save_rollups_bulk(area_type, granularity, to_documents(rollups))
+        saved["recomputed"] = len(rollups)
+        result[granularity] = saved
+        logger.info(f"Rollup {granularity} {area_type} ricalcolati per {len(rollups)} periodi")
+    return result
+
+
+def parse_arguments():
+    """Analizza gli argomenti dalla riga di comando"""
+    parser = argparse.ArgumentParser(description="Ricalcolo dei rollup settimanali e mensili di Apollo")
+    parser.add_argument("--area-type", choices=list(AREA_COLUMNS), action="append",
+                        help="Livello da ricalcolare (ripetibile, default: tutti)")
+    parser.add_argument("--granularity", choices=list(GRANULARITIES), action="append",
+                        help="Granularità da ricalcolare (ripetibile, default: tutte)")
+    parser.add_argument("--since", help="Ricalcola solo i periodi che contengono date >= YYYY-MM-DD")
+    return parser.parse_args()
+
+
+def main():
+    """Ricalcola i rollup leggendo i dati da MongoDB"""
+    args = parse_arguments()
+    if not db_manager.connect():
+        logger.error("Impossibile connettersi al database MongoDB.")
+        return 1
+
+    since = datetime.fromisoformat(args.since) if args.since else None
+    # Il mese che contiene since più il look-back degli incrementi giornalieri
+    start_date = since.replace(day=1) - timedelta(days=LOOKBACK_DAYS) if since else None
+    loaders = {
+        'national': lambda: db_manager.get_national_data(start_date=start_date),
+        'regional': lambda: db_manager.get_regional_data(start_date=start_date),
+        'provincial': lambda: db_manager.get_provincial_data(start_date=start_date)
+    }
+    for area_type in args.area_type or list(AREA_COLUMNS):
+        df = pd.DataFrame(loaders[area_type]())
+        if df.empty:
+            logger.warning(f"Nessun dato {area_type} nel database")
+            continue
+        changed_from = None
+        if since:
+            areas = df[AREA_COLUMNS[area_type]].unique() if AREA_COLUMNS[area_type] in df.columns else ['ITA']
+            changed_from = {area: since for area in areas}
+        result = update_rollups(area_type, df, changed_from, args.granularity)
+        logger.info(f"Rollup {area_type}: {result}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
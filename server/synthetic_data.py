@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Generatore di dataset sintetici con lo schema dei CSV della Protezione Civile (DPC).
+
+Produce serie nazionali (per uno o più paesi), regionali e provinciali con numero di aree,
+lunghezza dello storico, stagionalità, rumore e valori mancanti configurabili, per provare
+importazione, addestramento e query su volumi che i CSV inclusi nel repository non coprono.
+
+Le serie sono generate in modo vettoriale (aree x giorni) e sono riproducibili dato il seed:
+- nuovi_positivi: ondate gaussiane + stagionalità annuale e settimanale + rumore lognormale
+- totale_casi, deceduti, dimessi_guariti: cumulati coerenti con i nuovi casi
+- ricoverati_con_sintomi, terapia_intensiva, isolamento_domiciliare: quote dei positivi attivi
+
+Esempi:
+    python synthetic_data.py --output-dir /tmp/apollo-synth --days 3650 --regions 200 --provinces-per-region 10
+    python synthetic_data.py --countries ITA,FRA,ESP --days 1825 --mongo
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('apollo-synthetic')
+
+DEFAULT_START_DATE = '2020-02-24'
+DEFAULT_DAYS = 1000
+DEFAULT_REGIONS = 21
+DEFAULT_PROVINCES_PER_REGION = 5
+DEFAULT_SEASONALITY = 0.3
+DEFAULT_WEEKLY = 0.2
+DEFAULT_NOISE = 0.15
+DEFAULT_MISSING = 0.0
+DEFAULT_SEED = 42
+# Ora di pubblicazione dei bollettini DPC
+REPORT_TIME = pd.Timedelta(hours=17)
+
+NATIONAL_COLUMNS = [
+    'data', 'stato', 'ricoverati_con_sintomi', 'terapia_intensiva', 'totale_ospedalizzati',
+    'isolamento_domiciliare', 'totale_positivi', 'variazione_totale_positivi', 'nuovi_positivi',
+    'dimessi_guariti', 'deceduti', 'totale_casi', 'tamponi', 'casi_testati'
+]
+REGIONAL_COLUMNS = NATIONAL_COLUMNS[:2] + ['codice_regione', 'denominazione_regione', 'lat', 'long'] + \
+    NATIONAL_COLUMNS[2:] + ['codice_nuts_1', 'codice_nuts_2']
+PROVINCIAL_COLUMNS = [
+    'data', 'stato', 'codice_regione', 'denominazione_regione', 'codice_provincia', 'denominazione_provincia',
+    'sigla_provincia', 'lat', 'long', 'totale_casi', 'codice_nuts_1', 'codice_nuts_2', 'codice_nuts_3'
+]
+# Indicatori soggetti a valori mancanti (le colonne identificative restano sempre valorizzate)
+MISSING_COLUMNS = ['ricoverati_con_sintomi', 'terapia_intensiva', 'isolamento_domiciliare',
+                   'nuovi_positivi', 'tamponi', 'casi_testati']
+
+
+def national_filename(country):
+    """Nome del CSV nazionale letto da CovidDataProcessor"""
+    return f"dpc-covid19-{country.lower()}-andamento-nazionale.csv"
+
+
+REGIONAL_FILENAME = "dpc-covid19-ita-regioni.csv"
+PROVINCIAL_FILENAME = "dpc-covid19-ita-province.csv"
+
+
+class SyntheticDataGenerator:
+    """Genera DataFrame sintetici con lo schema dei CSV DPC"""
+
+    def __init__(self, days=DEFAULT_DAYS, start_date=DEFAULT_START_DATE, seasonality=DEFAULT_SEASONALITY,
+                 weekly=DEFAULT_WEEKLY, noise=DEFAULT_NOISE, missing=DEFAULT_MISSING, seed=DEFAULT_SEED):
+        """
+        Args:
+            days: Giorni di storico per ogni area
+            start_date: Prima data delle serie
+            seasonality: Ampiezza relativa della stagionalità annuale (0 = assente)
+            weekly: Ampiezza relativa dell'effetto settimanale (calo nel fine settimana)
+            noise: Deviazione standard del rumore lognormale moltiplicativo
+            missing: Frazione di valori mancanti negli indicatori (0-1)
+            seed: Seed del generatore casuale
+        """
+        self.days = int(days)
+        self.dates = pd.date_range(start_date, periods=self.days, freq='D') + REPORT_TIME
+        self.seasonality = seasonality
+        self.weekly = weekly
+        self.noise = noise
+        self.missing = missing
+        self.rng = np.random.default_rng(seed)
+
+    def _new_cases(self, scales):
+        """
+        Nuovi casi giornalieri per più aree.
+
+        Args:
+            scales: Array (aree,) con il livello medio di ogni area
+
+        Returns:
+            numpy.ndarray: Matrice (aree, giorni) di interi non negativi
+        """
+        n_areas = len(scales)
+        t = np.arange(self.days, dtype=float)
+        # Ondate comuni a tutte le aree, con sfasamento e intensità locali
+        n_waves = max(1, self.days // 180)
+        centers = self.rng.uniform(0, self.days, n_waves)
+        widths = self.rng.uniform(15, 45, n_waves)
+        heights = self.rng.uniform(0.5, 3.0, n_waves)
+        shifts = self.rng.normal(0, 7, (n_areas, 1))
+        local = self.rng.uniform(0.7, 1.3, (n_areas, n_waves))
+        waves = np.zeros((n_areas, self.days))
+        for i in range(n_waves):
+            waves += local[:, i:i + 1] * heights[i] * np.exp(-0.5 * ((t - centers[i] - shifts) / widths[i]) ** 2)
+        day_of_year = self.dates.dayofyear.values
+        yearly = 1 + self.seasonality * np.cos(2 * np.pi * (day_of_year - 15) / 365.25)
+        weekday = self.dates.dayofweek.values
+        weekly = 1 - self.weekly * np.isin(weekday, (0, 6))
+        mean = np.asarray(scales, dtype=float)[:, None] * (0.2 + waves) * yearly * weekly
+        noise = self.rng.lognormal(0, self.noise, mean.shape) if self.noise else 1.0
+        return np.round(mean * noise).astype(np.int64)
+
+    def _epidemic_columns(self, new_cases):
+        """Colonne DPC derivate dai nuovi casi (matrici aree x giorni)"""
+        totale_casi = np.cumsum(new_cases, axis=1)
+        # Esiti con ritardo: guarigioni dopo ~14 giorni, decessi dopo ~10 giorni
+        recovered = np.zeros_like(new_cases)
+        recovered[:, 14:] = np.round(new_cases[:, :-14] * 0.98) if self.days > 14 else 0
+        deaths = np.zeros_like(new_cases)
+        deaths[:, 10:] = np.round(new_cases[:, :-10] * 0.015) if self.days > 10 else 0
+        dimessi_guariti = np.cumsum(recovered, axis=1)
+        deceduti = np.cumsum(deaths, axis=1)
+        totale_positivi = np.maximum(totale_casi - dimessi_guariti - deceduti, 0)
+        ricoverati = np.round(totale_positivi * 0.04).astype(np.int64)
+        terapia_intensiva = np.round(totale_positivi * 0.005).astype(np.int64)
+        variazione = np.diff(totale_positivi, axis=1, prepend=0)
+        tamponi = np.cumsum(np.round(new_cases * self.rng.uniform(8, 15, (len(new_cases), 1))), axis=1)
+        return {
+            'ricoverati_con_sintomi': ricoverati,
+            'terapia_intensiva': terapia_intensiva,
+            'totale_ospedalizzati': ricoverati + terapia_intensiva,
+            'isolamento_domiciliare': totale_positivi - ricoverati - terapia_intensiva,
+            'totale_positivi': totale_positivi,
+            'variazione_totale_positivi': variazione,
+            'nuovi_positivi': new_cases,
+            'dimessi_guariti': dimessi_guariti,
+            'deceduti': deceduti,
+            'totale_casi': totale_casi,
+            'tamponi': tamponi.astype(np.int64),
+            'casi_testati': np.round(tamponi * 0.6).astype(np.int64)
+        }
+
+    def _frame(self, area_values, columns, identity):
+        """
+        Appiattisce matrici (aree x giorni) in un DataFrame ordinato per data e area.
+
+        Args:
+            area_values: dict colonna -> matrice (aree, giorni)
+            columns: Ordine delle colonne in uscita
+            identity: dict colonna -> array (aree,) con i campi identificativi
+        """
+        n_areas = len(next(iter(area_values.values())))
+        frame = {'data': np.repeat(self.dates.strftime('%Y-%m-%dT%H:%M:%S').values, n_areas)}
+        for column, values in identity.items():
+            frame[column] = np.tile(np.asarray(values), self.days)
+        for column, values in area_values.items():
+            frame[column] = np.asarray(values).T.reshape(-1)
+        df = pd.DataFrame(frame)
+        if self.missing:
+            for column in MISSING_COLUMNS:
+                if column in df.columns:
+                    mask = self.rng.random(len(df)) < self.missing
+                    df[column] = df[column].astype(float).mask(mask)
+        return df[[c for c in columns if c in df.columns]]
+
+    def national(self, country='ITA', scale=5000):
+        """Serie nazionale di un paese"""
+        values = self._epidemic_columns(self._new_cases([scale]))
+        return self._frame(values, NATIONAL_COLUMNS, {'stato': [country]})
+
+    def regional(self, n_regions=DEFAULT_REGIONS, scale=5000):
+        """Serie regionali: il livello nazionale è ripartito tra le regioni con pesi casuali"""
+        weights = self.rng.dirichlet(np.full(n_regions, 2.0))
+        values = self._epidemic_columns(self._new_cases(weights * scale))
+        codes = np.arange(1, n_regions + 1)
+        identity = {
+            'stato': np.full(n_regions, 'ITA'),
+            'codice_regione': codes,
+            'denominazione_regione': [f"Regione {code:04d}" for code in codes],
+            'lat': np.round(self.rng.uniform(36.6, 47.1, n_regions), 8),
+            'long': np.round(self.rng.uniform(6.6, 18.5, n_regions), 8),
+            'codice_nuts_1': [f"IT{code % 5 + 1}" for code in codes],
+            'codice_nuts_2': [f"IT{code:04d}" for code in codes]
+        }
+        return self._frame(values, REGIONAL_COLUMNS, identity)
+
+    def provincial(self, n_regions=DEFAULT_REGIONS, provinces_per_region=DEFAULT_PROVINCES_PER_REGION, scale=5000):
+        """Serie provinciali (solo totale_casi, come nei CSV DPC)"""
+        n_provinces = n_regions * provinces_per_region
+        weights = self.rng.dirichlet(np.full(n_provinces, 2.0))
+        new_cases = self._new_cases(weights * scale)
+        region_codes = np.repeat(np.arange(1, n_regions + 1), provinces_per_region)
+        codes = np.arange(1, n_provinces + 1)
+        identity = {
+            'stato': np.full(n_provinces, 'ITA'),
+            'codice_regione': region_codes,
+            'denominazione_regione': [f"Regione {code:04d}" for code in region_codes],
+            'codice_provincia': [f"{code:03d}" for code in codes],
+            'denominazione_provincia': [f"Provincia {code:05d}" for code in codes],
+            'sigla_provincia': [f"P{code:04d}" for code in codes],
+            'lat': np.round(self.rng.uniform(36.6, 47.1, n_provinces), 8),
+            'long': np.round(self.rng.uniform(6.6, 18.5, n_provinces), 8),
+            'codice_nuts_1': [f"IT{code % 5 + 1}" for code in region_codes],
+            'codice_nuts_2': [f"IT{code:04d}" for code in region_codes],
+            'codice_nuts_3': [f"IT{code:05d}" for code in codes]
+        }
+        return self._frame({'totale_casi': np.cumsum(new_cases, axis=1)}, PROVINCIAL_COLUMNS, identity)
+
+
+def generate_dataset(output_dir, countries=('ITA',), days=DEFAULT_DAYS, regions=DEFAULT_REGIONS,
+                     provinces_per_region=DEFAULT_PROVINCES_PER_REGION, start_date=DEFAULT_START_DATE,
+                     seasonality=DEFAULT_SEASONALITY, weekly=DEFAULT_WEEKLY, noise=DEFAULT_NOISE,
+                     missing=DEFAULT_MISSING, seed=DEFAULT_SEED):
+    """
+    Genera i CSV nazionali, regionale e provinciale in output_dir.
+
+    Returns:
+        dict: Percorsi generati ('national' -> {paese: percorso}, 'regional', 'provincial') e numero di righe
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    generator = SyntheticDataGenerator(days, start_date, seasonality, weekly, noise, missing, seed)
+    paths = {'national': {}, 'rows': {}}
+    for country in countries:
+        path = os.path.join(output_dir, national_filename(country))
+        df = generator.national(country)
+        df.to_csv(path, index=False)
+        paths['national'][country] = path
+        paths['rows'][f"national_{country}"] = len(df)
+    if regions:
+        paths['regional'] = os.path.join(output_dir, REGIONAL_FILENAME)
+        df = generator.regional(regions)
+        df.to_csv(paths['regional'], index=False)
+        paths['rows']['regional'] = len(df)
+    if regions and provinces_per_region:
+        paths['provincial'] = os.path.join(output_dir, PROVINCIAL_FILENAME)
+        df = generator.provincial(regions, provinces_per_region)
+        df.to_csv(paths['provincial'], index=False)
+        paths['rows']['provincial'] = len(df)
+    logger.info(f"Dataset sintetico generato in {output_dir}: {paths['rows']}")
+    return paths
+
+
+def write_to_mongodb(paths):
+    """Importa in MongoDB i CSV generati usando le stesse funzioni di salvataggio dell'importazione"""
+    from db_manager import db_manager
+
+    if not db_manager.connect():
+        logger.error("Impossibile connettersi al database MongoDB.")
+        return None
+    results = {}
+    targets = [(f"national_{c}", p, db_manager.save_national_data) for c, p in paths['national'].items()]
+    if paths.get('regional'):
+        targets.append(('regional', paths['regional'], db_manager.save_regional_data))
+    if paths.get('provincial'):
+        targets.append(('provincial', paths['provincial'], db_manager.save_provincial_data))
+    for name, path, save in targets:
+        df = pd.read_csv(path)
+        df['data'] = pd.to_datetime(df['data'])
+        results[name] = save(df.to_dict('records'))
+        logger.info(f"{name}: {results[name].get('inserted', 0)} inseriti, {results[name].get('updated', 0)} aggiornati")
+    return results
+
+
+def parse_arguments(argv=None):
+    """Analizza gli argomenti dalla riga di comando"""
+    parser = argparse.ArgumentParser(description="Generatore di dataset sintetici con schema DPC")
+    parser.add_argument("--output-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synthetic_data'),
+                        help="Cartella dei CSV generati")
+    parser.add_argument("--countries", default="ITA", help="Paesi delle serie nazionali (es. 'ITA,FRA,ESP')")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Giorni di storico")
+    parser.add_argument("--start-date", default=DEFAULT_START_DATE, help="Prima data delle serie")
+    parser.add_argument("--regions", type=int, default=DEFAULT_REGIONS, help="Numero di regioni (0 = nessuna)")
+    parser.add_argument("--provinces-per-region", type=int, default=DEFAULT_PROVINCES_PER_REGION,
+                        help="Province per regione (0 = nessuna)")
+    parser.add_argument("--seasonality", type=float, default=DEFAULT_SEASONALITY, help="Ampiezza stagionalità annuale")
+    parser.add_argument("--weekly", type=float, default=DEFAULT_WEEKLY, help="Ampiezza effetto settimanale")
+    parser.add_argument("--noise", type=float, default=DEFAULT_NOISE, help="Rumore lognormale (deviazione standard)")
+    parser.add_argument("--missing", type=float, default=DEFAULT_MISSING, help="Frazione di valori mancanti (0-1)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed del generatore casuale")
+    parser.add_argument("--mongo", action="store_true", help="Importa i dati generati anche in MongoDB")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    countries = [c.strip().upper() for c in args.countries.split(',') if c.strip()]
+    paths = generate_dataset(args.output_dir, countries, args.days, args.regions, args.provinces_per_region,
+                             args.start_date, args.seasonality, args.weekly, args.noise, args.missing, args.seed)
+    if args.mongo and write_to_mongodb(paths) is None:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
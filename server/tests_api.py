@@ -1,6 +1,47 @@
-import unittest
+import os
+import sys
 import json
+import unittest
+import threading
+import time
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Il riscaldamento in background addestrerebbe modelli durante i test
+os.environ.setdefault('APOLLO_WARMUP', '0')
+
 from app import app
+from warmup import Warmup
+from metrics import Metrics
+import request_timing
+import pandas as pd
+from rollup_pipeline import compute_rollups, to_documents
+from update_bus import update_bus
+from buffered_writer import BufferedWriter
+from model_cache import ModelCache
+import forecast_batch
+from result_cache import ResultCache
+from models.fit_cache import FitCache, series_signature
+from db_manager import db_manager, COLLECTION_FEATURE_STORE
+
+@contextmanager
+def mongomock_db():
+    """db_manager collegato a mongomock per la durata del blocco (test saltato se mongomock non è installato)"""
+    try:
+        import mongomock
+    except ImportError:
+        raise unittest.SkipTest('mongomock non installato')
+    saved = (db_manager.client, db_manager.db, db_manager.is_connected, db_manager._data_versions)
+    db_manager._data_versions = {}
+    db_manager.use_client(mongomock.MongoClient())
+    try:
+        yield db_manager.db
+    finally:
+        db_manager.client, db_manager.db, db_manager.is_connected, db_manager._data_versions = saved
 
 class APITestCase(unittest.TestCase):
     def setUp(self):
@@ -16,12 +57,140 @@ class APITestCase(unittest.TestCase):
         self.assertIn('models', data)
 
     def test_feature_store(self):
-        resp = self.app.get('/api/features?area_type=national&area_name=ITA')
+        with mongomock_db() as db:
+            db[COLLECTION_FEATURE_STORE].insert_many([
+                {'area_type': 'national', 'area_name': 'ITA', 'data': datetime(2020, 3, 1) + timedelta(days=i),
+                 'features': {'nuovi_positivi_ma7': i}} for i in range(5)])
+            resp = self.app.get('/api/features?area_type=national&area_name=ITA')
+            self.assertEqual(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertTrue(data['success'])
+            self.assertEqual(len(data['features']), 5)
+            self.assertIsNone(data['next_cursor'])
+            # Senza limit le pagine JSON sono comunque limitate a FEATURES_MAX_LIMIT righe
+            with mock.patch('app.FEATURES_MAX_LIMIT', 3):
+                data = json.loads(self.app.get('/api/features?area_type=national&area_name=ITA').data)
+            self.assertEqual(len(data['features']), 3)
+            self.assertEqual(data['next_cursor'], '2020-03-03T00:00:00')
+            resp = self.app.get('/api/features?area_type=national&area_name=ITA&format=ndjson')
+            self.assertEqual(len(resp.data.decode().splitlines()), 5)
+
+    def test_feature_store_unavailable(self):
+        with mock.patch.object(db_manager, 'is_connected', False), \
+                mock.patch.object(db_manager, 'connect', return_value=False):
+            resp = self.app.get('/api/features?area_type=national&area_name=ITA')
+            self.assertEqual(resp.status_code, 503)
+            resp = self.app.get('/api/features?area_type=national&area_name=ITA&format=ndjson')
+            self.assertEqual(resp.status_code, 503)
+
+    def test_feature_store_invalid_params(self):
+        resp = self.app.get('/api/features?area_type=national&area_name=ITA&limit=0')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.app.get('/api/features?area_type=national&area_name=ITA&format=xml')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.app.get('/api/features?area_type=national&area_name=ITA&fields=nuovi_positivi;drop')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_historical_window_and_pagination(self):
+        url = '/api/data/historical?start=2020-03-01&end=2020-03-10&fields=nuovi_positivi&limit=6'
+        first = json.loads(self.app.get(url).data)
+        self.assertEqual(first['total'], 10)
+        self.assertEqual(first['data'][0], {'data': '2020-03-01', 'nuovi_positivi': 566})
+        second = json.loads(self.app.get(f"{url}&cursor={first['next_cursor']}").data)
+        self.assertIsNone(second['next_cursor'])
+        days = [row['data'] for row in first['data'] + second['data']]
+        self.assertEqual(days, [f'2020-03-{d:02d}' for d in range(1, 11)])
+        self.assertEqual(self.app.get('/api/data/historical?fields=nonesiste').status_code, 400)
+
+    def test_historical_max_points(self):
+        full = json.loads(self.app.get('/api/data/historical?start=2020-01-01&fields=nuovi_positivi').data)['data']
+        reduced = json.loads(self.app.get('/api/data/historical?start=2020-01-01&fields=nuovi_positivi'
+                                          '&max_points=100').data)['data']
+        self.assertEqual(len(reduced), 100)
+        self.assertEqual(reduced[0], full[0])
+        self.assertEqual(reduced[-1], full[-1])
+        # Il picco della serie resta visibile dopo la riduzione
+        peak = max(row['nuovi_positivi'] or 0 for row in full)
+        self.assertGreater(max(row['nuovi_positivi'] or 0 for row in reduced), 0.95 * peak)
+        self.assertEqual(self.app.get('/api/data/historical?max_points=1').status_code, 400)
+
+    def test_regional_snapshot(self):
+        resp = self.app.get('/api/data/regional/snapshot')
         self.assertEqual(resp.status_code, 200)
         data = json.loads(resp.data)
-        self.assertIn('success', data)
-        self.assertTrue(data['success'])
-        self.assertIn('features', data)
+        self.assertEqual(data['count'], len(data['data']))
+        self.assertTrue(data['data'])
+        self.assertEqual({row['data'] for row in data['data']}, {data['date']})
+        self.assertEqual(self.app.get('/api/data/regional/snapshot?date=31-12-2020').status_code, 400)
+
+    def test_regional_data_without_models(self):
+        with mock.patch('models.geo_prophet_model.GeoProphetModel.__init__',
+                        side_effect=AssertionError('nessun modello per la lettura dei dati')):
+            resp = self.app.get('/api/data/regional?region=Lombardia')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertTrue(data['data'])
+        self.assertLessEqual(len(data['data']), 30)
+        self.assertIn('nuovi_positivi_ma7', data['data'][-1])
+        self.assertIn('deceduti_giornalieri', data['data'][-1])
+        self.assertEqual(self.app.get('/api/data/regional?region=Atlantide').status_code, 404)
+
+    def test_area_since_is_applied_before_downsampling(self):
+        area_window = sys.modules['app']._area_window
+        days = [d.strftime('%Y-%m-%d') for d in pd.date_range('2021-01-01', periods=40)]
+        history = {'source': 'csv', 'version': 1,
+                   'data': [{'data': day, 'nuovi_positivi': i * (i % 7)} for i, day in enumerate(days)]}
+        # Il client ha i dati fino al 34° giorno: riceve tutti i giorni successivi, senza buchi
+        rows, full = area_window('regional', 'Test', history, datetime(2021, 2, 4), 10)
+        self.assertFalse(full)
+        self.assertEqual([row['data'] for row in rows], days[-5:])
+        rows, _ = area_window('regional', 'Test', history, datetime(2021, 1, 20), 5)
+        self.assertEqual(len(rows), 5)
+        self.assertTrue(all(row['data'] > '2021-01-20' for row in rows))
+        self.assertEqual(rows[-1]['data'], days[-1])
+
+    def test_since_returns_only_changes(self):
+        full = json.loads(self.app.get('/api/data/historical?start=2020-03-01&end=2020-03-10').data)
+        unchanged = self.app.get(f"/api/data/historical?start=2020-03-01&end=2020-03-10&since={full['version']}")
+        data = json.loads(unchanged.data)
+        self.assertEqual(data['data'], [])
+        self.assertFalse(data['full'])
+        self.assertLess(len(unchanged.data), 300)
+        data = json.loads(self.app.get('/api/data/historical?start=2020-03-01&end=2020-03-10&since=2020-03-07').data)
+        self.assertEqual([row['data'] for row in data['data']], ['2020-03-08', '2020-03-09', '2020-03-10'])
+        # Token non riconosciuto: il client deve sostituire i suoi dati
+        data = json.loads(self.app.get('/api/data/latest?since=sconosciuto').data)
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['data']), 30)
+        self.assertEqual(self.app.get('/api/data/latest?since=' + 'x' * 100).status_code, 400)
+
+    def test_forecast_batch_invalid_payload(self):
+        self.assertEqual(self.app.post('/api/forecast/batch', data='x').status_code, 400)
+        resp = self.app.post('/api/forecast/batch', json={'items': [{'area_type': 'regional'}]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('items[0]', json.loads(resp.data)['error'])
+        resp = self.app.post('/api/forecast/batch', json={'items': [{'area_type': 'national', 'days': 0}]})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.app.post('/api/forecast/batch', json={'items': [{'area_type': 'national'}], 'intervals': 'slow'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_dashboard_etag(self):
+        resp = self.app.get('/api/dashboard')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(set(data) - {'success', 'country'}, {'forecast', 'model_stats', 'mape'})
+        etag = resp.headers['ETag']
+        resp = self.app.get('/api/dashboard', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        resp = self.app.get('/api/dashboard', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(resp.headers['ETag'], etag)
+
+    def test_predict_prophet_invalid_intervals(self):
+        resp = self.app.get('/api/predict/prophet?indicator=nuovi_positivi&area_type=national&area_name=ITA&intervals=slow')
+        self.assertEqual(resp.status_code, 400)
+        data = json.loads(resp.data)
+        self.assertFalse(data['success'])
 
     def test_predict_prophet(self):
         resp = self.app.get('/api/predict/prophet?indicator=nuovi_positivi&area_type=national&area_name=ITA&days=5')
@@ -32,5 +201,300 @@ class APITestCase(unittest.TestCase):
         self.assertIn('prediction', data)
         self.assertEqual(len(data['prediction']), 5)
 
+class WarmupTestCase(unittest.TestCase):
+    def test_health_and_readiness_endpoints(self):
+        client = app.test_client()
+        self.assertEqual(client.get('/healthz').status_code, 200)
+        resp = client.get('/readyz')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(json.loads(resp.data)['ready'])
+
+    def test_readiness_follows_required_steps(self):
+        warmup = Warmup()
+        started, release = threading.Event(), threading.Event()
+
+        def dataset_step():
+            started.set()
+            return release.wait(5)
+
+        warmup.add_step('dataset', dataset_step, required=True)
+        warmup.add_step('models', lambda: 1 / 0)
+        warmup.start()
+        # Il passo viene avviato dal thread di riscaldamento: si attende che sia in esecuzione
+        self.assertTrue(started.wait(5))
+        status = warmup.status()
+        self.assertFalse(status['ready'])
+        self.assertEqual((status['state'], status['current'], status['total']), ('running', 'dataset', 2))
+        release.set()
+        # Il fallimento di un passo facoltativo non blocca la readiness
+        self.assertTrue(warmup.wait(5))
+        self.assertEqual([s['status'] for s in warmup.status()['steps']], ['done', 'failed'])
+
+        failing = Warmup()
+        failing.add_step('dataset', lambda: 1 / 0, required=True)
+        failing.start()
+        self.assertFalse(failing.wait(5))
+        self.assertEqual(failing.status()['state'], 'failed')
+
+    def test_restarts_in_forked_worker(self):
+        warmup = Warmup()
+        runs = []
+        warmup.add_step('dataset', lambda: runs.append(os.getpid()), required=True)
+        warmup.start()
+        self.assertTrue(warmup.wait(5))
+        # Come un worker gunicorn --preload: stato e thread ereditati da un altro processo
+        warmup._pid = -1
+        self.assertTrue(warmup.wait(5))
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(warmup.status()['state'], 'ready')
+
+
+class StartupImportsTestCase(unittest.TestCase):
+    def test_heavy_modules_not_imported_at_startup(self):
+        code = ("import sys, app; print([m for m in ('prophet', 'cmdstanpy', 'joblib', 'redis', 'requests') "
+                "if m in sys.modules])")
+        result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], '[]')
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_metrics_endpoint(self):
+        client = app.test_client()
+        client.get('/healthz')
+        resp = client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        body = resp.data.decode('utf-8')
+        self.assertIn('apollo_http_requests_total{method="GET",route="/healthz",status="200"}', body)
+        self.assertIn('apollo_http_request_duration_seconds_bucket{method="GET",route="/healthz",le="+Inf"}', body)
+
+    def test_snapshots_are_merged_across_processes(self):
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            # Istantanea di un worker già terminato: il contatore resta nel totale, il gauge no
+            dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                  capture_output=True, text=True)
+            dead_pid = int(dead.stdout)
+            with open(os.path.join(metrics_dir, f'metrics_{dead_pid}.json'), 'w') as f:
+                json.dump({'pid': dead_pid, 'time': 0, 'buckets': [1.0],
+                           'counters': [['jobs_total', [['kind', 'a']], 2]],
+                           'gauges': [['jobs_running', [], 5]],
+                           'histograms': [['job_seconds', [], [1, 0.5, 1]]]}, f)
+            registry = Metrics(metrics_dir=metrics_dir, buckets=(1.0,))
+            registry.inc('jobs_total', kind='a')
+            registry.gauge_add('jobs_running', 1)
+            registry.observe('job_seconds', 2.0)
+            body = registry.render()
+        self.assertIn('jobs_total{kind="a"} 3', body)
+        self.assertIn('jobs_running 1', body)
+        self.assertIn('job_seconds_bucket{le="1"} 1', body)
+        self.assertIn('job_seconds_bucket{le="+Inf"} 2', body)
+        self.assertIn('job_seconds_sum 2.5', body)
+        self.assertIn('job_seconds_count 2', body)
+
+
+class RequestTimingTestCase(unittest.TestCase):
+    def test_server_timing_header(self):
+        resp = app.test_client().get('/api/data/historical')
+        self.assertEqual(resp.status_code, 200)
+        header = resp.headers.get('Server-Timing', '')
+        self.assertIn('serialize;dur=', header)
+        self.assertIn('total;dur=', header)
+
+    def test_profile_on_request(self):
+        client = app.test_client()
+        secret = sys.modules['app'].ADMIN_SECRET or 'segreto-di-test'
+        with tempfile.TemporaryDirectory() as profile_dir, mock.patch('app.ADMIN_SECRET', secret):
+            previous = request_timing.profiler.profile_dir
+            request_timing.profiler.profile_dir = profile_dir
+            try:
+                resp = client.get('/healthz', headers={'X-Apollo-Profile': 'wrong'})
+                self.assertNotIn('X-Apollo-Profile-Id', resp.headers)
+                resp = client.get('/healthz', headers={'X-Apollo-Profile': secret})
+                profile_id = resp.headers.get('X-Apollo-Profile-Id')
+                self.assertTrue(profile_id)
+                self.assertEqual(client.get(f'/admin/profiles/{profile_id}').status_code, 403)
+                admin = {'X-Admin-Secret': secret}
+                listed = json.loads(client.get('/admin/profiles', headers=admin).data)
+                self.assertEqual([p['id'] for p in listed['profiles']], [profile_id])
+                report = client.get(f'/admin/profiles/{profile_id}?format=text', headers=admin)
+                self.assertEqual(report.status_code, 200)
+                self.assertIn(b'function calls', report.data)
+                for limit in ('abc', '0', '-5'):
+                    resp = client.get(f'/admin/profiles/{profile_id}?format=text&limit={limit}', headers=admin)
+                    self.assertEqual(resp.status_code, 400)
+                self.assertEqual(client.get('/admin/profiles/../app', headers=admin).status_code, 404)
+                # Il segreto non è accettato nella query string
+                self.assertEqual(client.get(f'/admin/profiles?secret={secret}').status_code, 403)
+            finally:
+                request_timing.profiler.profile_dir = previous
+
+
+    def test_admin_disabled_without_secret(self):
+        client = app.test_client()
+        with mock.patch('app.ADMIN_SECRET', None), \
+                mock.patch.object(request_timing.profiler, 'sample_rate', 1.0):
+            resp = client.get('/healthz', headers={'X-Apollo-Profile': 'qualsiasi'})
+            self.assertNotIn('X-Apollo-Profile-Id', resp.headers)
+            self.assertEqual(client.get('/admin/profiles', headers={'X-Admin-Secret': ''}).status_code, 403)
+            self.assertEqual(client.post('/admin/update_data', data={'secret': ''}).status_code, 403)
+
+
+class RollupTestCase(unittest.TestCase):
+    def test_weekly_rollups(self):
+        dates = pd.date_range('2020-03-02 17:00', periods=14)     # due settimane da lunedì
+        df = pd.DataFrame({'data': dates, 'denominazione_regione': 'Lazio',
+                           'nuovi_positivi': range(1, 15), 'deceduti': [i * 2 for i in range(14)]})
+        docs = to_documents(compute_rollups(df, 'regional', 'weekly'))
+        self.assertEqual([d['period_start'].strftime('%Y-%m-%d') for d in docs], ['2020-03-02', '2020-03-09'])
+        self.assertEqual(docs[1]['days'], 7)
+        self.assertEqual(docs[1]['stats']['nuovi_positivi'],
+                         {'sum': 77.0, 'mean': 11.0, 'min': 8, 'max': 14})
+        # Le cumulative vengono aggregate sull'incremento giornaliero
+        self.assertEqual(docs[1]['stats']['deceduti_giornalieri']['sum'], 14.0)
+        self.assertEqual(docs[1]['stats']['deceduti']['last'], 26)
+
+    def test_invalid_granularity(self):
+        resp = app.test_client().get('/api/data/regional?region=Lazio&granularity=yearly')
+        self.assertEqual(resp.status_code, 400)
+
+class BufferedWriterTestCase(unittest.TestCase):
+    def test_replay_skips_corrupt_spill_lines(self):
+        written = []
+        with tempfile.TemporaryDirectory() as spill_dir:
+            spill_path = os.path.join(spill_dir, 'spill.jsonl')
+            with open(spill_path, 'w', encoding='utf-8') as f:
+                f.write('{"n": 1}\n{"n": \n{"n": 2}\n')
+            writer = BufferedWriter(written.extend, name='test', spill_path=spill_path)
+            writer._replay_spill()
+            self.assertEqual(written, [{'n': 1}, {'n': 2}])
+            self.assertEqual(writer.stats()['corrupt'], 1)
+            self.assertEqual(os.listdir(spill_dir), [])
+            # Un file di replay illeggibile resta su disco per il tentativo successivo
+            replay_path = f"{spill_path}.{os.getpid()}.replay"
+            os.mkdir(replay_path)
+            writer._replay_spill()
+            self.assertTrue(os.path.exists(replay_path))
+            os.rmdir(replay_path)
+
+    def test_replay_keeps_unwritten_docs_and_claims_dead_worker_files(self):
+        written, fail_after = [], [1]
+
+        def write_batch(docs):
+            if fail_after[0] == 0:
+                raise ConnectionError('mongo non raggiungibile')
+            fail_after[0] -= 1
+            written.extend(docs)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            spill_path = os.path.join(spill_dir, 'spill.jsonl')
+            # File di replay lasciato da un worker terminato (pid inesistente)
+            with open(f"{spill_path}.999999999.replay", 'w', encoding='utf-8') as f:
+                f.write('{"n": 1}\n{"n": 2}\n{"n": 3}\n')
+            writer = BufferedWriter(write_batch, name='test', batch_size=1, spill_path=spill_path)
+            writer._replay_spill()
+            replay_path = f"{spill_path}.{os.getpid()}.replay"
+            self.assertEqual(written, [{'n': 1}])
+            self.assertEqual(os.listdir(spill_dir), [os.path.basename(replay_path)])
+            # Dopo l'errore il file contiene solo i documenti non ancora scritti
+            fail_after[0] = 10
+            writer._replay_not_before = 0
+            writer._replay_spill()
+            self.assertEqual(written, [{'n': 1}, {'n': 2}, {'n': 3}])
+            self.assertEqual(os.listdir(spill_dir), [])
+
+class ModelCacheTestCase(unittest.TestCase):
+    def test_failed_load_and_unreachable_registry_are_not_cached(self):
+        cache = ModelCache(loader=mock.Mock(side_effect=ValueError('file corrotto')))
+        with self.assertRaises(ValueError):
+            cache.load({'_id': 'x', 'file_path': '/nonesiste.joblib'})
+        self.assertEqual(cache._key_locks, {})
+        with mock.patch.object(db_manager, 'is_connected', False), \
+                mock.patch.object(db_manager, 'get_latest_model', return_value=None):
+            self.assertEqual(cache.get_latest('prophet_ITA_nuovi_positivi', 'national', 'ITA'), (None, None))
+        self.assertEqual(cache.stats()['pointers'], 0)
+
+class ForecastBatchTestCase(unittest.TestCase):
+    def test_items_are_routed_cache_fit_cache_pool(self):
+        class FakeModel:
+            def __init__(self, area_type, area_name, columns):
+                self.area_name = area_name
+                self.columns = ['nuovi_positivi']
+                self.train_df = None if area_name == 'Molise' else pd.DataFrame({'nuovi_positivi': [1]})
+
+            def is_fitted(self, col):
+                return self.area_name == 'Lazio'
+
+            def forecast(self, days, intervals):
+                return {'area': self.area_name}
+
+        items, _ = forecast_batch.parse_items({'items': [
+            {'area_name': 'Lombardia'}, {'area_name': 'Lazio'}, {'area_name': 'Veneto'}, {'area_name': 'Molise'}]})
+        cache = ResultCache(max_entries=16)
+        cache.put(('regional', 'Veneto', (), 30, 'fast', 'v1'), {'area': 'Veneto'})
+        worker = mock.Mock(side_effect=lambda area_type, area_name, *args: ({'area': area_name}, []))
+        with ThreadPoolExecutor(max_workers=1) as pool, \
+                mock.patch('models.geo_prophet_model.GeoProphetModel', FakeModel), \
+                mock.patch.object(forecast_batch, '_forecast_in_worker', worker), \
+                mock.patch.object(forecast_batch, '_get_pool', return_value=pool), \
+                mock.patch.object(forecast_batch, 'forecast_cache', cache), \
+                mock.patch.object(db_manager, 'get_data_version', return_value='v1'), \
+                mock.patch.object(update_bus, 'publish'):
+            results = list(forecast_batch.run_batch(items, 'fast'))
+            self.assertEqual([(r['index'], r['source'], r['success']) for r in results],
+                             [(2, 'cache', True), (3, 'none', False), (1, 'fit_cache', True), (0, 'pool', True)])
+            self.assertEqual([r.get('data') for r in results],
+                             [{'area': 'Veneto'}, None, {'area': 'Lazio'}, {'area': 'Lombardia'}])
+            self.assertEqual(worker.call_count, 1)
+            # Le previsioni calcolate vengono servite dalla cache alla richiesta successiva
+            results = list(forecast_batch.run_batch(items[:2], 'fast'))
+            self.assertEqual([r['source'] for r in results], ['cache', 'cache'])
+            self.assertEqual(worker.call_count, 1)
+
+    def test_compact_only_fit_is_refitted_for_prophet_model(self):
+        fit = mock.Mock(return_value='prophet')
+        cache = FitCache(fit=fit)
+        ds, y = pd.date_range('2020-03-01', periods=5).values, [1.0, 2.0, 3.0, 4.0, 5.0]
+        compact = mock.Mock()
+        cache.add(series_signature(ds, y), compact)
+        self.assertEqual(cache.get(ds, y), (None, compact))
+        fit.assert_not_called()
+        with mock.patch('models.fit_cache.CompactProphet.from_model', return_value=compact):
+            self.assertEqual(cache.get(ds, y, require_model=True), ('prophet', compact))
+        fit.assert_called_once()
+
+class UpdateStreamTestCase(unittest.TestCase):
+    def test_stream_delivers_new_versions_once(self):
+        client = app.test_client()
+        with mock.patch('app.UPDATES_STREAM_ENABLED', True):
+            self.assertEqual(client.get('/api/stream/updates?types=nessuno').status_code, 400)
+            resp = client.get('/api/stream/updates?types=forecast', buffered=False)
+        self.assertEqual(resp.mimetype, 'text/event-stream')
+        chunks = iter(resp.response)
+        self.assertIn('retry', next(chunks).decode())
+        self.assertIn('event: versions', next(chunks).decode())
+        update_bus.publish('model', model_name='prophet_TEST', area_type='national', area_name='TEST', version='1')
+        for _ in range(2):
+            update_bus.publish('forecast', area_type='regional', area_name='Atlantide', version='v1')
+        update_bus.publish('forecast', area_type='regional', area_name='Atlantide', version='v2')
+        first, second = next(chunks).decode(), next(chunks).decode()
+        resp.close()
+        self.assertIn('event: forecast', first)
+        self.assertEqual(json.loads(first.split('data: ')[1])['version'], 'v1')
+        self.assertEqual(json.loads(second.split('data: ')[1])['version'], 'v2')
+
+    def test_stream_is_bounded_and_disabled_by_default(self):
+        client = app.test_client()
+        self.assertEqual(client.get('/api/stream/updates').status_code, 503)
+        self.assertIn(b'data-updates-stream="off"', client.get('/').data)
+        with mock.patch('app.UPDATES_STREAM_ENABLED', True), mock.patch('app.UPDATES_STREAM_SECONDS', 0.2):
+            resp = client.get('/api/stream/updates', buffered=False)
+            started = time.monotonic()
+            chunks = [chunk.decode() for chunk in resp.response]
+        # Lo stream termina da solo dopo UPDATES_STREAM_SECONDS (il client si riconnette con retry)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertIn('retry', chunks[0])
+        self.assertIn('event: versions', chunks[1])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
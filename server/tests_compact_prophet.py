@@ -0,0 +1,73 @@
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+from models.compact_prophet import CompactProphet
+from models.fit_cache import fit_cache
+from models.prophet_model import ProphetModel
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'dpc-covid19-ita-andamento-nazionale.csv')
+
+
+class CompactProphetTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        df = pd.read_csv(DATA_PATH)
+        df['data'] = pd.to_datetime(df['data'])
+        df = df.sort_values('data').iloc[:300]
+        cls.model = Prophet(weekly_seasonality=True, yearly_seasonality=True, daily_seasonality=False)
+        cls.model.fit(pd.DataFrame({'ds': df['data'], 'y': df['nuovi_positivi']}))
+        cls.compact = CompactProphet.from_model(cls.model)
+        cls.future = pd.date_range(df['data'].max() + pd.Timedelta(days=1), periods=30)
+
+    def test_matches_prophet_predict(self):
+        expected = self.model.predict(pd.DataFrame({'ds': self.future}))
+        result = self.compact.predict(self.future)
+        for column in ('yhat', 'trend', 'weekly', 'yearly', 'additive_terms'):
+            np.testing.assert_allclose(result[column], expected[column].values, rtol=1e-7, atol=1e-6)
+        # Bande analitiche: stessa ampiezza media dei campioni Prophet entro il 25%
+        width = (result['yhat_upper'] - result['yhat_lower']).mean()
+        expected_width = (expected['yhat_upper'] - expected['yhat_lower']).mean()
+        self.assertAlmostEqual(width / expected_width, 1.0, delta=0.25)
+
+    def test_interval_modes(self):
+        self.assertNotIn('yhat_lower', self.compact.predict(self.future, intervals='none'))
+        full = self.compact.predict(self.future, intervals='full')
+        self.assertTrue(np.all(full['yhat_lower'] < full['yhat']))
+        self.assertTrue(np.all(full['yhat_upper'] > full['yhat']))
+        # Stesso orizzonte e stesso modello: le bande campionate vengono riutilizzate
+        again = self.compact.predict(self.future, intervals='full')
+        np.testing.assert_array_equal(full['yhat_lower'], again['yhat_lower'])
+        with self.assertRaises(ValueError):
+            self.compact.predict(self.future, intervals='slow')
+
+    def test_json_round_trip(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests_compact_prophet.json')
+        try:
+            self.compact.save(path)
+            loaded = CompactProphet.load(path)
+        finally:
+            os.remove(path)
+        np.testing.assert_allclose(loaded.predict(self.future)['yhat'], self.compact.predict(self.future)['yhat'])
+
+
+class LazyFitTestCase(unittest.TestCase):
+    def test_mape_fits_only_requested_indicator(self):
+        fit_cache.clear()
+        misses = fit_cache.stats()['misses']
+        model = ProphetModel(DATA_PATH, train_days=120)
+        self.assertEqual(model.models, {})
+        self.assertIsNotNone(model.get_mape(indicator='deceduti', days=7))
+        self.assertEqual(list(model.models), ['deceduti'])
+        self.assertEqual(fit_cache.stats()['misses'], misses + 1)
+        # Un secondo modello sugli stessi dati riusa il fit in cache
+        ProphetModel(DATA_PATH, train_days=120).get_mape(indicator='deceduti', days=7)
+        self.assertEqual(fit_cache.stats()['misses'], misses + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
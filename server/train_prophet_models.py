@@ -21,12 +21,16 @@ for country in COUNTRIES:
         continue
     model = ProphetModel(processor.national_file, columns=VALID_INDICATORS, train_days=TRAIN_DAYS)
     # Salva ogni modello per ogni indicatore
-    for indicator, prophet_model in model.models.items():
+    for indicator in model.columns:
+        prophet_model = model.get_model(indicator)
         if prophet_model is not None:
             filename = f'prophet_{country}_{indicator}.joblib'
             filepath = os.path.join(MODEL_DIR, filename)
             joblib.dump(prophet_model, filepath)
             print(f'  [OK] Salvato modello {indicator} in {filepath}')
+            # Rappresentazione compatta per la previsione senza prophet
+            compact_path = os.path.join(MODEL_DIR, f'prophet_{country}_{indicator}.compact.json')
+            model.get_compact_model(indicator).save(compact_path)
             # Calcola MAPE come metrica
             mape = model.get_mape(indicator=indicator, days=7)
             # Registra nel model registry
@@ -37,7 +41,8 @@ for country in COUNTRIES:
                 version='latest',  # puoi usare una stringa con data/ora se vuoi versionare
                 file_path=filepath,
                 metrics={"MAPE": mape},
-                note="Training automatico Prophet"
+                note="Training automatico Prophet",
+                compact_path=compact_path
             )
         else:
             print(f'  [FAIL] Modello non addestrato per {indicator}')
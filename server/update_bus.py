@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Notifiche degli aggiornamenti per lo stream SSE /api/stream/updates.
+
+Gli eventi sono dizionari {'type', ...} con i token di versione usati dalle API (es. 'version'
+di since=), così i client richiedono solo ciò che è cambiato:
+- 'dataset': importazione conclusa o nuova versione dei dati (data_type, version)
+- 'model': modello registrato nel model registry (model_name, area_type, area_name, version)
+- 'forecast': previsione ricalcolata per una nuova versione dei dati (area_type, area_name, version)
+
+publish() consegna gli eventi ai sottoscrittori del processo. Con REDIS_HOST gli eventi passano
+dal canale Redis UPDATES_CHANNEL: arrivano a tutti i worker gunicorn e anche dagli script
+eseguiti in altri processi (update_data_from_web.py, train_prophet_models.py).
+Un thread controlla inoltre ogni UPDATES_POLL_SECONDS le versioni registrate con watch(): le
+importazioni eseguite altrove vengono notificate anche senza Redis. Ogni versione di un dato o
+di una previsione viene consegnata una sola volta per processo.
+
+Variabili d'ambiente:
+- REDIS_HOST, REDIS_PORT: server Redis per il pub/sub (default: nessuno, solo in-process)
+- UPDATES_CHANNEL: canale Redis degli eventi (default: apollo:updates)
+- UPDATES_POLL_SECONDS: intervallo del controllo delle versioni (default: 30)
+- UPDATES_QUEUE_SIZE: eventi in attesa per sottoscrittore, oltre si scartano i più vecchi (default: 100)
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+
+from metrics import metrics
+
+logger = logging.getLogger('apollo-updates')
+
+REDIS_HOST = os.environ.get('REDIS_HOST')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+UPDATES_CHANNEL = os.environ.get('UPDATES_CHANNEL', 'apollo:updates')
+UPDATES_POLL_SECONDS = float(os.environ.get('UPDATES_POLL_SECONDS', 30))
+UPDATES_QUEUE_SIZE = int(os.environ.get('UPDATES_QUEUE_SIZE', 100))
+
+# Campi che identificano l'oggetto di un evento: la stessa versione viene consegnata una volta sola
+DEDUPE_FIELDS = {
+    'dataset': ('data_type',),
+    'forecast': ('area_type', 'area_name')
+}
+
+
+class UpdateBus:
+    """Pub/sub degli aggiornamenti: in-process, oppure tramite Redis se configurato"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        # (tipo, campi identificativi) -> ultima versione consegnata
+        self._versions = {}
+        self._watched = {}
+        self._redis = None
+        self._redis_checked = False
+        self._threads_started = False
+
+    # ------------------------------------------------------------- pubblicazione
+
+    def publish(self, event_type, **fields):
+        """Pubblica un evento (tramite Redis se disponibile, altrimenti direttamente nel processo)"""
+        event = dict(fields, type=event_type, time=datetime.now().isoformat(timespec='seconds'))
+        client = self._redis_client()
+        if client is not None:
+            try:
+                client.publish(UPDATES_CHANNEL, json.dumps(event, default=str))
+                return
+            except Exception as e:
+                logger.warning(f"Pubblicazione su Redis non riuscita, consegna solo locale: {e}")
+        self._deliver(event)
+
+    def _deliver(self, event):
+        """Consegna un evento ai sottoscrittori del processo (se la sua versione è nuova)"""
+        fields = DEDUPE_FIELDS.get(event.get('type'))
+        with self._lock:
+            if fields is not None:
+                key = (event['type'],) + tuple(event.get(f) for f in fields)
+                if self._versions.get(key) == event.get('version'):
+                    return
+                self._versions[key] = event.get('version')
+            event = dict(event, id=self._next_id)
+            self._next_id += 1
+            subscribers = list(self._subscribers)
+        metrics.inc('apollo_update_events_total', type=event['type'])
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Client lento: si scarta l'evento più vecchio in attesa
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(event)
+
+    # ------------------------------------------------------------- sottoscrizione
+
+    def subscribe(self):
+        """Nuova coda di eventi per un client; avvia al primo uso l'ascolto Redis e il controllo delle versioni"""
+        self._start_threads()
+        q = queue.Queue(maxsize=UPDATES_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def versions(self):
+        """Ultima versione nota di ogni dataset (inviata ai client alla connessione)"""
+        with self._lock:
+            return {key[1]: version for key, version in self._versions.items() if key[0] == 'dataset'}
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'redis': int(self._redis is not None)}
+
+    # ------------------------------------------------------------- controllo delle versioni
+
+    def watch(self, data_type, func):
+        """Registra una funzione che restituisce la versione corrente di un dataset (None = non disponibile)"""
+        with self._lock:
+            self._watched[data_type] = func
+
+    def poll(self, announce=True):
+        """Legge le versioni registrate e pubblica quelle cambiate (announce=False: solo la versione iniziale)"""
+        with self._lock:
+            watched = list(self._watched.items())
+        for data_type, func in watched:
+            try:
+                version = func()
+            except Exception as e:
+                logger.debug(f"Versione di {data_type} non disponibile: {e}")
+                continue
+            if version is None:
+                continue
+            key = ('dataset', data_type)
+            if not announce:
+                with self._lock:
+                    self._versions.setdefault(key, version)
+            elif self._versions.get(key) != version:
+                self.publish('dataset', data_type=data_type, version=version)
+
+    def _poll_loop(self):
+        self.poll(announce=False)
+        while True:
+            time.sleep(UPDATES_POLL_SECONDS)
+            self.poll()
+
+    # ------------------------------------------------------------- Redis
+
+    def _redis_client(self):
+        """Client Redis condiviso con db_manager (None se REDIS_HOST non è impostato o Redis non risponde)"""
+        if not self._redis_checked:
+            self._redis_checked = True
+            if REDIS_HOST:
+                from db_manager import db_manager
+                if db_manager.redis_client is not None or db_manager.connect_redis(REDIS_HOST, REDIS_PORT):
+                    self._redis = db_manager.redis_client
+        return self._redis
+
+    def _listen_loop(self, client):
+        """Riceve gli eventi dal canale Redis e li consegna nel processo (si riconnette dopo un errore)"""
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(UPDATES_CHANNEL)
+                for message in pubsub.listen():
+                    try:
+                        self._deliver(json.loads(message['data']))
+                    except (TypeError, ValueError) as e:
+                        logger.warning(f"Evento non valido sul canale {UPDATES_CHANNEL}: {e}")
+            except Exception as e:
+                logger.error(f"Ascolto del canale Redis {UPDATES_CHANNEL} interrotto: {e}")
+                time.sleep(5)
+
+    def _start_threads(self):
+        with self._lock:
+            if self._threads_started:
+                return
+            self._threads_started = True
+        client = self._redis_client()
+        if client is not None:
+            threading.Thread(target=self._listen_loop, args=(client,), name='apollo-updates-redis',
+                             daemon=True).start()
+            logger.info(f"Notifiche degli aggiornamenti tramite Redis ({REDIS_HOST}:{REDIS_PORT}, {UPDATES_CHANNEL})")
+        threading.Thread(target=self._poll_loop, name='apollo-updates-poll', daemon=True).start()
+
+
+# Istanza condivisa dal processo
+update_bus = UpdateBus()
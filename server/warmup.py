@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Riscaldamento dei worker di Apollo Project.
+
+All'avvio di ogni worker (anche sotto gunicorn, dove il blocco __main__ di app.py non viene
+eseguito) un thread in background esegue in ordine i passi registrati: caricamento dei
+dataset, deserializzazione dei modelli del registry, fit delle aree più richieste. Lo stato
+viene esposto da /readyz, così il bilanciatore manda traffico solo ai worker pronti, mentre
+/healthz indica soltanto che il processo risponde.
+
+Se l'app viene importata prima del fork (gunicorn --preload) il thread parte nel master e non
+esiste nei worker: ogni worker lo riavvia, con i passi da capo, al primo controllo dello stato.
+
+Variabili d'ambiente:
+- APOLLO_WARMUP: '0' disattiva il thread di riscaldamento (il worker è subito pronto)
+- WARMUP_COUNTRIES: paesi da precaricare e addestrare (default: 'ITA,FRA')
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger('apollo-warmup')
+
+WARMUP_ENABLED = os.environ.get('APOLLO_WARMUP', '1') != '0'
+WARMUP_COUNTRIES = [c.strip().upper() for c in os.environ.get('WARMUP_COUNTRIES', 'ITA,FRA').split(',') if c.strip()]
+
+
+class Warmup:
+    """Passi di riscaldamento eseguiti in sequenza in un thread in background"""
+
+    def __init__(self):
+        self._steps = []                # (nome, funzione, obbligatorio)
+        self._status = {}               # nome -> dict di stato
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.started_at = None
+        self.finished_at = None
+
+    def add_step(self, name, func, required=False):
+        """
+        Registra un passo di riscaldamento.
+
+        Args:
+            name: Nome mostrato da /readyz (es. 'dataset:ITA')
+            func: Funzione senza argomenti; un valore restituito diverso da None finisce nel dettaglio
+            required: Se True, un fallimento lascia il worker non pronto
+        """
+        with self._lock:
+            self._steps.append((name, func, required))
+            self._status[name] = {'name': name, 'status': 'pending', 'required': required}
+
+    def start(self):
+        """Avvia il thread di riscaldamento (una sola volta per processo)"""
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return self._thread
+            # Primo avvio, oppure processo figlio di un fork: lo stato ereditato non vale qui
+            self._pid = os.getpid()
+            self.started_at = time.time()
+            self.finished_at = None
+            for name, _, required in self._steps:
+                self._status[name] = {'name': name, 'status': 'pending', 'required': required}
+            self._thread = threading.Thread(target=self.run, name='apollo-warmup', daemon=True)
+            thread = self._thread
+        thread.start()
+        return thread
+
+    def _restart_after_fork(self):
+        """Riavvia il riscaldamento in un worker creato con fork dopo l'avvio nel processo padre"""
+        if self._thread is not None and self._pid != os.getpid():
+            self.start()
+
+    def run(self):
+        """Esegue i passi in ordine; l'errore di un passo non interrompe i successivi"""
+        if self.started_at is None:
+            self.started_at = time.time()
+        for name, func, required in list(self._steps):
+            self._update(name, status='running')
+            start = time.perf_counter()
+            try:
+                detail = func()
+                self._update(name, status='done', detail=detail)
+            except Exception as e:
+                logger.error(f"Riscaldamento: passo {name} fallito: {e}")
+                self._update(name, status='failed', error=str(e))
+            self._update(name, duration_ms=round((time.perf_counter() - start) * 1000, 1))
+        self.finished_at = time.time()
+        status = self.status()
+        logger.info(f"Riscaldamento completato in {status['elapsed_s']} s "
+                    f"({status['completed']}/{status['total']} passi, pronto: {status['ready']})")
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self._status[name].update(fields)
+
+    def wait(self, timeout=None):
+        """Attende la fine del riscaldamento; restituisce True se il worker è pronto"""
+        self._restart_after_fork()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    @property
+    def ready(self):
+        """Pronto: riscaldamento terminato (o mai avviato) senza errori nei passi obbligatori"""
+        self._restart_after_fork()
+        with self._lock:
+            if self._thread is None:
+                return True
+            if self.finished_at is None:
+                return False
+            return not any(s['required'] and s['status'] == 'failed' for s in self._status.values())
+
+    def status(self):
+        """Stato per /readyz: avanzamento, passo corrente e dettaglio di ogni passo"""
+        ready = self.ready
+        with self._lock:
+            steps = [dict(self._status[name]) for name, _, _ in self._steps]
+            if self._thread is None:
+                state = 'disabled'
+            elif self.finished_at is None:
+                state = 'running'
+            else:
+                state = 'ready' if ready else 'failed'
+            end = self.finished_at or time.time()
+        return {
+            'ready': ready,
+            'state': state,
+            'completed': sum(1 for s in steps if s['status'] in ('done', 'failed')),
+            'total': len(steps),
+            'current': next((s['name'] for s in steps if s['status'] == 'running'), None),
+            'elapsed_s': round(end - self.started_at, 2) if self.started_at else None,
+            'steps': steps
+        }
+
+
+def warm_registered_models(max_models=None):
+    """Deserializza in model_cache l'ultima versione di ogni modello del registry"""
+    from db_manager import db_manager
+    from model_cache import model_cache
+
+    if not db_manager.is_connected:
+        return 'database non disponibile'
+    max_models = max_models or model_cache.max_entries
+    seen = set()
+    for doc in db_manager.list_models():
+        key = (doc.get('model_name'), doc.get('area_type'), doc.get('area_name'))
+        if key in seen:
+            continue
+        seen.add(key)
+        if len(seen) > max_models:
+            break
+        model_cache.get_model(*key)
+    return {'models': min(len(seen), max_models), 'cache': model_cache.stats()}
+
+
+# Istanza del processo
+warmup = Warmup()
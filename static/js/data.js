@@ -12,6 +12,17 @@ class DataHandler {
         this.forecastAPI = '/api/data/forecast';
         this.globeDataAPI = '/api/data/globe';
         this.modelStatsAPI = '/api/stats/model';
+        // Dati della pagina principale in una sola richiesta (previsioni, statistiche, MAPE...)
+        this.dashboardAPI = '/api/dashboard';
+        this.dashboard = null;
+        // Notifiche SSE di nuovi dati e previsioni ricalcolate, se attive sul server
+        // (data-updates-stream del body); altrimenti polling della dashboard (ETag)
+        this.updatesAPI = '/api/stream/updates?types=dataset,forecast';
+        this.updatesSource = null;
+        this.updatesStreamEnabled = document.body.dataset.updatesStream === 'on';
+        this.updatesPollInterval = 5 * 60 * 1000;
+        this.updatesPollTimer = null;
+        this.dashboardEtag = null;
         
         // Nuove API per dati geografici
         this.regionalDataAPI = '/api/data/regional';
@@ -149,10 +160,82 @@ class DataHandler {
         return simulatedData;
     }
     
+    /**
+     * Carica in una sola richiesta i dati della pagina principale; le parti disponibili
+     * vengono poi usate da loadForecastData e loadModelStats senza altre richieste
+     */
+    async loadDashboard() {
+        try {
+            // no-cache: il browser rivalida con If-None-Match (304 se invariata)
+            const response = await fetch(this.dashboardAPI, {cache: 'no-cache'});
+            if (!response.ok) {
+                throw new Error(`Errore HTTP: ${response.status}`);
+            }
+            this.dashboardEtag = response.headers.get('ETag');
+            this.dashboard = await response.json();
+        } catch (error) {
+            console.warn('Dashboard non disponibile, caricamento dei singoli endpoint:', error);
+            this.dashboard = null;
+        }
+        return this.dashboard;
+    }
+    
+    /**
+     * Segue gli aggiornamenti dei dati: onUpdate(evento) viene chiamata quando un'importazione
+     * o una previsione cambia la versione dei dati. Usa lo stream SSE solo se il server lo
+     * dichiara attivo, altrimenti (o se lo stream viene rifiutato) il polling della dashboard,
+     * che chiama onUpdate({type: 'dashboard'}) con la dashboard già ricaricata.
+     */
+    subscribeUpdates(onUpdate) {
+        if (this.updatesSource || this.updatesPollTimer) {
+            return;
+        }
+        if (!this.updatesStreamEnabled || !window.EventSource) {
+            this.pollUpdates(onUpdate);
+            return;
+        }
+        this.updatesSource = new EventSource(this.updatesAPI);
+        const handler = (message) => {
+            try {
+                onUpdate(JSON.parse(message.data));
+            } catch (error) {
+                console.warn('Evento di aggiornamento non valido:', error);
+            }
+        };
+        this.updatesSource.addEventListener('dataset', handler);
+        this.updatesSource.addEventListener('forecast', handler);
+        // La chiusura periodica dello stream viene gestita da EventSource (retry); una risposta
+        // di errore (es. 503) chiude definitivamente la connessione: si passa al polling
+        this.updatesSource.addEventListener('error', () => {
+            if (this.updatesSource && this.updatesSource.readyState === EventSource.CLOSED) {
+                this.updatesSource = null;
+                this.pollUpdates(onUpdate);
+            }
+        });
+    }
+    
+    /**
+     * Ricarica periodicamente la dashboard e chiama onUpdate solo se l'ETag è cambiato
+     */
+    pollUpdates(onUpdate) {
+        this.updatesPollTimer = setInterval(async () => {
+            const previous = this.dashboardEtag;
+            await this.loadDashboard();
+            if (this.dashboardEtag && this.dashboardEtag !== previous) {
+                onUpdate({type: 'dashboard', version: this.dashboardEtag});
+            }
+        }, this.updatesPollInterval);
+    }
+    
     /**
      * Carica i dati di previsione generati dal modello Prophet
      */
     async loadForecastData() {
+        const part = this.dashboard && this.dashboard.forecast;
+        if (part && part.success && Array.isArray(part.data)) {
+            this.forecastData = part.data;
+            return this.forecastData;
+        }
         try {
             console.log('Caricamento dati previsione...');
             const response = await fetch('/api/data/forecast');
@@ -399,6 +482,11 @@ class DataHandler {
      * Carica le statistiche del modello predittivo
      */
     async loadModelStats() {
+        const part = this.dashboard && this.dashboard.model_stats;
+        if (part && part.success) {
+            this.modelStats = part.data || {};
+            return this.modelStats;
+        }
         try {
             console.log('Caricamento statistiche del modello...');
             const response = await fetch(this.modelStatsAPI);
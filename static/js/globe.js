@@ -578,9 +578,10 @@ class Globe {
         if (level === 'national') {
             url = '/api/data/national';
         } else if (level === 'regional') {
-            url = `/api/data/regional/${countryCode}`;
+            // Una sola richiesta per tutte le regioni dell'ultimo giorno disponibile
+            url = '/api/data/regional/snapshot';
         } else if (level === 'provincial') {
-            url = `/api/data/provincial/${regionCode}`;
+            url = `/api/data/provincial/snapshot?region=${encodeURIComponent(regionCode)}`;
         }
         
         // Esegue la richiesta per ottenere i dati
@@ -592,6 +593,17 @@ class Globe {
                 return response.json();
             })
             .then(data => {
+                // Le istantanee DPC vengono convertite nel formato dei punti del globo
+                if (level !== 'national' && data && Array.isArray(data.data)) {
+                    data = data.data.map(row => ({
+                        region: row.denominazione_regione,
+                        province: row.denominazione_provincia,
+                        lat: row.lat,
+                        long: row.long,
+                        cases: row.nuovi_positivi ?? 0,
+                        totalCases: row.totale_casi ?? 0
+                    }));
+                }
                 // Aggiorna la cache e mostra i dati
                 if (level === 'national') {
                     this.dataCache.national = data;
@@ -148,6 +148,9 @@ document.addEventListener('DOMContentLoaded', async function() {
             })
             .catch(err => console.error('Errore caricamento dati storici:', err));
         
+        // Previsioni, statistiche del modello e MAPE in una sola richiesta
+        await dataHandler.loadDashboard();
+        
         // Carica i dati previsionali
         await dataHandler.loadForecastData()
             .then(() => {
@@ -186,6 +189,18 @@ document.addEventListener('DOMContentLoaded', async function() {
         // Aggiorna dashboard
         updateDashboard({updateChart: true});
         
+        // Ricarica la dashboard (304 se invariata) quando il server notifica nuovi dati o previsioni
+        // (stream SSE se attivo sul server, altrimenti polling)
+        dataHandler.subscribeUpdates(async (event) => {
+            console.log('Aggiornamento dal server:', event.type, event.version);
+            // Con il polling la dashboard è già stata ricaricata
+            if (event.type !== 'dashboard') {
+                await dataHandler.loadDashboard();
+            }
+            await dataHandler.loadForecastData();
+            updateDashboard({updateChart: true});
+        });
+        
         // Crea globo 3D
         setTimeout(() => {
             try {
@@ -461,8 +476,12 @@ function updateDashboardMapeMetric() {
     const indicatorSelect = document.getElementById('data-indicator');
     let indicator = 'nuovi_positivi';
     if (indicatorSelect && indicatorSelect.value) indicator = indicatorSelect.value;
-    fetch('/api/model/mape?indicator=' + encodeURIComponent(indicator))
-        .then(r => r.json())
+    // La dashboard contiene già la MAPE dell'indicatore predefinito
+    const bootstrap = dataHandler && dataHandler.dashboard && dataHandler.dashboard.mape;
+    const mapeRequest = (bootstrap && bootstrap.success && indicator === 'nuovi_positivi')
+        ? Promise.resolve(bootstrap)
+        : fetch('/api/model/mape?indicator=' + encodeURIComponent(indicator)).then(r => r.json());
+    mapeRequest
         .then(res => {
             const el = document.getElementById('model-accuracy');
             console.log('[MAPE DEBUG] Risposta API:', res, 'Indicatore:', indicator);
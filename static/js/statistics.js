@@ -580,8 +580,14 @@ async function fetchStatisticsData() {
         const startDate = document.getElementById('start-date').value;
         const endDate = document.getElementById('end-date').value;
         
-        // Cambiato l'endpoint API per usare il nostro nuovo endpoint data/historical
-        const response = await fetch('/api/data/historical');
+        // Intervallo e colonne vengono filtrati lato server. Niente max_points: media mobile
+        // a 7 giorni e Rt vengono calcolati qui e richiedono la serie giornaliera completa
+        const params = new URLSearchParams({
+            start: startDate,
+            end: endDate,
+            fields: 'nuovi_positivi,totale_positivi,totale_casi,deceduti,dimessi_guariti,ricoverati_con_sintomi,terapia_intensiva'
+        });
+        const response = await fetch(`/api/data/historical?${params}`);
         if (!response.ok) {
             throw new Error(`Errore HTTP: ${response.status}`);
         }
@@ -601,12 +607,8 @@ async function fetchStatisticsData() {
             return generateSimulatedStatisticsData();
         }
         
-        // Filtra i dati in base all'intervallo di date selezionato
-        const filteredData = jsonData.data.filter(item => {
-            if (!item || !item.data) return false;
-            const itemDate = new Date(item.data);
-            return itemDate >= new Date(startDate) && itemDate <= new Date(endDate);
-        });
+        // I dati arrivano già limitati all'intervallo di date selezionato
+        const filteredData = jsonData.data.filter(item => item && item.data);
         console.log('[fetchStatisticsData] Dati filtrati:', filteredData.length);
         
         // Se non ci sono dati dopo il filtraggio, genera dati simulati